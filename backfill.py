@@ -0,0 +1,251 @@
+import argparse
+import datetime
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import discovery
+import fetcher
+import line_scraper
+import metrics
+import raw_archive
+import response_cache
+import scraper
+import stat_plans
+import summary_stream
+from checkpoint import Checkpoint
+from sinks import CsvSink, ListSink, ParquetSink, season_for_date
+
+# (month, day) windows of each league's season, months before July fall in the calendar year after the start
+SEASON_WINDOWS = {"NCAAB": ((11, 1), (4, 10)),
+                  "NBA": ((10, 15), (6, 30))}  # Mid-October skips most of the NBA preseason
+# Counters of a fetch that failed, a date whose unit raised any of them is left incomplete to be scraped again
+FAILURE_COUNTERS = ("scoreboard_connection_errors", "scoreboard_decode_errors", "summary_connection_errors",
+                    "page_connection_errors")
+
+
+# Every calendar date of a league's season starting in start_year, leap years come from the stdlib
+def season_dates(league, start_year, first=None, last=None):
+    start_month, start_day = first or SEASON_WINDOWS[league][0]
+    end_month, end_day = last or SEASON_WINDOWS[league][1]
+    date = datetime.date(start_year if start_month >= 7 else start_year + 1, start_month, start_day)
+    end = datetime.date(start_year if end_month >= 7 else start_year + 1, end_month, end_day)
+    dates = []
+    while date <= end:
+        dates.append(date)
+        date += datetime.timedelta(days=1)
+    return dates
+
+
+# "2011-2017" or "2017", start years of the seasons to backfill
+def parse_season_range(text):
+    if "-" in text:
+        first, last = text.split("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(text)]
+
+
+def _month_day(text):
+    month, day = text.split("-")
+    return int(month), int(day)
+
+
+# Path of a season's csv, only built here so readers such as merge.py never create directories
+def season_output_path(output_dir, league, source, start_year):
+    season = "%s%s" % (str(start_year)[-2:], str(start_year + 1)[-2:])
+    directory = os.path.join(output_dir, league, source, "season=%s" % season)
+    if source == "ESPN":
+        league_string = "NBA" if league == "NBA" else "NCAABB"
+        return os.path.join(directory, "%s%s_ESPN.csv" % (league_string, season))
+    return os.path.join(directory, "GameSpreads%s.csv" % season)
+
+
+# Each worker process gets an equal share of the global request budget and its own pooled sessions
+#  A forked worker starts with a copy of the parent's counters, dropped so run_unit only hands back its own
+def _init_worker(requests_per_second, cache_dir, replay, dead_letter_path, archive_dir=None, stream_summaries=False):
+    metrics.reset()
+    fetcher.configure(requests_per_second=requests_per_second, dead_letter_path=dead_letter_path)
+    summary_stream.set_streaming(stream_summaries)
+    if cache_dir is not None:
+        response_cache.configure(cache_dir, replay=replay)
+    if archive_dir is not None:
+        raw_archive.configure(archive_dir)  # Each worker appends to its own part files
+
+
+# One unit of work is one (source, league, date), returns the date's rows in output order and the worker's
+#  metrics collected while producing them. ESPN units carry the date's game urls from the season's discovery, or
+#  None when discovery could not read the date's scoreboard and the worker has to ask for it again
+def run_unit(unit):
+    source, league, date, threads, game_urls = unit
+    if source == "ESPN":
+        rows = scraper.get_game_rows_for_date(date.day, date.month, date.year, nba=league == "NBA",
+                                              max_workers=threads, game_urls=game_urls)
+        return rows, metrics.drain()
+    sink = ListSink()
+    line_scraper.get_date_lines(date.day, date.month, date.year, None, set(), ncaab=league == "NCAAB", sink=sink)
+    return sink.rows, metrics.drain()
+
+
+# SBR rows are fetched out of order so the away back-to-back flag is filled in here from the previous day's teams
+def _set_b2b(rows, header, prev_teams):
+    columns = header.strip().split(",")
+    away_index, home_index = columns.index("Away-Name"), columns.index("Home-Name")
+    fixed_rows, todays_teams = [], set()
+    for row in rows:
+        fields = row.rstrip("\n").split(",")
+        fields[-1] = str(int(fields[away_index] in prev_teams))
+        todays_teams.update((fields[away_index], fields[home_index]))
+        fixed_rows.append(",".join(fields) + "\n")
+    return fixed_rows, todays_teams
+
+
+def _unit_failed(unit_metrics):
+    return any(unit_metrics["counters"].get(name) for name in FAILURE_COUNTERS)
+
+
+# ESPN rows of games the checkpoint has not indexed yet and their GameIDs, a game repeated within rows is kept once
+def _new_games(rows, checkpoint):
+    new_rows, game_ids = [], []
+    for row in rows:
+        game_id = row.split(",", 1)[0]
+        if not checkpoint.has_game(game_id) and game_id not in game_ids:
+            new_rows.append(row)
+            game_ids.append(game_id)
+    return new_rows, game_ids
+
+
+# Dates whose fetches failed are not checkpointed, so the next run scrapes them again. retry_failed scrapes only
+#  the dates of the dead-letter file's entries instead, completed or not, and entries that succeed leave the file
+def backfill(league, source, start_years, output_dir, processes=None, requests_per_second=None, threads=4,
+             cache_dir=None, replay=False, parquet=False, first=None, last=None, show=False, archive_dir=None,
+             prometheus_path=None, retry_failed=False, stream_summaries=False):
+    processes = processes or multiprocessing.cpu_count()
+    metrics.reset()  # The report covers this backfill only
+    dead_letter_path = os.path.join(output_dir, "%s_%s_failed.tsv" % (league, source))
+    nba = league == "NBA"
+    if cache_dir is not None:
+        response_cache.configure(cache_dir, replay=replay)  # The header probe and discovery run in this process
+    fetcher.configure(dead_letter_path=dead_letter_path)
+    rate_limiter = fetcher.HostRateLimiter(requests_per_second)
+    retry_dates = None
+    if retry_failed:  # Entries of other seasons stay in the file, entries failing again are written back by get()
+        season_days = set(date for start_year in start_years for date in season_dates(league, start_year, first, last))
+        retry_dates = set(date for _, date in fetcher.pop_dead_letters(dead_letter_path, dates=season_days))
+
+    sinks, checkpoints, units = dict(), dict(), []
+    previous = dict()  # start_year -> (date, teams) of the last SBR date written
+    schedules = dict()  # start_year -> ScheduleIndex of the SBR rows written before this run
+    shared_sink = ParquetSink(os.path.join(output_dir, "parquet"), source.lower(), league) if parquet else None
+    if shared_sink is not None and source == "ESPN":
+        shared_sink = stat_plans.SchemaRouter(shared_sink)
+    for start_year in start_years:
+        path = season_output_path(output_dir, league, source, start_year)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        checkpoint = Checkpoint.for_output(path.replace(".csv", "_manifest.json"), path)
+        resumed = os.path.isfile(path)  # Checked before the sink below creates the file
+        sink = shared_sink if shared_sink is not None else CsvSink(path)
+        if source == "ESPN":
+            if sink is not shared_sink:  # Games whose stat list differs from the header go to a versioned file
+                sink = stat_plans.SchemaRouter(sink)
+            scraper.write_header_if_missing(sink, nba=nba)
+        elif sink.existing_header() is None:
+            sink.write_header(line_scraper.NBA_HEADER if nba else line_scraper.NCAAB_HEADER)
+        sinks[start_year], checkpoints[start_year] = sink, checkpoint
+        if retry_dates is not None:
+            dates = [date for date in season_dates(league, start_year, first, last) if date in retry_dates]
+        else:
+            dates = [date for date in season_dates(league, start_year, first, last)
+                     if not checkpoint.is_date_done(date)]
+        if source == "SBR" and dates and shared_sink is None and resumed:
+            # A resumed season picks up the back-to-back chain from the teams already written for the day before
+            import schedule_index
+            schedules[start_year] = schedule_index.ScheduleIndex.from_sbr_csv(path)
+            if retry_dates is not None:  # SBR rows have no GameID to dedupe on, a date already written is kept
+                dates = [date for date in dates if not schedules[start_year].teams_on(date)]
+        manifest, failed_dates = dict(), set()
+        if source == "ESPN" and dates:  # A handful of range scoreboards instead of one or two requests per date
+            manifest = discovery.events_by_date(discovery.discover_events(dates[0], dates[-1], nba=nba,
+                                                                          rate_limiter=rate_limiter, show=show,
+                                                                          failed_dates=failed_dates))
+        for date in dates:
+            game_urls = None
+            if source == "ESPN" and date not in failed_dates:  # Games already written are not requested again
+                game_urls = [e.url for e in manifest.get(date, []) if not checkpoint.has_game(e.event_id)]
+            units.append((source, league, date, threads, game_urls))
+
+    header = line_scraper.NBA_HEADER if nba else line_scraper.NCAAB_HEADER
+    rate_share = requests_per_second / float(processes) if requests_per_second else None
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                   initargs=(rate_share, cache_dir, replay, dead_letter_path, archive_dir,
+                                             stream_summaries))
+    try:
+        # map() keeps results in submission order so rows are written date by date within each season
+        for unit, (rows, unit_metrics) in zip(units, executor.map(run_unit, units)):
+            metrics.merge(unit_metrics)
+            date = unit[2]
+            start_year = date.year if date.month >= 7 else date.year - 1
+            sink, checkpoint = sinks[start_year], checkpoints[start_year]
+            if source == "SBR":
+                prev_date, prev_teams = previous.get(start_year, (None, set()))
+                if prev_date != date - datetime.timedelta(days=1):
+                    schedule = schedules.get(start_year)
+                    prev_teams = schedule.teams_on(date - datetime.timedelta(days=1)) if schedule is not None else set()
+                rows, todays_teams = _set_b2b(rows, header, prev_teams)
+                previous[start_year] = (date, todays_teams)
+            game_ids = []
+            if source == "ESPN":
+                rows, game_ids = _new_games(rows, checkpoint)
+            sink.write_rows(rows)
+            sink.flush()  # GameIDs and the date are only recorded once their rows are on disk
+            for game_id in game_ids:
+                checkpoint.add_game(game_id)
+            failed = _unit_failed(unit_metrics)
+            if failed:  # An unreadable scoreboard or a missing game must not look like a finished date
+                metrics.count("dates_incomplete")
+            else:
+                checkpoint.mark_date_done(date)
+            checkpoint.save()
+            if show:
+                print("%s %s %s %s (%s) with %d rows" % ("Incomplete" if failed else "Finished", league, source,
+                                                         date.isoformat(), season_for_date(date), len(rows)))
+    finally:  # On Ctrl-C the rows already received are still closed out and checkpointed
+        executor.shutdown(wait=False)
+        for sink in set(sinks.values()):
+            sink.close()
+        for checkpoint in checkpoints.values():
+            checkpoint.save()
+        run_info = {"league": league, "source": source, "seasons": list(start_years), "dates": len(units)}
+        metrics.write_report(os.path.join(output_dir, "%s_%s_report.json" % (league, source)), extra=run_info)
+        if prometheus_path is not None:
+            metrics.write_prometheus(prometheus_path, labels={"league": league, "source": source})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill several seasons of ESPN box scores or SBR lines")
+    parser.add_argument("league", choices=["NBA", "NCAAB"])
+    parser.add_argument("source", choices=["ESPN", "SBR"])
+    parser.add_argument("seasons", help="Start year or range of start years, e.g. 2011-2017")
+    parser.add_argument("--output-dir", default="ScrapedData")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, defaults to every core")
+    parser.add_argument("--threads", type=int, default=4, help="Summary fetch threads inside each worker")
+    parser.add_argument("--rate", type=float, default=None, help="Global requests/sec budget shared by all workers")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--replay", action="store_true", help="Only read from --cache-dir, never the network")
+    parser.add_argument("--parquet", action="store_true", help="Write typed Parquet partitions instead of csv")
+    parser.add_argument("--first", type=_month_day, default=None, help="MM-DD override of the season start")
+    parser.add_argument("--last", type=_month_day, default=None, help="MM-DD override of the season end")
+    parser.add_argument("--archive-dir", default=None, help="Also keep every raw response for raw_archive.py")
+    parser.add_argument("--prometheus", default=None, help="Also write the run's metrics to this .prom textfile")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only scrape again the dates listed in <league>_<source>_failed.tsv")
+    parser.add_argument("--stream-summaries", action="store_true",
+                        help="Stream summaries with ijson, lower peak memory but slower than decoding them whole")
+    parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+
+    backfill(args.league, args.source, parse_season_range(args.seasons), args.output_dir,
+             processes=args.processes, requests_per_second=args.rate, threads=args.threads,
+             cache_dir=args.cache_dir, replay=args.replay, parquet=args.parquet, first=args.first,
+             last=args.last, show=args.show, archive_dir=args.archive_dir, prometheus_path=args.prometheus,
+             retry_failed=args.retry_failed, stream_summaries=args.stream_summaries)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scraper
+from espn_fixtures import write_synthetic_fixtures
+from stub_server import start_stub_server
+
+ESPN_ROOT = "http://site.api.espn.com"
+
+
+# Rewrite every ESPN url template in scraper so requests go to the stub server instead
+def point_scraper_at(base_url):
+    for name in dir(scraper):
+        value = getattr(scraper, name)
+        if name.endswith("_URL") or name.endswith("_URL_TEMPLATE"):
+            setattr(scraper, name, value.replace(ESPN_ROOT, base_url))
+
+
+def _timed_run(function, output_filename, **kwargs):
+    if os.path.isfile(output_filename):
+        os.remove(output_filename)
+    start = time.perf_counter()
+    function(output_filename=output_filename, **kwargs)
+    elapsed = time.perf_counter() - start
+    with open(output_filename) as ifile:
+        rows = ifile.readlines()
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs concurrent game summary fetching against a local stub")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--games-per-day", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds the stub waits before each response")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--fixtures", default=None, help="Directory of recorded fixtures (synthetic if omitted)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    fixture_dir = args.fixtures
+    if fixture_dir is None:
+        fixture_dir = os.path.join(work_dir, "fixtures")
+        write_synthetic_fixtures(fixture_dir, ["201801%02d" % d for d in range(1, args.days + 1)], args.games_per_day)
+    server, base_url = start_stub_server(fixture_dir, latency=args.latency)
+    point_scraper_at(base_url)
+
+    common = dict(start_day=1, end_day=args.days, month=1, year=2018)
+    serial_time, serial_rows = _timed_run(scraper.write_game_data_for_date_range,
+                                          os.path.join(work_dir, "serial.csv"), **common)
+    concurrent_time, concurrent_rows = _timed_run(scraper.write_game_data_for_date_range_concurrent,
+                                                  os.path.join(work_dir, "concurrent.csv"),
+                                                  max_workers=args.workers, **common)
+    server.shutdown()
+
+    games = len(serial_rows) - 1
+    print("games: %d, stub latency: %.0fms, workers: %d" % (games, args.latency * 1000, args.workers))
+    print("serial:     %7.2fs  %7.1f games/sec" % (serial_time, games / serial_time))
+    print("concurrent: %7.2fs  %7.1f games/sec" % (concurrent_time, games / concurrent_time))
+    print("speedup:    %7.1fx" % (serial_time / concurrent_time))
+    print("same rows:  %s" % (sorted(serial_rows) == sorted(concurrent_rows)))
+
+
+if __name__ == "__main__":
+    main()
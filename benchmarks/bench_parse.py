@@ -0,0 +1,90 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_backend
+import scraper
+import summary_stream
+from espn_fixtures import make_summary
+
+# Number of r.json() calls convert_game_to_string used to make per game before the single-parse record
+LEGACY_DECODES = {False: 10, True: 8}
+
+
+def _legacy_convert(content, nba):
+    for _ in range(LEGACY_DECODES[nba] - 1):
+        json.loads(content)
+    return scraper.convert_game_json_to_string(json.loads(content), "1-1-2018,", nba=nba)
+
+
+def _single_parse_convert(content, nba):
+    return scraper.convert_game_json_to_string(json_backend.loads(content), "1-1-2018,", nba=nba)
+
+
+def _summary_convert(content, nba):
+    return scraper.convert_game_json_to_string(summary_stream.load_summary(content, plays=nba), "1-1-2018,", nba=nba)
+
+
+# Largest allocation peak while loading any one payload
+def _peak_kb(payloads, nba):
+    peaks = []
+    for content in payloads:
+        tracemalloc.start()
+        summary_stream.load_summary(content, plays=nba)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return max(peaks) / 1024.0
+
+
+def _per_game_ms(function, payloads, nba, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in payloads:
+            function(content, nba)
+    return (time.perf_counter() - start) * 1000.0 / (repeat * len(payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-game summary parse time before and after single-parse records")
+    parser.add_argument("--fixtures", default=None, help="Directory of saved summary_*.json payloads")
+    parser.add_argument("--games", type=int, default=50, help="Synthetic payloads to build when no fixtures given")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--nba", action="store_true")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, "summary_*.json"))):
+            with open(path, 'rb') as ifile:
+                payloads.append(ifile.read())
+    else:
+        payloads = [json.dumps(make_summary(401000000 + i, nba=args.nba)).encode() for i in range(args.games)]
+    mean_kb = sum(len(p) for p in payloads) / 1024.0 / len(payloads)
+    print("%d payloads, mean size %.0f KB" % (len(payloads), mean_kb))
+
+    before = _per_game_ms(_legacy_convert, payloads, args.nba, args.repeat)
+    print("before (%d x json.loads):  %7.2f ms/game" % (LEGACY_DECODES[args.nba], before))
+    expected = [_legacy_convert(p, args.nba) for p in payloads]
+    for name in sorted(json_backend.DECODERS):
+        json_backend.set_decoder(name)
+        after = _per_game_ms(_single_parse_convert, payloads, args.nba, args.repeat)
+        same = [_single_parse_convert(p, args.nba) for p in payloads] == expected
+        print("after  (1 x %-8s):     %7.2f ms/game  %5.1fx  same rows: %s" % (name, after, before / after, same))
+
+    modes = [False, True] if summary_stream.ijson is not None else [False]
+    for streaming in modes:
+        summary_stream.set_streaming(streaming)
+        after = _per_game_ms(_summary_convert, payloads, args.nba, args.repeat)
+        same = [_summary_convert(p, args.nba) for p in payloads] == expected
+        print("summary_stream %-9s   %7.2f ms/game  peak %6.0f KB  same rows: %s"
+              % ("(ijson):" if streaming else "(decode):", after, _peak_kb(payloads, args.nba), same))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import line_scraper
+from sbr_fixtures import make_page
+
+
+def _per_page_ms(function, pages, ncaab, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in pages:
+            function(content, ncaab)
+    return (time.perf_counter() - start) * 1000.0 / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Original BeautifulSoup parse vs the fast SBR parser")
+    parser.add_argument("--fixtures", default=None, help="Directory of saved SBR *.html pages")
+    parser.add_argument("--pages", type=int, default=10, help="Synthetic pages to build when no fixtures given")
+    parser.add_argument("--games", type=int, default=60, help="Games per synthetic page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--nba", action="store_true")
+    args = parser.parse_args()
+    ncaab = not args.nba
+
+    if args.fixtures:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, "*.html"))):
+            with open(path, 'rb') as ifile:
+                pages.append(ifile.read())
+    else:
+        pages = [make_page("201801%02d" % (i + 1), args.games, ncaab) for i in range(args.pages)]
+    print("%d pages, mean size %.0f KB, lxml %s" % (len(pages), sum(len(p) for p in pages) / 1024.0 / len(pages),
+                                                    "available" if line_scraper.etree is not None else "missing"))
+
+    old_rows = [line_scraper.parse_date_page_soup(p, ncaab) for p in pages]
+    new_rows = [line_scraper.parse_date_page(p, ncaab) for p in pages]
+    before = _per_page_ms(line_scraper.parse_date_page_soup, pages, ncaab, args.repeat)
+    after = _per_page_ms(line_scraper.parse_date_page, pages, ncaab, args.repeat)
+    print("original parse: %8.2f ms/page" % before)
+    print("fast parse:     %8.2f ms/page  %5.1fx" % (after, before / after))
+    print("rows: %d, identical: %s" % (sum(len(r or []) for r in old_rows), old_rows == new_rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import os
+import random
+from urllib.parse import urlparse, parse_qsl
+
+import requests
+
+STAT_LABELS = ["FG Made-Attempted", "Field Goal %", "3PT Made-Attempted", "Three Point %", "FT Made-Attempted",
+               "Free Throw %", "Rebounds", "Offensive Rebounds", "Defensive Rebounds", "Assists", "Steals", "Blocks",
+               "Turnovers", "Team Turnovers", "Total Turnovers", "Technical Fouls", "Total Technical Fouls",
+               "Flagrant Fouls", "Fouls", "Largest Lead"]
+
+
+# Fixture file name for a url, e.g. summary_400986636.json or scoreboard_20180123_50.json
+#  The limit parameter is ignored so the same fixture serves any page size
+def fixture_name(url, extension=".json"):
+    parsed = urlparse(url)
+    segment = [p for p in parsed.path.split("/") if p][-1]
+    values = [v for k, v in sorted(parse_qsl(parsed.query)) if k != "limit"]
+    return "_".join([segment] + values) + extension
+
+
+# Save a live response so it can be served back by the stub server later
+def record_fixture(url, fixture_dir, extension=".json"):
+    r = requests.get(url)
+    path = os.path.join(fixture_dir, fixture_name(url, extension))
+    with open(path, 'wb') as ofile:
+        ofile.write(r.content)
+    return path
+
+
+def _team_stats(rng):
+    fg_att = rng.randint(50, 70)
+    fg_made = rng.randint(20, fg_att - 20)
+    three_att = rng.randint(15, 30)
+    three_made = rng.randint(3, min(three_att, fg_made))
+    ft_att = rng.randint(10, 30)
+    ft_made = rng.randint(5, ft_att)
+    stats = []
+    for label in STAT_LABELS:
+        if label == "FG Made-Attempted":
+            value = "%d-%d" % (fg_made, fg_att)
+        elif label == "3PT Made-Attempted":
+            value = "%d-%d" % (three_made, three_att)
+        elif label == "FT Made-Attempted":
+            value = "%d-%d" % (ft_made, ft_att)
+        elif label.endswith("%"):
+            value = "%.1f" % (rng.random() * 100)
+        else:
+            value = str(rng.randint(0, 40))
+        stats.append({"name": label.replace(" ", ""), "label": label, "displayValue": value})
+    score = three_made * 3 + (fg_made - three_made) * 2 + ft_made
+    return stats, score
+
+
+def _team(team_id, rng):
+    name = "Team%d" % team_id
+    return {"id": str(team_id), "uid": "s:40~l:41~t:%d" % team_id, "location": name, "name": "Mascots",
+            "abbreviation": "T%d" % team_id, "displayName": "%s Mascots" % name, "shortDisplayName": name,
+            "color": "%06x" % rng.randint(0, 0xFFFFFF), "logo": "https://a.espncdn.com/i/teamlogos/%d.png" % team_id}
+
+
+def _plays(home_id, away_id, home_score, away_score, periods, rng):
+    plays = []
+    home, away = 0, 0
+    per_period = 90
+    total = per_period * periods
+    for i in range(total):
+        period = i // per_period + 1
+        scoring = rng.random() < 0.45
+        team_id = home_id if rng.random() < 0.5 else away_id
+        if scoring:  # Walk each side towards its final score so the last play matches the box score
+            remaining = total - i
+            if team_id == home_id and home < home_score:
+                home += min(home_score - home, rng.choice([1, 2, 2, 3]) if remaining > 1 else home_score - home)
+            elif away < away_score:
+                away += min(away_score - away, rng.choice([1, 2, 2, 3]) if remaining > 1 else away_score - away)
+        if i == total - 1:
+            home, away = home_score, away_score
+        seconds_left = (per_period - i % per_period) * (1200 if periods == 2 else 720) // per_period
+        plays.append({"id": str(40000000000 + i), "sequenceNumber": str(i), "type": {"id": "558", "text": "JumpShot"},
+                      "text": "Player %d made Jumper." % rng.randint(1, 400), "awayScore": away, "homeScore": home,
+                      "period": {"number": period, "displayValue": "%d Period" % period},
+                      "clock": {"displayValue": "%d:%02d" % (seconds_left // 60, seconds_left % 60)},
+                      "scoringPlay": scoring, "scoreValue": 2 if scoring else 0, "team": {"id": str(team_id)},
+                      "participants": [{"athlete": {"id": str(rng.randint(1000, 9999))}}],
+                      "wallclock": "2018-01-24T00:%02d:00Z" % (i % 60), "shootingPlay": True})
+    return plays
+
+
+# Build an ESPN-shaped game summary; detailed enough for every extractor in scraper.py
+def make_summary(event_id, nba=False, seed=None):
+    rng = random.Random(event_id if seed is None else seed)
+    home_id, away_id = rng.sample(range(1, 400), 2)
+    home_stats, home_score = _team_stats(rng)
+    away_stats, away_score = _team_stats(rng)
+    competitors = [{"id": str(home_id), "homeAway": "home", "team": _team(home_id, rng), "score": str(home_score)},
+                   {"id": str(away_id), "homeAway": "away", "team": _team(away_id, rng), "score": str(away_score)}]
+    if not nba and rng.random() < 0.2:
+        competitors[0]["rank"] = rng.randint(1, 25)
+    capacity = rng.randint(4000, 20000)
+    return {"header": {"id": str(event_id), "uid": "s:40~l:41~e:%d" % event_id,
+                       "competitions": [{"id": str(event_id), "date": "2018-01-24T00:00Z",
+                                         "neutralSite": rng.random() < 0.1,
+                                         "conferenceCompetition": rng.random() < 0.6,
+                                         "competitors": competitors}]},
+            "boxscore": {"teams": [{"team": competitors[1]["team"], "statistics": away_stats},
+                                   {"team": competitors[0]["team"], "statistics": home_stats}]},
+            "pickcenter": [{"provider": {"id": "1002", "name": "teamrankings"}, "details": "T%d -3.5" % home_id,
+                            "spread": -3.5, "overUnder": 141.5}],
+            "gameInfo": {"venue": {"id": str(rng.randint(1, 5000)), "shortName": "Arena %d" % home_id,
+                                   "address": {"city": "City%d" % home_id, "state": "ST", "zipCode": 10000 + home_id},
+                                   "capacity": capacity},
+                         "attendance": rng.randint(1000, capacity),
+                         "officials": [{"displayName": "Official %d" % rng.randint(1, 300)} for _ in range(3)]},
+            "plays": _plays(home_id, away_id, home_score, away_score, 4 if nba else 2, rng)}
+
+
+def make_scoreboard(event_ids):
+    return {"events": [{"id": str(event_id), "date": "2018-01-24T00:00Z"} for event_id in event_ids]}
+
+
+# Write a full synthetic season slice: days x games_per_day summaries plus the scoreboards that list them
+#  Returns the event ids written for each date string (YYYYMMDD)
+def write_synthetic_fixtures(fixture_dir, dates, games_per_day, nba=False, test_event_id=400986636):
+    if not os.path.isdir(fixture_dir):
+        os.makedirs(fixture_dir)
+    events_by_date = dict()
+    next_id = 401000000
+    for date_string in dates:
+        event_ids = list(range(next_id, next_id + games_per_day))
+        next_id += games_per_day
+        events_by_date[date_string] = event_ids
+        groups = [] if nba else ["50", "100"]
+        for group in groups or [None]:
+            name = "scoreboard_%s" % date_string + ("_%s" % group if group else "") + ".json"
+            with open(os.path.join(fixture_dir, name), 'w') as ofile:  # Tournament group is empty outside March
+                json.dump(make_scoreboard(event_ids if group != "100" else []), ofile)
+        for event_id in event_ids:
+            with open(os.path.join(fixture_dir, "summary_%d.json" % event_id), 'w') as ofile:
+                json.dump(make_summary(event_id, nba=nba), ofile)
+    with open(os.path.join(fixture_dir, "summary_%d.json" % test_event_id), 'w') as ofile:
+        json.dump(make_summary(test_event_id, nba=nba), ofile)
+    return events_by_date
@@ -0,0 +1,79 @@
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import line_scraper
+import scraper
+from checkpoint import event_id_from_url
+from espn_fixtures import record_fixture, write_synthetic_fixtures
+from sbr_fixtures import write_synthetic_pages
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DATES = ["20180123", "20180124"]
+ESPN_GAMES_PER_DAY = 6
+SBR_GAMES_PER_DAY = 40
+
+
+# gzip every file of source_dir into target_dir, mtime is pinned so regenerating gives identical bytes
+def _compress_into(source_dir, target_dir):
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+    for name in sorted(os.listdir(source_dir)):
+        with open(os.path.join(source_dir, name), 'rb') as ifile:
+            data = ifile.read()
+        with open(os.path.join(target_dir, name + ".gz"), 'wb') as raw:
+            with gzip.GzipFile(filename=name, mode='wb', fileobj=raw, mtime=0) as ofile:
+                ofile.write(data)
+
+
+def _record_espn(work_dir, dates, nba):
+    for date_string in dates:
+        year, month, day = int(date_string[:4]), int(date_string[4:6]), int(date_string[6:])
+        record_fixture(scraper.format_date(day, month, year, nba=nba), work_dir)
+        for game_url in scraper.get_urls_from_date(day, month, year, nba=nba):
+            record_fixture(game_url, work_dir)
+    record_fixture(scraper.TEST_NBA_GAME_URL if nba else scraper.TEST_GAME_URL, work_dir)
+
+
+def _record_sbr(work_dir, dates, ncaab):
+    for date_string in dates:
+        url, _ = line_scraper.format_date(int(date_string[6:]), int(date_string[4:6]), int(date_string[:4]), ncaab)
+        record_fixture(url, work_dir, extension=".html")
+
+
+# (Re)build benchmarks/fixtures: espn_ncaab, espn_nba, sbr_ncaab and sbr_nba, one sub-directory each
+#  The shipped set is generated from the seeded synthetic builders, --record replaces it with live captures
+def build_fixtures(root=FIXTURE_ROOT, dates=DATES, record=False):
+    for name, ncaab in (("espn_ncaab", True), ("espn_nba", False), ("sbr_ncaab", True), ("sbr_nba", False)):
+        work_dir = tempfile.mkdtemp()
+        try:
+            if record and name.startswith("espn"):
+                _record_espn(work_dir, dates, nba=not ncaab)
+            elif record:
+                _record_sbr(work_dir, dates, ncaab)
+            elif name.startswith("espn"):
+                test_url = scraper.TEST_GAME_URL if ncaab else scraper.TEST_NBA_GAME_URL
+                write_synthetic_fixtures(work_dir, dates, ESPN_GAMES_PER_DAY, nba=not ncaab,
+                                         test_event_id=int(event_id_from_url(test_url)))
+            else:
+                write_synthetic_pages(work_dir, dates, SBR_GAMES_PER_DAY, ncaab=ncaab)
+            target_dir = os.path.join(root, name)
+            if os.path.isdir(target_dir):
+                shutil.rmtree(target_dir)
+            _compress_into(work_dir, target_dir)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the fixtures served by the benchmark stub server")
+    parser.add_argument("--root", default=FIXTURE_ROOT)
+    parser.add_argument("--dates", nargs="+", default=DATES, help="YYYYMMDD dates to include")
+    parser.add_argument("--record", action="store_true", help="Capture the live ESPN and SBR responses instead")
+    args = parser.parse_args()
+    build_fixtures(args.root, args.dates, args.record)
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+import fetcher
+import json_backend
+import line_scraper
+import metrics
+import response_cache
+import scraper
+from make_fixtures import DATES, FIXTURE_ROOT
+from sinks import ListSink
+from stub_server import _read_fixture, start_stub_server
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+ESPN_ROOT = "http://site.api.espn.com"
+SBR_ROOT = "https://www.sportsbookreview.com"
+DEFAULT_TOLERANCE = 0.25  # A result more than 25% worse than its baseline is reported as a regression
+
+
+# Rewrite every URL constant of a module from root to base_url, returns the originals for _restore
+def _point_at(module, root, base_url):
+    originals = dict()
+    for name in dir(module):
+        if name.isupper() and "URL" in name and isinstance(getattr(module, name), str):
+            originals[name] = getattr(module, name)
+            setattr(module, name, originals[name].replace(root, base_url))
+    return originals
+
+
+def _restore(module, originals):
+    for name, value in originals.items():
+        setattr(module, name, value)
+
+
+def _dates():
+    return [(int(d[:4]), int(d[4:6]), int(d[6:])) for d in DATES]
+
+
+# Best of repeat timings in microseconds per call, each timing loops long enough (min_seconds) to be stable
+def _micro(function, min_seconds=0.1, repeat=5):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= min_seconds / 10:
+            break
+        number *= 2
+    number = max(1, number * 10)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+
+def _espn_rows(nba, latency, error_rate=0.0, mode="serial", workers=16):
+    fixture_dir = os.path.join(FIXTURE_ROOT, "espn_nba" if nba else "espn_ncaab")
+    server, base_url = start_stub_server(fixture_dir, latency=latency, error_rate=error_rate)
+    originals = _point_at(scraper, ESPN_ROOT, base_url)
+    work_dir = tempfile.mkdtemp()
+    output_filename = os.path.join(work_dir, "games.csv")
+    try:
+        start = time.perf_counter()
+        for year, month, day in _dates():  # The shipped dates are consecutive days of one month
+            if mode == "concurrent":
+                scraper.write_game_data_for_date_range_concurrent(day, day, month, year, output_filename, nba=nba,
+                                                                  max_workers=workers)
+            elif mode == "pipelined":
+                scraper.write_game_data_for_date_range_pipelined(day, day, month, year, output_filename, nba=nba,
+                                                                 fetch_workers=workers)
+            else:
+                scraper.write_game_data_for_date_range(day, day, month, year, output_filename, nba=nba)
+        elapsed = time.perf_counter() - start
+        with open(output_filename) as ifile:
+            rows = ifile.readlines()[1:]
+    finally:
+        server.shutdown()
+        _restore(scraper, originals)
+        shutil.rmtree(work_dir)
+    return elapsed, rows
+
+
+def _sbr_dates(ncaab, latency, rounds, pipelined=False):
+    fixture_dir = os.path.join(FIXTURE_ROOT, "sbr_ncaab" if ncaab else "sbr_nba")
+    server, base_url = start_stub_server(fixture_dir, latency=latency, extension=".html")
+    originals = _point_at(line_scraper, SBR_ROOT, base_url)
+    sink = ListSink()
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            prev_teams = set()
+            if pipelined:
+                (year, month, first), last = _dates()[0], _dates()[-1][2]
+                line_scraper.write_lines_for_date_range(first, last, month, year, None, prev_teams, ncaab=ncaab,
+                                                        sink=sink)
+                continue
+            for year, month, day in _dates():
+                prev_teams = line_scraper.get_date_lines(day, month, year, None, prev_teams, ncaab=ncaab, sink=sink)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        _restore(line_scraper, originals)
+    return elapsed, sink.rows
+
+
+def end_to_end_benchmarks(latency, rounds):
+    results = dict()
+    fetcher.configure(backoff_base=0.01, backoff_max=0.05)  # Injected errors should cost retries, not sleeps
+    for nba in (False, True):
+        league = "nba" if nba else "ncaab"
+        elapsed, rows = _espn_rows(nba, latency)
+        results["espn_%s_serial" % league] = {"value": len(rows) / elapsed, "unit": "games/sec"}
+        elapsed, concurrent_rows = _espn_rows(nba, latency, mode="concurrent")
+        results["espn_%s_concurrent" % league] = {"value": len(rows) / elapsed, "unit": "games/sec",
+                                                  "same_rows": sorted(rows) == sorted(concurrent_rows)}
+        elapsed, error_rows = _espn_rows(nba, latency, error_rate=0.1, mode="concurrent")
+        results["espn_%s_concurrent_10pct_errors" % league] = {"value": len(rows) / elapsed, "unit": "games/sec",
+                                                               "same_rows": sorted(rows) == sorted(error_rows)}
+        elapsed, pipelined_rows = _espn_rows(nba, latency, mode="pipelined")
+        results["espn_%s_pipelined" % league] = {"value": len(rows) / elapsed, "unit": "games/sec",
+                                                 "same_rows": sorted(rows) == sorted(pipelined_rows)}
+        elapsed, sbr_rows = _sbr_dates(not nba, latency, rounds)
+        results["sbr_%s_dates" % league] = {"value": rounds * len(DATES) / elapsed, "unit": "dates/sec",
+                                            "rows": len(sbr_rows)}
+        elapsed, pipelined_sbr_rows = _sbr_dates(not nba, latency, rounds, pipelined=True)
+        results["sbr_%s_dates_pipelined" % league] = {"value": rounds * len(DATES) / elapsed, "unit": "dates/sec",
+                                                      "same_rows": pipelined_sbr_rows == sbr_rows}
+    return results
+
+
+def micro_benchmarks(min_seconds):
+    summary = json_backend.loads(_read_fixture(os.path.join(FIXTURE_ROOT, "espn_ncaab", "summary_401000000.json")))
+    stat_list = summary['boxscore']['teams'][1]['statistics']
+    page = _read_fixture(os.path.join(FIXTURE_ROOT, "sbr_ncaab", "ncaa-basketball_%s.html" % DATES[0]))
+    games = BeautifulSoup(page, "html.parser").find_all(name="div", class_="event-holder holder-complete")
+    book = games[0].find_all(name="div", class_="el-div eventLine-book")[0]
+    benchmarks = {"get_team_statistics": lambda: scraper.get_team_statistics(stat_list),
+                  "generate_header": lambda: scraper.generate_header(stat_list),
+                  "convert_game_json_to_string": lambda: scraper.convert_game_json_to_string(summary, "1-23-2018,"),
+                  "parse_game": lambda: line_scraper.parse_game(games[0], ncaab=True),
+                  "convert_line": lambda: line_scraper.convert_line(book),
+                  "parse_date_page": lambda: line_scraper.parse_date_page(page, ncaab=True, batched=True)}
+    results = dict()
+    for name, function in benchmarks.items():
+        results["micro_%s" % name] = {"value": _micro(function, min_seconds), "unit": "us/call",
+                                      "lower_is_better": True}
+    return results
+
+
+# Ratio of each result to its baseline where above 1.0 is always an improvement
+def compare(results, baselines, tolerance=DEFAULT_TOLERANCE):
+    rows, regressions = [], []
+    for name in sorted(results):
+        value = results[name]["value"]
+        baseline = baselines.get(name, {}).get("value")
+        if not baseline:
+            rows.append((name, value, None, None, "new"))
+            continue
+        ratio = baseline / value if results[name].get("lower_is_better") else value / baseline
+        status = "ok"
+        if ratio < 1.0 - tolerance:
+            status = "REGRESSION"
+            regressions.append(name)
+        rows.append((name, value, baseline, ratio, status))
+    return rows, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline scraper benchmarks against the shipped fixtures")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the stub waits before each response")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the SBR dates")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Minimum time of one micro-benchmark repeat")
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when anything regressed")
+    parser.add_argument("--output", default=None, help="Also write the results as json")
+    args = parser.parse_args()
+
+    response_cache.disable()
+    metrics.reset()
+    results = micro_benchmarks(args.min_seconds)
+    if not args.skip_end_to_end:
+        results.update(end_to_end_benchmarks(args.latency, args.rounds))
+
+    baselines = dict()
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as ifile:
+            baselines = json.load(ifile)
+    table, regressions = compare(results, baselines, args.tolerance)
+    print("%-42s %12s %12s %8s  %s" % ("benchmark", "result", "baseline", "ratio", "status"))
+    for name, value, baseline, ratio, status in table:
+        unit = results[name]["unit"]
+        print("%-42s %12.2f %12s %8s  %s %s" % (name, value, "%.2f" % baseline if baseline else "-",
+                                                "%.2f" % ratio if ratio else "-", status, unit))
+    for name in sorted(results):
+        if results[name].get("same_rows") is False:
+            print("%s produced different rows than the serial run" % name)
+            regressions.append(name)
+
+    if args.output:
+        with open(args.output, 'w') as ofile:
+            json.dump({"results": results, "counters": metrics.report()["counters"]}, ofile, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as ofile:
+            json.dump(results, ofile, indent=2, sort_keys=True)
+            ofile.write("\n")
+    if args.check and regressions:
+        sys.exit(1)
@@ -0,0 +1,69 @@
+import os
+import random
+
+BOOKS = ["Pinnacle", "5Dimes", "Heritage", "BookMaker", "Bovada", "BetOnline", "SportsBetting", "Sportsbook",
+         "YouWager", "BetDSI"]
+
+
+def _half_text(value):
+    whole = int(abs(value))
+    sign = "-" if value < 0 else "+"
+    return "%s%d%s" % (sign, whole, u"½" if abs(value) - whole else "")
+
+
+def _book_cell(rng, spread):
+    if rng.random() < 0.05:  # Books that are off the board render a single empty value
+        return '<div class="el-div eventLine-book"><div class="eventLine-book-value"></div></div>'
+    book_spread = spread + rng.choice([-1, -0.5, 0, 0, 0.5, 1])
+    payout = rng.choice([-105, -108, -110, -110, -115, 100])
+    return ('<div class="el-div eventLine-book" rel="%d">'
+            '<div class="eventLine-book-value"><b>%s %d</b></div>'
+            '<div class="eventLine-book-value"><b>%s %d</b></div></div>'
+            % (rng.randint(1, 999), _half_text(-book_spread), payout, _half_text(book_spread), payout))
+
+
+def _score_periods(rng, periods):
+    scores = [rng.randint(20, 50) for _ in range(periods)]
+    spans = "".join('<span class="period">%d</span>' % s for s in [sum(scores)] + scores)
+    return '<div class="score-periods">%s<span class="period"></span></div>' % spans
+
+
+# One game row shaped like sportsbookreview's eventLines markup, enough for line_scraper.parse_game
+def make_game(rng, ncaab=False):
+    away, home = rng.sample(range(1, 350), 2)
+    away_name = "Team %d" % away
+    if ncaab and rng.random() < 0.15:
+        away_name = "(%d) %s" % (rng.randint(1, 25), away_name)
+    spread = rng.choice([-12.5, -7, -5.5, -3, -1.5, 1, 2.5, 4, 6.5, 9])
+    periods = 2 if ncaab else 4
+    books = "".join(_book_cell(rng, spread) for _ in BOOKS)
+    return ('<div class="event-holder holder-complete"><div class="eventLine status-complete">'
+            '<div class="el-div eventLine-rotation"><div class="eventLine-value">%d</div></div>'
+            '<div class="el-div eventLine-time"><div class="eventLine-value">7:00 PM</div></div>'
+            '<div class="el-div eventLine-team">'
+            '<div class="eventLine-value"><span class="team-name"><a href="/team/%d">%s</a></span></div>'
+            '<div class="eventLine-value"><span class="team-name"><a href="/team/%d">Team %d</a></span></div>'
+            '</div><div class="scorebox odd">%s%s</div>%s</div></div>'
+            % (rng.randint(500, 900), away, away_name, home, home,
+               _score_periods(rng, periods), _score_periods(rng, periods), books))
+
+
+# A whole date page, the games are wrapped in the navigation, scripts and ads that surround them on the live site
+def make_page(date_string, games, ncaab=False, seed=None):
+    rng = random.Random(date_string if seed is None else seed)
+    filler = "".join('<div class="nav-item"><a href="/link/%d">Link %d</a><script>var x%d = %d;</script></div>'
+                     % (i, i, i, rng.randint(0, 10 ** 6)) for i in range(400))
+    game_rows = "".join(make_game(rng, ncaab) for _ in range(games))
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Odds %s</title></head><body>'
+            '<div id="header">%s</div><div class="content"><div class="eventLines">%s</div></div>'
+            '<div id="footer">%s</div></body></html>' % (date_string, filler, game_rows, filler)).encode("utf-8")
+
+
+# Write one page per date as ncaa-basketball_<YYYYMMDD>.html (or 1st-half_ for the NBA), the stub server naming
+def write_synthetic_pages(fixture_dir, dates, games_per_day, ncaab=True):
+    if not os.path.isdir(fixture_dir):
+        os.makedirs(fixture_dir)
+    prefix = "ncaa-basketball" if ncaab else "1st-half"
+    for date_string in dates:
+        with open(os.path.join(fixture_dir, "%s_%s.html" % (prefix, date_string)), 'wb') as ofile:
+            ofile.write(make_page(date_string, games_per_day, ncaab))
@@ -0,0 +1,72 @@
+import gzip
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from espn_fixtures import fixture_name
+
+CONTENT_TYPES = {".json": "application/json", ".html": "text/html; charset=utf-8"}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Default backlog of 5 drops connections from a wide worker pool
+
+
+def _read_fixture(path):
+    if os.path.isfile(path):
+        with open(path, 'rb') as ifile:
+            return ifile.read()
+    if os.path.isfile(path + ".gz"):  # The shipped fixtures are stored compressed
+        with gzip.open(path + ".gz", 'rb') as ifile:
+            return ifile.read()
+    return None
+
+
+# Serve fixture files by the name fixture_name() gives the requested url, sleeping latency seconds per request
+#  A seeded error_rate share of requests fail instead: error_status is sent, or the connection is dropped
+#  without a response when error_status is 0
+def make_handler(fixture_dir, latency=0.0, extension=".json", error_rate=0.0, error_status=503, seed=0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if error_rate:
+                with rng_lock:
+                    fail = rng.random() < error_rate
+                if fail and error_status:
+                    self.send_error(error_status)
+                    return
+                if fail:
+                    self.close_connection = True
+                    return
+            body = _read_fixture(os.path.join(fixture_dir, fixture_name(self.path, extension)))
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(extension, "application/octet-stream"))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+# Start the stub on a free local port in a background thread, returns (server, base_url)
+def start_stub_server(fixture_dir, latency=0.0, extension=".json", error_rate=0.0, error_status=503, seed=0):
+    server = _ThreadingHTTPServer(("127.0.0.1", 0), make_handler(fixture_dir, latency, extension, error_rate,
+                                                                 error_status, seed))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
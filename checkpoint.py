@@ -0,0 +1,54 @@
+import datetime
+import json
+import os
+from urllib.parse import urlparse, parse_qs
+
+from gameid_index import GameIdIndex
+
+
+# Pull the ESPN event id (which is also the GameID column) out of a summary url
+def event_id_from_url(url):
+    return parse_qs(urlparse(url).query).get("event", [""])[0]
+
+
+class Checkpoint(object):
+    """Manifest of the dates already scraped to completion, GameIDs written live in a GameIdIndex sidecar"""
+
+    def __init__(self, manifest_path, game_index=None):
+        self.manifest_path = manifest_path
+        self.completed_dates = set()
+        if game_index is None:
+            game_index = GameIdIndex(os.path.splitext(manifest_path)[0] + ".gameids")
+        self.game_index = game_index
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as ifile:
+                manifest = json.load(ifile)
+            self.completed_dates = set(manifest.get("completed_dates", []))
+            for game_id in manifest.get("game_ids", []):  # Manifests written before the sidecar index held the ids
+                self.game_index.add(game_id)
+
+    # Checkpoint for an output file, the GameID index is rebuilt from the file if it has no sidecar yet
+    @classmethod
+    def for_output(cls, manifest_path, output_filename):
+        index_path = os.path.splitext(output_filename)[0] + ".gameids"
+        return cls(manifest_path, GameIdIndex.for_output(index_path, output_filename))
+
+    def is_date_done(self, date):
+        return date.isoformat() in self.completed_dates
+
+    # Today's slate can still change, so only dates strictly in the past are ever marked complete
+    def mark_date_done(self, date):
+        if date < datetime.date.today():
+            self.completed_dates.add(date.isoformat())
+
+    def has_game(self, game_id):
+        return game_id in self.game_index
+
+    # Returns False when the game was already written
+    def add_game(self, game_id):
+        return self.game_index.add(game_id)
+
+    def save(self):
+        with open(self.manifest_path + ".tmp", 'w') as ofile:
+            json.dump({"completed_dates": sorted(self.completed_dates)}, ofile)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
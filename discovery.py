@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import os
+from collections import namedtuple
+
+import requests
+
+import fetcher
+import json_backend
+import metrics
+import response_cache
+import scraper
+
+RANGE_LIMIT = 1000  # Events asked for per range request, a response this full may be truncated and is split
+
+# One scoreboard entry, url is the game's summary url
+DiscoveredEvent = namedtuple("DiscoveredEvent", ["date", "event_id", "url"])
+
+
+def _nth_sunday(year, month, n):
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_sunday(year, month):
+    last = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() + 1) % 7)
+
+
+# ESPN stamps events in UTC ("2018-01-24T02:00Z") while its scoreboard days are US Eastern, so a 9pm tip belongs
+#  to the day before its UTC date. DST switches at 2am local, 07:00Z in March/April and 06:00Z in October/November
+def eastern_date(utc_text):
+    moment = datetime.datetime.strptime(utc_text[:16], "%Y-%m-%dT%H:%M")
+    year = moment.year
+    if year >= 2007:
+        dst_start, dst_end = _nth_sunday(year, 3, 2), _nth_sunday(year, 11, 1)
+    else:
+        dst_start, dst_end = _nth_sunday(year, 4, 1), _last_sunday(year, 10)
+    dst_start = datetime.datetime.combine(dst_start, datetime.time(7))
+    dst_end = datetime.datetime.combine(dst_end, datetime.time(6))
+    offset = 4 if dst_start <= moment < dst_end else 5
+    return (moment - datetime.timedelta(hours=offset)).date()
+
+
+def _days(start_date, end_date):
+    return [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+# [(date, event_id)] from the one-day scoreboards, fetched concurrently, days whose scoreboard failed are added
+#  to failed_dates
+def _daily_events(start_date, end_date, tournament, nba, max_workers, rate_limiter, failed_dates):
+    days = _days(start_date, end_date)
+    urls = [scraper.format_date(day.day, day.month, day.year, tournament=tournament, nba=nba) for day in days]
+    event_lists = fetcher.fetch_concurrently(lambda job: scraper.get_scoreboard_events(job[1], job[0]),
+                                             list(zip(days, urls)),
+                                             max_workers=max_workers,
+                                             rate_limiter=rate_limiter,
+                                             rate_url=lambda job: job[1])
+    failed_dates.update(day for day, events in zip(days, event_lists) if events is None)
+    return [(day, e['id']) for day, events in zip(days, event_lists) for e in events or []]
+
+
+# [(date, event_id)] for start_date..end_date from as few range requests as possible
+#  A full response is split in half and each half asked again, a range the scoreboard rejects (or that can't be
+#  fetched) falls back to one request per day so every failure is dead-lettered with its own date
+def _range_events(start_date, end_date, tournament, nba, max_workers, rate_limiter, failed_dates):
+    if start_date == end_date:
+        return _daily_events(start_date, end_date, tournament, nba, max_workers, rate_limiter, failed_dates)
+    url = scraper.format_date_range(start_date, end_date, RANGE_LIMIT, tournament=tournament, nba=nba)
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    metrics.count("range_scoreboards")
+    try:
+        # A range reaching today expires like today's page, a failed range is not dead-lettered as the daily
+        #  fallback below records each of its days that fails too
+        content = response_cache.get_content(url, date=end_date, dead_letter=False)
+        with metrics.timer("decode"):
+            events = json_backend.loads(content)['events']
+    except (json_backend.DecodeError, KeyError, TypeError, requests.exceptions.ConnectionError):
+        metrics.count("range_scoreboard_fallbacks")
+        return _daily_events(start_date, end_date, tournament, nba, max_workers, rate_limiter, failed_dates)
+    if len(events) >= RANGE_LIMIT:
+        metrics.count("range_scoreboard_splits")
+        middle = start_date + datetime.timedelta(days=(end_date - start_date).days // 2)
+        return (_range_events(start_date, middle, tournament, nba, max_workers, rate_limiter, failed_dates) +
+                _range_events(middle + datetime.timedelta(days=1), end_date, tournament, nba, max_workers,
+                              rate_limiter, failed_dates))
+    # Clamped so an event whose time is off by the odd hour still stays inside the range it was listed for
+    return [(min(max(eastern_date(e['date']), start_date), end_date), e['id']) for e in events]
+
+
+# Sorted, de-duplicated manifest of every event on the scoreboards from start_date to end_date (inclusive)
+#  Tournament scoreboards are only asked for the part of the range inside scraper.TOURNAMENT_WINDOW, an event
+#  listed twice keeps the date of its regular-season scoreboard entry. Days whose scoreboard could not be read are
+#  added to failed_dates when a set is given, their games are missing from the manifest
+def discover_events(start_date, end_date, nba=False, max_workers=fetcher.DEFAULT_MAX_WORKERS, rate_limiter=None,
+                    show=False, failed_dates=None):
+    if failed_dates is None:
+        failed_dates = set()
+    found = _range_events(start_date, end_date, False, nba, max_workers, rate_limiter, failed_dates)
+    if not nba:
+        tournament_days = [day for day in _days(start_date, end_date) if scraper.in_tournament_window(day)]
+        if tournament_days:  # The window is one contiguous span of days in any season
+            found += _range_events(tournament_days[0], tournament_days[-1], True, nba, max_workers, rate_limiter,
+                                   failed_dates)
+    seen = set()
+    events = []
+    for date, event_id in found:
+        event_id = str(event_id)
+        if event_id not in seen:
+            seen.add(event_id)
+            events.append(DiscoveredEvent(date, event_id, scraper.game_url_for_event(event_id, nba=nba)))
+    events.sort(key=lambda e: (e.date, int(e.event_id) if e.event_id.isdigit() else 0, e.event_id))
+    if show:
+        print("%d events found from %s to %s" % (len(events), start_date.isoformat(), end_date.isoformat()))
+    return events
+
+
+# date -> [DiscoveredEvent] in manifest order, days without games are absent
+def events_by_date(events):
+    grouped = dict()
+    for event in events:
+        grouped.setdefault(event.date, []).append(event)
+    return grouped
+
+
+# Manifest lines are "date<TAB>event_id<TAB>url" with the date as YYYY-MM-DD, like the dead-letter file
+def write_manifest(path, events):
+    with open(path + ".tmp", 'w') as ofile:
+        for event in events:
+            ofile.write("%s\t%s\t%s\n" % (event.date.isoformat(), event.event_id, event.url))
+    os.replace(path + ".tmp", path)
+
+
+def read_manifest(path):
+    events = []
+    with open(path) as ifile:
+        for line in ifile:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 3:
+                date = datetime.datetime.strptime(fields[0], "%Y-%m-%d").date()
+                events.append(DiscoveredEvent(date, fields[1], fields[2]))
+    return events
+
+
+def _iso_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve every ESPN game of a date range into an event manifest")
+    parser.add_argument("start", type=_iso_date, help="YYYY-MM-DD")
+    parser.add_argument("end", type=_iso_date, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("output", help="Manifest .tsv to write")
+    parser.add_argument("--nba", action="store_true")
+    parser.add_argument("--workers", type=int, default=fetcher.DEFAULT_MAX_WORKERS,
+                        help="Threads for the per-day fallback")
+    parser.add_argument("--rate", type=float, default=None, help="Requests/sec per host")
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    if args.cache_dir is not None:
+        response_cache.configure(args.cache_dir)
+    manifest = discover_events(args.start, args.end, nba=args.nba, max_workers=args.workers,
+                               rate_limiter=fetcher.HostRateLimiter(args.rate), show=True)
+    write_manifest(args.output, manifest)
+    print(dict((k, v) for k, v in metrics.snapshot()["counters"].items() if "scoreboard" in k or k == "http_requests"))
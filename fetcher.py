@@ -0,0 +1,196 @@
+import datetime
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import metrics
+
+DEFAULT_MAX_WORKERS = 16
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Settings shared by every get() call, changed through configure()
+_settings = {"timeout": (5.0, 30.0),  # (connect, read) seconds
+             "max_retries": 4,
+             "backoff_base": 0.5,  # Seconds, doubled each attempt before jitter
+             "backoff_max": 30.0,
+             "pool_size": DEFAULT_MAX_WORKERS,
+             "dead_letter_path": None,
+             "rate_limiter": None}
+_local = threading.local()
+_dead_letter_lock = threading.Lock()
+
+
+class RetriesExhausted(requests.exceptions.ConnectionError):
+    """Raised once a url has failed every retry, handled like any other failed connection"""
+
+
+# New connections are timed under the "connect" stage, which includes DNS resolution and the TLS handshake
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with metrics.timer("connect"):
+            super(_TimedHTTPConnection, self).connect()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with metrics.timer("connect"):
+            super(_TimedHTTPSConnection, self).connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+# Change timeouts, retry policy, pool size, per-host rate or the dead-letter file used by get()
+def configure(timeout=None, max_retries=None, backoff_base=None, backoff_max=None, pool_size=None,
+              dead_letter_path=None, requests_per_second=None):
+    for key, value in (("timeout", timeout), ("max_retries", max_retries), ("backoff_base", backoff_base),
+                       ("backoff_max", backoff_max), ("pool_size", pool_size),
+                       ("dead_letter_path", dead_letter_path)):
+        if value is not None:
+            _settings[key] = value
+    if requests_per_second is not None:
+        _settings["rate_limiter"] = HostRateLimiter(requests_per_second)
+    _local.__dict__.clear()  # Sessions are rebuilt lazily so a new pool size takes effect
+
+
+# One keep-alive session per thread, requests.Session is not safe to share between worker threads
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=_settings["pool_size"], pool_maxsize=_settings["pool_size"])
+        adapter.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool,
+                                                      "https": _TimedHTTPSConnectionPool}
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def _backoff_delay(attempt, response=None):
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(float(response.headers["Retry-After"]), _settings["backoff_max"])
+    return random.uniform(0, min(_settings["backoff_max"], _settings["backoff_base"] * 2 ** attempt))  # Full jitter
+
+
+# GET url on the pooled session, retrying 429/5xx responses and connection failures with exponential backoff
+#  Other statuses (e.g. 404 or a conditional request's 304) are returned as is. date is only used to label the
+#  dead-letter entry on failure, headers are sent with every attempt. dead_letter=False is for requests whose
+#  failure the caller recovers from itself, they raise without leaving an entry to retry
+def get(url, date=None, headers=None, dead_letter=True):
+    reason = ""
+    for attempt in range(_settings["max_retries"] + 1):
+        response = None
+        if _settings["rate_limiter"] is not None:
+            with metrics.timer("rate_limit_wait"):
+                _settings["rate_limiter"].wait(url)
+        metrics.count("http_requests")
+        if attempt > 0:
+            metrics.count("http_retries")
+        start = time.perf_counter()
+        try:
+            response = get_session().get(url, timeout=_settings["timeout"], headers=headers)
+            # elapsed stops once the headers are parsed, the rest of the wall time is reading the body
+            headers_seconds = response.elapsed.total_seconds()
+            metrics.observe("request", headers_seconds)
+            metrics.observe("download", max(time.perf_counter() - start - headers_seconds, 0.0))
+            metrics.count("bytes_downloaded", len(response.content))
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            reason = "HTTP %d" % response.status_code
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            reason = type(e).__name__
+        metrics.count("http_failures_%s" % reason.replace(" ", "_").lower())
+        if attempt < _settings["max_retries"]:
+            time.sleep(_backoff_delay(attempt, response))
+    if dead_letter:
+        metrics.count("dead_letters")
+        record_dead_letter(url, date, reason)
+    raise RetriesExhausted("%s failed after %d attempts (%s)" % (url, _settings["max_retries"] + 1, reason))
+
+
+# Dead-letter lines are "url<TAB>date<TAB>reason", date as YYYY-MM-DD or empty when unknown
+def record_dead_letter(url, date, reason):
+    path = _settings["dead_letter_path"]
+    if path is None:
+        return
+    with _dead_letter_lock:
+        with open(path, 'a') as ofile:
+            ofile.write("%s\t%s\t%s\n" % (url, date.isoformat() if date is not None else "", reason))
+
+
+# Read and clear a dead-letter file, returns unique [(url, date or None)] in first-failure order
+#  Urls that fail again during the retry pass are written back to the file by get(). With dates, only entries
+#  for those dates are taken and every other line stays in the file
+def pop_dead_letters(path, dates=None):
+    if not os.path.isfile(path):
+        return []
+    entries = []
+    kept = []
+    seen = set()
+    with _dead_letter_lock:
+        with open(path) as ifile:
+            for line in ifile:
+                fields = line.rstrip("\n").split("\t")
+                date = datetime.datetime.strptime(fields[1], "%Y-%m-%d").date() if len(fields) > 1 and fields[1] else None
+                if dates is not None and date not in dates:
+                    kept.append(line)
+                elif fields[0] and fields[0] not in seen:
+                    seen.add(fields[0])
+                    entries.append((fields[0], date))
+        if kept:
+            with open(path + ".tmp", 'w') as ofile:
+                ofile.writelines(kept)
+            os.replace(path + ".tmp", path)
+        else:
+            os.remove(path)
+    return entries
+
+
+class HostRateLimiter(object):
+    """Spaces out requests so each host sees at most requests_per_second calls"""
+
+    def __init__(self, requests_per_second=None):
+        self.requests_per_second = requests_per_second
+        self._lock = threading.Lock()
+        self._next_slot = dict()  # host -> earliest time the next request may start
+
+    def wait(self, url):
+        if not self.requests_per_second:
+            return
+        host = urlparse(url).netloc
+        interval = 1.0 / self.requests_per_second
+        with self._lock:  # Reserve a slot under the lock, sleep outside of it so other hosts are not blocked
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Run fetch_function(item) for every item on a bounded thread pool, results come back in input order
+#  rate_url maps an item to the url it will hit so the limiter knows which host to throttle
+def fetch_concurrently(fetch_function, items, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None, rate_url=None):
+    def _limited_fetch(item):
+        if rate_limiter is not None:
+            rate_limiter.wait(rate_url(item) if rate_url is not None else item)
+        return fetch_function(item)
+
+    if max_workers <= 1:
+        return [_limited_fetch(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_limited_fetch, items))
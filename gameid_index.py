@@ -0,0 +1,100 @@
+import argparse
+import os
+
+
+# Stream the GameID (first column) of every data row in a scraped csv, the header row is skipped
+def read_game_ids(filename):
+    with open(filename) as ifile:
+        for line in ifile:
+            game_id = line.split(",", 1)[0].strip()
+            if game_id and game_id != "GameID":
+                yield game_id
+
+
+class GameIdIndex(object):
+    """Append-only sidecar file of GameIDs already written to an output file, one id per line"""
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.game_ids = set()
+        if os.path.isfile(index_path):
+            with open(index_path) as ifile:
+                self.game_ids = set(line.strip() for line in ifile if line.strip())
+        self._file = None
+
+    # Index for an output file, rebuilt from the file's GameID column when no sidecar exists yet
+    @classmethod
+    def for_output(cls, index_path, output_filename):
+        index_exists = os.path.isfile(index_path)
+        index = cls(index_path)
+        if not index_exists and os.path.isfile(output_filename):
+            for game_id in read_game_ids(output_filename):
+                index.add(game_id)
+        return index
+
+    def __contains__(self, game_id):
+        return game_id in self.game_ids
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    # Record a GameID, returns False (and writes nothing) when it was already indexed
+    def add(self, game_id):
+        if game_id in self.game_ids:
+            return False
+        if self._file is None:
+            self._file = open(self.index_path, 'a', buffering=1)
+        self._file.write(game_id + "\n")
+        self.game_ids.add(game_id)
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Copy a scraped csv keeping only the first row of every GameID, one line in memory at a time
+#  Only the set of ids seen so far is held, so memory is bounded by the number of games not the file size
+def compact_output(input_filename, output_filename):
+    seen = set()
+    kept, dropped = 0, 0
+    with open(input_filename) as ifile, open(output_filename, 'w') as ofile:
+        for line in ifile:
+            game_id = line.split(",", 1)[0].strip()
+            if game_id == "GameID" or not game_id:
+                ofile.write(line)
+            elif game_id in seen:
+                dropped += 1
+            else:
+                seen.add(game_id)
+                ofile.write(line)
+                kept += 1
+    return kept, dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain GameID indexes and dedupe scraped csv files")
+    subparsers = parser.add_subparsers(dest="command")
+    compact_parser = subparsers.add_parser("compact", help="Rewrite a csv without duplicate GameIDs")
+    compact_parser.add_argument("input")
+    compact_parser.add_argument("output", nargs="?", help="Defaults to replacing the input file")
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the .gameids sidecar of a csv")
+    rebuild_parser.add_argument("input")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        output = args.output or args.input + ".compact"
+        kept, dropped = compact_output(args.input, output)
+        if args.output is None:
+            os.replace(output, args.input)
+        print("Kept %d rows, dropped %d duplicates" % (kept, dropped))
+    elif args.command == "rebuild":
+        index_path = os.path.splitext(args.input)[0] + ".gameids"
+        if os.path.isfile(index_path):
+            os.remove(index_path)
+        index = GameIdIndex.for_output(index_path, args.input)
+        index.close()
+        print("Indexed %d GameIDs in %s" % (len(index), index_path))
+    else:
+        parser.print_help()
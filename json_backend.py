@@ -0,0 +1,42 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DecodeError = json.decoder.JSONDecodeError  # orjson.JSONDecodeError subclasses this, so one except clause covers both
+
+
+def _stdlib_loads(content):
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    return json.loads(content)
+
+
+# Decoders that can be selected by name, each takes response bytes (or str) and returns python objects
+DECODERS = {"json": _stdlib_loads}
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+_active = {"name": "orjson" if orjson is not None else "json"}
+
+
+# Register an additional decoder backend, e.g. register_decoder("ujson", ujson.loads)
+def register_decoder(name, loads_function):
+    DECODERS[name] = loads_function
+
+
+# Choose the decoder used by loads(), raises KeyError for backends that are not installed or registered
+def set_decoder(name):
+    if name not in DECODERS:
+        raise KeyError("JSON decoder '%s' is not available, choose from %s" % (name, sorted(DECODERS)))
+    _active["name"] = name
+
+
+def get_decoder_name():
+    return _active["name"]
+
+
+def loads(content):
+    return DECODERS[_active["name"]](content)
@@ -0,0 +1,103 @@
+import argparse
+import glob
+import os
+import re
+
+import numpy as np
+import numpy.ma as ma
+
+ERROR_CODE = 0.1  # convert_line's "could not read this book" value, masked out here
+BOVADA_INDEX = 4  # Bovada is always the 5th book listed
+BOVADA_FALLBACK_INDEX = 3
+MIN_BOOKS = BOVADA_INDEX + 1
+CONSENSUS_HEADER = "Date,Away-Name,Home-Name,OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout," \
+                   "MedianLine,MeanLine,LineStd,MeanPayout,BookCount\n"
+
+
+# games x books masked arrays of home lines and payouts, unreadable or missing books are masked
+def book_arrays(book_lines_per_game):
+    books = max([MIN_BOOKS] + [len(book_lines) for book_lines in book_lines_per_game])
+    padding = [np.nan, np.nan]
+    values = np.array([list(book_lines) + [padding] * (books - len(book_lines)) for book_lines in book_lines_per_game],
+                      dtype=float).reshape(len(book_lines_per_game), books, 2)
+    lines, payouts = values[:, :, 0], values[:, :, 1]
+    mask = np.isnan(lines) | (lines == ERROR_CODE) | np.isnan(payouts)
+    return ma.masked_array(lines, mask=mask), ma.masked_array(payouts, mask=mask)
+
+
+# Best (sign=1) or worst (sign=-1) line for the home team per game, payout breaks ties the same way
+#  Matches line_scraper._best_line/_worst_line, games without a readable book come back masked
+def _extreme_line(lines, payouts, sign):
+    signed_lines = np.where(lines.mask, -np.inf, lines.data * sign)
+    target = signed_lines.max(axis=1)
+    at_target = (signed_lines == target[:, None]) & ~lines.mask
+    signed_payouts = np.where(at_target, payouts.data * sign, -np.inf)
+    best_payout = signed_payouts.max(axis=1)
+    empty = lines.mask.all(axis=1)
+    return ma.masked_array(target * sign, mask=empty), ma.masked_array(best_payout * sign, mask=empty)
+
+
+# Every per-game line statistic in one pass over the games x books arrays
+def summarize(lines, payouts):
+    opt_line, opt_payout = _extreme_line(lines, payouts, 1)
+    pes_line, pes_payout = _extreme_line(lines, payouts, -1)
+    use_fallback = lines.mask[:, BOVADA_INDEX]
+    bov_line = ma.where(use_fallback, lines[:, BOVADA_FALLBACK_INDEX], lines[:, BOVADA_INDEX])
+    bov_payout = ma.where(use_fallback, payouts[:, BOVADA_FALLBACK_INDEX], payouts[:, BOVADA_INDEX])
+    return {"OptLine": opt_line, "OptPayout": opt_payout,
+            "BovLine": bov_line, "BovPayout": bov_payout,
+            "PesLine": pes_line, "PesPayout": pes_payout,
+            "MedianLine": ma.median(lines, axis=1),
+            "MeanLine": lines.mean(axis=1),
+            "LineStd": lines.std(axis=1),
+            "MeanPayout": payouts.mean(axis=1),
+            "BookCount": lines.count(axis=1)}
+
+
+# A masked column as strings, masked entries replaced by code, converted in bulk rather than element by element
+def _column_strings(column, code):
+    masked = ma.getmaskarray(column).tolist()
+    return [code if m else str(v) for v, m in zip(ma.getdata(column).tolist(), masked)]
+
+
+# "OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout" per game, identical to line_scraper.parse_lines
+#  including its -999/0.1/999 codes for missing values
+def line_strings(book_lines_per_game):
+    if not book_lines_per_game:
+        return []
+    summary = summarize(*book_arrays(book_lines_per_game))
+    columns = [_column_strings(summary[name], code) for name, code in (("OptLine", "-999"), ("OptPayout", "-999"),
+                                                                       ("BovLine", "0.1"), ("BovPayout", "0.1"),
+                                                                       ("PesLine", "999"), ("PesPayout", "999"))]
+    return [",".join(values) for values in zip(*columns)]
+
+
+# Consensus csv rows for one date's GameLines, missing statistics are written as NaN
+def consensus_rows(string_date, games):
+    if not games:
+        return []
+    summary = summarize(*book_arrays([game.book_lines or [] for game in games]))
+    columns = [_column_strings(summary[name], "NaN") for name in CONSENSUS_HEADER.strip().split(",")[3:]]
+    return ["%s,%s,%s,%s\n" % (string_date, game.away_team, game.home_team, ",".join(values))
+            for game, values in zip(games, zip(*columns))]
+
+
+if __name__ == "__main__":
+    import line_scraper
+
+    parser = argparse.ArgumentParser(description="Recompute line features for a directory of saved SBR pages")
+    parser.add_argument("pages_dir", help="Pages named *_YYYYMMDD.html, e.g. ncaa-basketball_20180102.html")
+    parser.add_argument("output")
+    parser.add_argument("--nba", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.output, 'w') as ofile:
+        ofile.write(CONSENSUS_HEADER)
+        for path in sorted(glob.glob(os.path.join(args.pages_dir, "*.html"))):
+            match = re.search(r"(\d{4})(\d{2})(\d{2})\.html$", path)
+            if match is None:
+                continue
+            with open(path, 'rb') as ifile:
+                games = line_scraper.parse_date_page_games(ifile.read(), ncaab=not args.nba)
+            if games:
+                ofile.writelines(consensus_rows("%s-%s-%s" % (match.group(2), match.group(3), match.group(1)), games))
@@ -0,0 +1,153 @@
+import argparse
+import datetime
+import hashlib
+import os
+import time
+
+import requests
+
+import fetcher
+import line_features
+import line_scraper
+import metrics
+
+MOVEMENT_HEADER = "Timestamp,Date,Away-Name,Home-Name,Book,Line,Payout\n"  # Book is the column on the page, Bovada is 4
+DEFAULT_INTERVAL = 60.0  # Seconds between polls
+
+
+# (away, home, book index) -> (line, payout) for one parsed page, unreadable books are left out so a cell that
+#  fails to parse for one poll is not reported as a move
+def page_snapshot(games):
+    snapshot = dict()
+    for away_team, home_team, book_lines in games:
+        for book, (line, payout) in enumerate(book_lines):
+            if line != line_features.ERROR_CODE and payout != line_features.ERROR_CODE:
+                snapshot[(away_team, home_team, book)] = (line, payout)
+    return snapshot
+
+
+# Movement records [(away, home, book, line, payout)] for every book whose line or payout is new or different
+def diff_snapshots(previous, current):
+    return [key + value for key, value in sorted(current.items()) if previous.get(key) != value]
+
+
+# Latest (line, payout) per (away, home, book) of one date in an existing movement log, so a restarted poller
+#  only records what moved since it stopped
+def read_latest(log_path, date):
+    latest = dict()
+    if not os.path.isfile(log_path):
+        return latest
+    date_string = date.isoformat()
+    with open(log_path) as ifile:
+        ifile.readline()
+        for line in ifile:
+            fields = line.rstrip("\n").split(",")
+            if len(fields) == 7 and fields[1] == date_string:
+                latest[(fields[2], fields[3], int(fields[4]))] = (float(fields[5]), float(fields[6]))
+    return latest
+
+
+class LinePoller(object):
+    """Polls one date's SBR page and appends every book line that moved since the previous poll to a csv log
+
+    Each poll is a conditional GET (If-None-Match / If-Modified-Since) so an unchanged page costs a 304 and no
+    body. A 200 whose body hashes the same as the last one is not parsed, and a changed page is diffed book by
+    book against the last snapshot so only (game, book, line, payout, timestamp) records that changed are logged.
+    """
+
+    def __init__(self, date, log_path, ncaab=False):
+        self.date = date
+        self.url = line_scraper.format_date(date.day, date.month, date.year, ncaab)[0]
+        self.log_path = log_path
+        self.ncaab = ncaab
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+        self.snapshot = read_latest(log_path, date)
+
+    def _conditional_headers(self):
+        headers = dict()
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def _append(self, records, timestamp):
+        new_file = not os.path.isfile(self.log_path)
+        with open(self.log_path, 'a') as ofile:
+            if new_file:
+                ofile.write(MOVEMENT_HEADER)
+            for away_team, home_team, book, line, payout in records:
+                ofile.write("%s,%s,%s,%s,%d,%s,%s\n" % (timestamp, self.date.isoformat(), away_team, home_team, book,
+                                                          line, payout))
+
+    # One poll, returns the movement records it logged
+    def poll(self):
+        metrics.count("line_polls")
+        try:
+            response = fetcher.get(self.url, date=self.date, headers=self._conditional_headers())
+        except requests.exceptions.ConnectionError:
+            metrics.count("poll_connection_errors")
+            return []
+        self.etag = response.headers.get("ETag", self.etag)
+        self.last_modified = response.headers.get("Last-Modified", self.last_modified)
+        if response.status_code == 304:
+            metrics.count("poll_not_modified")
+            return []
+        if response.status_code != 200:
+            metrics.count("poll_bad_status")
+            return []
+        content_hash = hashlib.sha1(response.content).hexdigest()
+        if content_hash == self.content_hash:
+            metrics.count("poll_unchanged_content")
+            return []
+        self.content_hash = content_hash
+        with metrics.timer("parse"):
+            games = line_scraper.parse_date_page_book_lines(response.content, self.ncaab)
+        if games is None:
+            metrics.count("pages_without_lines")
+            return []
+        current = page_snapshot(games)
+        records = diff_snapshots(self.snapshot, current)
+        self.snapshot.update(current)  # Books missing from this page keep their last known line
+        timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._append(records, timestamp)
+        metrics.count("line_movements", len(records))
+        return records
+
+
+# Poll date's page every interval seconds until max_polls polls are done or until (a datetime) passes,
+#  Ctrl-C stops the loop after the last complete poll. Returns how many movement records were logged
+def poll_lines(date, log_path, ncaab=False, interval=DEFAULT_INTERVAL, max_polls=None, until=None, show=False):
+    poller = LinePoller(date, log_path, ncaab)
+    polls, logged = 0, 0
+    try:
+        while (max_polls is None or polls < max_polls) and (until is None or datetime.datetime.now() < until):
+            started = time.monotonic()
+            records = poller.poll()
+            polls += 1
+            logged += len(records)
+            if show:
+                print("%s poll %d: %d lines moved" % (datetime.datetime.now().strftime("%H:%M:%S"), polls,
+                                                      len(records)))
+            if max_polls is None or polls < max_polls:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    return logged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Log SBR line movement for one date's slate")
+    parser.add_argument("log", help="Movement log csv, appended to")
+    parser.add_argument("--date", default=None, help="YYYY-MM-DD, defaults to today")
+    parser.add_argument("--ncaab", action="store_true")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between polls")
+    parser.add_argument("--polls", type=int, default=None, help="Stop after this many polls")
+    args = parser.parse_args()
+
+    date = datetime.datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else datetime.date.today()
+    logged = poll_lines(date, args.log, ncaab=args.ncaab, interval=args.interval, max_polls=args.polls, show=True)
+    print("%d movement records logged, %s" % (logged, dict((k, v) for k, v in metrics.snapshot()["counters"].items()
+                                                           if "poll" in k or k == "bytes_downloaded")))
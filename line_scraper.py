@@ -1,8 +1,25 @@
+import argparse
+import calendar
+import datetime
 import requests
+from collections import namedtuple
 import unicodedata
 import pathlib
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
 from shutil import copyfile
+import fetcher
+import line_features
+import metrics
+import pipeline
+import raw_archive
+import response_cache
+from sinks import CsvSink, ParquetSink
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    etree = None
 
 URL_TEST = "https://www.sportsbookreview.com/betting-odds/nba-basketball/1st-half/?date=20171203"
 URL_TEMPLATE = "https://www.sportsbookreview.com/betting-odds/nba-basketball/1st-half/?date=%s%s%s"
@@ -10,6 +27,15 @@ URL_TEMPLATE = "https://www.sportsbookreview.com/betting-odds/nba-basketball/1st
 NCAAB_URL_TEST = "https://www.sportsbookreview.com/betting-odds/ncaa-basketball/?date=20180102"
 NCAAB_URL_TEMPLATE = "https://www.sportsbookreview.com/betting-odds/ncaa-basketball/?date=%s%s%s"
 
+EVENT_LINES_STRAINER = SoupStrainer(name="div", class_="eventLines")
+
+NBA_HEADER = "Date,Away-Name,Away-FinalScore,Away-1stQuarter,Away-2ndQuarter,Away-3rdQuarter,Away-4thQuarter," \
+             "Home-Name,Home-FinalScore,Home-1stQuarter,Home-2ndQuarter,Home-3rdQuarter,Home4thQuarter," \
+             "OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout,Away-B2B-Indicator\n"
+NCAAB_HEADER = "Date,Away-Name,Away-APRank,Away-FinalScore,Away-1stHalf,Away-2ndHalf," \
+               "Home-Name,Home-APRank,Home-FinalScore,Home-1stHalf,Home-2ndHalf," \
+               "OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout,Away-B2B-Indicator\n"
+
 
 # Getting a team's scoreline of "Final,1stQ,2ndQ,3rdQ,4thQ," or "Final,1stH,2ndH" for ncaab=True
 def parse_scores(score_div, ncaab=False):
@@ -18,6 +44,7 @@ def parse_scores(score_div, ncaab=False):
     if len(q_scores) >= max_length:
         output_string = ",".join([e.get_text() for e in q_scores[:max_length]])
     else:
+        metrics.count("score_parse_errors")
         print("Incorrect length or unexpected arguments for quarter scores")
         output_string = ",".join(["-1"] * max_length)
     return output_string
@@ -27,24 +54,29 @@ def parse_scores(score_div, ncaab=False):
 def convert_line(line):
     spreads = line.find_all(name="div")
     if len(spreads) != 2:
+        metrics.count("line_parse_errors")
         print("Line Parse Error")
         home_spread = [0.1,0.1]
     else:
+        home_spread = _convert_line_text(spreads[1].get_text())
+    return home_spread
+
+
+# Home spread cell text such as "-3\u00bd -110" into [-3.5, -110.0], 0.1 codes when it cannot be read
+def _convert_line_text(text):
+    try:
+        text = unicodedata.normalize("NFKD", text)
+        line = text.split(" ")[0]
+        line = line.replace("1%s2" % u'\u2044', '.5')
+        payout = text.split(" ")[1]
         try:
-            text = unicodedata.normalize("NFKD", spreads[1].get_text())
-            line = text.split(" ")[0]
-            line = line.replace("1%s2" % u'\u2044', '.5')
-            payout = text.split(" ")[1]
-            try:
-                line = float(line)
-                payout = float(payout)
-            except ValueError:
-                line, payout = 0.1, 0.1
-        except IndexError:
+            line = float(line)
+            payout = float(payout)
+        except ValueError:
             line, payout = 0.1, 0.1
-
-        home_spread = [line, payout]
-    return home_spread
+    except IndexError:
+        line, payout = 0.1, 0.1
+    return [line, payout]
 
 
 # Among the 10 books, determine which line most favors the home team
@@ -74,7 +106,10 @@ def _worst_line(lines):
 
 # Convert each book cell into optimistic, bovada, and pessimistic lines
 def parse_lines(line_list):
-    lines = [convert_line(line) for line in line_list]
+    return _summarize_lines([convert_line(line) for line in line_list])
+
+
+def _summarize_lines(lines):
     optimistic_line = _best_line(lines)
     bovada_line = [str(e) for e in lines[4]]     # Bovada is always the 5th book listed (index = 4)
     if bovada_line[0] == "0.1":
@@ -95,8 +130,17 @@ def _parse_team(cell_text, ncaab=False):
     return return_name, return_rank
 
 
+# Fields of one game row with every book's [home line, home payout] kept, book_lines is None if unreadable
+GameLines = namedtuple("GameLines", ["away_team", "away_rank", "away_scores", "home_team", "home_rank",
+                                     "home_scores", "book_lines"])
+
+
 # Given the game row, return the useful data in a csv string for output
 def parse_game(game_div, ncaab=False):
+    return _format_game_lines(_parse_game_fields(game_div, ncaab), ncaab)
+
+
+def _parse_game_fields(game_div, ncaab=False):
     score_div = game_div.find(name="div", class_="scorebox odd")
     if score_div is None:
         score_div = game_div.find(name="div", class_="scorebox")
@@ -105,6 +149,7 @@ def parse_game(game_div, ncaab=False):
         away_scores = parse_scores(scores[0], ncaab)
         home_scores = parse_scores(scores[1], ncaab)
     except AttributeError:
+        metrics.count("missing_scores")
         away_scores = "-1,-1,-1,-1,-1"
         home_scores = "-1,-1,-1,-1,-1"
 
@@ -114,14 +159,27 @@ def parse_game(game_div, ncaab=False):
         away_team, away_rank = _parse_team(teams[0].get_text(), ncaab)
         home_team, home_rank = _parse_team(teams[1].get_text(), ncaab)
     except AttributeError:
+        metrics.count("missing_teams")
         away_team, away_rank = "NaN", "NaN"
         home_team, home_rank = "NaN", "NaN"
 
     lines = game_div.find_all(name="div", class_="el-div eventLine-book")
     try:
-        line_string = parse_lines(lines)
+        book_lines = [convert_line(line) for line in lines]
     except AttributeError:
-        line_string = "0.1,0.1,0.1,0.1,0.1,0.1"
+        metrics.count("missing_book_lines")
+        book_lines = None
+    return GameLines(away_team, away_rank, away_scores, home_team, home_rank, home_scores, book_lines)
+
+
+def _format_game_lines(game, ncaab=False, line_string=None):
+    if line_string is None:
+        line_string = _summarize_lines(game.book_lines) if game.book_lines is not None else "0.1,0.1,0.1,0.1,0.1,0.1"
+    return _format_game(game.away_team, game.away_rank, game.away_scores, game.home_team, game.home_rank,
+                        game.home_scores, line_string, ncaab)
+
+
+def _format_game(away_team, away_rank, away_scores, home_team, home_rank, home_scores, line_string, ncaab=False):
     if not ncaab:
         game_string = "%s,%s,%s,%s,%s" % (away_team, away_scores, home_team, home_scores, line_string)
     else:
@@ -130,6 +188,153 @@ def parse_game(game_div, ncaab=False):
     return game_string, away_team, home_team
 
 
+# Fast path used when lxml is installed: the page is parsed by lxml directly and every lookup is a precompiled
+#  XPath mirroring the BeautifulSoup searches above (class_="a b" is an exact attribute match, class_="a" a token
+#  match), so the rows are identical to parse_game's
+def _has_class(token):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % token
+
+
+if etree is not None:
+    _XP_EVENT_TABLES = etree.XPath("//div[%s]" % _has_class("eventLines"))
+    _XP_GAMES = etree.XPath(".//div[@class='event-holder holder-complete']")
+    _XP_ANY_GAMES = etree.XPath(".//div[%s]" % _has_class("event-holder"))  # Scheduled and live games too
+    _XP_SCOREBOX_ODD = etree.XPath(".//div[@class='scorebox odd']")
+    _XP_SCOREBOX = etree.XPath(".//div[%s]" % _has_class("scorebox"))
+    _XP_SCORE_PERIODS = etree.XPath(".//div[%s]" % _has_class("score-periods"))
+    _XP_SPANS = etree.XPath(".//span")
+    _XP_TEAM_DIV = etree.XPath(".//div[@class='el-div eventLine-team']")
+    _XP_TEAM_VALUES = etree.XPath(".//div[%s]" % _has_class("eventLine-value"))
+    _XP_BOOKS = etree.XPath(".//div[@class='el-div eventLine-book']")
+    _XP_DIVS = etree.XPath(".//div")
+    _XP_TEXT = etree.XPath("string()")
+
+
+# eventLines containers of a date page, an empty or comment-only body has none like the BeautifulSoup path
+def _event_tables_lxml(content):
+    if isinstance(content, bytes):
+        content = UnicodeDammit(content, is_html=True).unicode_markup
+    try:
+        return _XP_EVENT_TABLES(lxml.html.fromstring(content))
+    except etree.ParserError:  # "Document is empty"
+        return []
+
+
+def _parse_scores_lxml(score_div, ncaab=False):
+    q_scores = _XP_SPANS(score_div)
+    max_length = 3 if ncaab else 5
+    if len(q_scores) >= max_length:
+        return ",".join([_XP_TEXT(e) for e in q_scores[:max_length]])
+    metrics.count("score_parse_errors")
+    print("Incorrect length or unexpected arguments for quarter scores")
+    return ",".join(["-1"] * max_length)
+
+
+def _convert_line_lxml(book):
+    spreads = _XP_DIVS(book)
+    if len(spreads) != 2:
+        metrics.count("line_parse_errors")
+        print("Line Parse Error")
+        return [0.1, 0.1]
+    return _convert_line_text(_XP_TEXT(spreads[1]))
+
+
+def _parse_game_fields_lxml(game_div, ncaab=False):
+    score_divs = _XP_SCOREBOX_ODD(game_div) or _XP_SCOREBOX(game_div)
+    if score_divs:
+        scores = _XP_SCORE_PERIODS(score_divs[0])
+        away_scores = _parse_scores_lxml(scores[0], ncaab)
+        home_scores = _parse_scores_lxml(scores[1], ncaab)
+    else:
+        metrics.count("missing_scores")
+        away_scores = "-1,-1,-1,-1,-1"
+        home_scores = "-1,-1,-1,-1,-1"
+
+    team_divs = _XP_TEAM_DIV(game_div)
+    if team_divs:
+        teams = _XP_TEAM_VALUES(team_divs[0])
+        away_team, away_rank = _parse_team(_XP_TEXT(teams[0]), ncaab)
+        home_team, home_rank = _parse_team(_XP_TEXT(teams[1]), ncaab)
+    else:
+        metrics.count("missing_teams")
+        away_team, away_rank = "NaN", "NaN"
+        home_team, home_rank = "NaN", "NaN"
+
+    book_lines = [_convert_line_lxml(book) for book in _XP_BOOKS(game_div)]
+    return GameLines(away_team, away_rank, away_scores, home_team, home_rank, home_scores, book_lines)
+
+
+# Original full-tree parse of a date page, returns [(game_string, away_team, home_team)] or None without a table
+def parse_date_page_soup(content, ncaab=False):
+    bs = BeautifulSoup(content)
+    event_table = bs.find_all(name="div", class_="eventLines")
+    if len(event_table) < 1:
+        return None
+    games = event_table[0].find_all(name="div", class_="event-holder holder-complete")
+    return [parse_game(game, ncaab) for game in games]
+
+
+# GameLines for every game on a date page (None without a table), through lxml XPath when available,
+#  otherwise a BeautifulSoup tree that only builds the eventLines container
+def parse_date_page_games(content, ncaab=False):
+    if etree is None:
+        metrics.count("parse_fallbacks")  # lxml missing, the slower BeautifulSoup path is used
+        bs = BeautifulSoup(content, "html.parser", parse_only=EVENT_LINES_STRAINER)
+        event_table = bs.find_all(name="div", class_="eventLines")
+        if len(event_table) < 1:
+            return None
+        games = event_table[0].find_all(name="div", class_="event-holder holder-complete")
+        return [_parse_game_fields(game, ncaab) for game in games]
+    event_tables = _event_tables_lxml(content)
+    if len(event_tables) < 1:
+        return None
+    return [_parse_game_fields_lxml(game, ncaab) for game in _XP_GAMES(event_tables[0])]
+
+
+# [(away_team, home_team, book_lines)] for every game on a date page whatever its status, None without a table
+#  Only the team names and book cells are read, which is all line_poller.py needs from a slate still being played
+def parse_date_page_book_lines(content, ncaab=False):
+    if etree is None:
+        bs = BeautifulSoup(content, "html.parser", parse_only=EVENT_LINES_STRAINER)
+        event_table = bs.find_all(name="div", class_="eventLines")
+        if len(event_table) < 1:
+            return None
+        games = []
+        for game in event_table[0].find_all(name="div", class_="event-holder"):
+            team_div = game.find(name="div", class_="el-div eventLine-team")
+            if team_div is None:
+                continue
+            teams = team_div.find_all(name="div", class_="eventLine-value")
+            games.append((_parse_team(teams[0].get_text(), ncaab)[0], _parse_team(teams[1].get_text(), ncaab)[0],
+                          [convert_line(book) for book in game.find_all(name="div", class_="el-div eventLine-book")]))
+        return games
+    event_tables = _event_tables_lxml(content)
+    if len(event_tables) < 1:
+        return None
+    games = []
+    for game in _XP_ANY_GAMES(event_tables[0]):
+        team_divs = _XP_TEAM_DIV(game)
+        if not team_divs:
+            continue
+        teams = _XP_TEAM_VALUES(team_divs[0])
+        games.append((_parse_team(_XP_TEXT(teams[0]), ncaab)[0], _parse_team(_XP_TEXT(teams[1]), ncaab)[0],
+                      [_convert_line_lxml(book) for book in _XP_BOOKS(game)]))
+    return games
+
+
+# Same result as parse_date_page_soup, with batched=True the date's book lines are summarized in one
+#  vectorized pass by line_features instead of game by game
+def parse_date_page(content, ncaab=False, batched=False):
+    games = parse_date_page_games(content, ncaab)
+    if games is None:
+        return None
+    if not batched:
+        return [_format_game_lines(game, ncaab) for game in games]
+    line_strings = line_features.line_strings([game.book_lines or [] for game in games])
+    return [_format_game_lines(game, ncaab, line_string if game.book_lines is not None else None)
+            for game, line_string in zip(games, line_strings)]
+
+
 # Converting a numerical date into the url and string date
 def format_date(day, month, year, ncaab=False):
     if len(str(day)) < 2:
@@ -143,55 +348,148 @@ def format_date(day, month, year, ncaab=False):
     return date_url, "%s-%s-%s" % (month, day, year)
 
 
-# Given a date, write all csv-lines of game spreads
-def get_date_lines(day, month, year, output_filepath, prev_teams, ncaab=False, show=False):
+# Download (and archive) one date's page, None when it could not be fetched
+def fetch_date_page(url, date, ncaab=False):
+    try:
+        content = response_cache.get_content(url, date=date)
+    except requests.exceptions.ConnectionError:  # Already recorded in the dead-letter file when one is configured
+        metrics.count("page_connection_errors")
+        print("ConnectionError with url from date: %s" % date.strftime("%m-%d-%Y"))
+        return None
+    raw_archive.archive("SBR", "NCAAB" if ncaab else "NBA", date.isoformat(), date, url, content)
+    return content
+
+
+# Parse stage of the pipeline, job is (url, date, ncaab) and runs in a worker process
+#  Returns the page's [(game_string, away_team, home_team)], [] for a page without a lines table
+def parse_date_job(job, content):
+    url, date, ncaab = job
+    with metrics.timer("parse"):
+        parsed_games = parse_date_page(content, ncaab, batched=True)
+    if parsed_games is None:
+        metrics.count("pages_without_lines")
+        print("Error with url from date: %s" % date.strftime("%m-%d-%Y"))
+        return []
+    return parsed_games
+
+
+# Output rows of one date's parsed games and the teams that played, the away team is flagged as on a back-to-back
+#  when it is in prev_teams (a set, schedule_index.py recomputes the flag for a whole season in any date order)
+def _date_rows(parsed_games, string_date, prev_teams, show=False):
+    rows, todays_teams = [], set()
+    for game_string, away_team, home_team in parsed_games:
+        away_b2b_indicator = int(away_team in prev_teams)
+        todays_teams.add(away_team)
+        todays_teams.add(home_team)
+        output_string = "%s,%s,%d\n" % (string_date, game_string, away_b2b_indicator)
+        if show:
+            print(output_string.replace("\n", ""))
+        rows.append(output_string)
+    return rows, todays_teams
+
+
+# Given a date, write all csv-lines of game spreads, to output_filepath unless another sink is given
+def get_date_lines(day, month, year, output_filepath, prev_teams, ncaab=False, show=False, sink=None):
     url, string_date = format_date(day, month, year, ncaab)
-    todays_teams = []
-    with open(output_filepath, 'a') as ofile:
-        r = requests.get(url)
-        bs = BeautifulSoup(r.content)
-        event_table = bs.find_all(name="div", class_="eventLines")
-        if len(event_table) >= 1:
-            games = event_table[0].find_all(name="div", class_="event-holder holder-complete")
-            for game in games:
-                game_string, away_team, home_team = parse_game(game, ncaab)
-                away_b2b_indicator = int(away_team in prev_teams)
-                todays_teams.append(away_team)
-                todays_teams.append(home_team)
-                output_string = "%s,%s,%d\n" % (string_date, game_string, away_b2b_indicator)
-                if show:
-                    print(output_string.replace("\n", ""))
-                ofile.write(output_string)
-        else:
-            print("Error with url from date: %s" % string_date)
+    own_sink = sink is None
+    if own_sink:
+        sink = CsvSink(output_filepath)
+    try:
+        content = fetch_date_page(url, datetime.date(year, month, day), ncaab)
+        if content is None:
+            return set()
+        rows, todays_teams = _date_rows(parse_date_job((url, datetime.date(year, month, day), ncaab), content),
+                                        string_date, prev_teams, show=show)
+        for output_string in rows:
+            sink.write_row(output_string)
+    finally:
+        if own_sink:
+            sink.close()
     return todays_teams
 
 
+# Same rows as calling get_date_lines day by day, but pages download on fetch_workers threads while earlier ones
+#  are parsed on a pool of processes, and each date is written in one batch as soon as it and every date before
+#  it is parsed. prev_teams are the teams of the day before start_day, the teams of the last date are returned
+#  On Ctrl-C every date parsed so far is still written
+def write_lines_for_date_range(start_day, end_day, month, year, output_filepath, prev_teams, ncaab=False, show=False,
+                               sink=None, fetch_workers=4, processes=None, requests_per_second=None):
+    rate_limiter = fetcher.HostRateLimiter(requests_per_second)
+    previous = {"date": datetime.date(year, month, start_day) - datetime.timedelta(days=1), "teams": prev_teams}
+    own_sink = sink is None
+    if own_sink:
+        sink = CsvSink(output_filepath)
+
+    def fetch(job):
+        rate_limiter.wait(job[0])
+        return fetch_date_page(job[0], job[1], job[2])
+
+    def write_group(date, results, complete):
+        # A date whose page failed, or that is missing after Ctrl-C, breaks the back-to-back chain
+        prev_teams = previous["teams"] if previous["date"] == date - datetime.timedelta(days=1) else set()
+        rows, todays_teams = _date_rows(results[0] or [], format_date(date.day, date.month, date.year, ncaab)[1],
+                                        prev_teams, show=show)
+        sink.write_rows(rows)
+        previous["date"], previous["teams"] = date, todays_teams
+
+    groups = [(datetime.date(year, month, day), [(format_date(day, month, year, ncaab)[0], datetime.date(year, month, day),
+                                                  ncaab)])
+              for day in range(start_day, end_day + 1)]
+    try:
+        pipeline.run_pipeline(groups, fetch, parse_date_job, write_group, fetch_workers=fetch_workers,
+                              processes=processes)
+    finally:
+        if own_sink:
+            sink.close()
+    return previous["teams"] if previous["date"] == datetime.date(year, month, end_day) else set()
+
+
+# Re-scrape only the dates whose pages were recorded in a dead-letter file
+#  The previous day is not re-fetched, so Away-B2B-Indicator is 0 on retried rows until schedule_index.py --fix-b2b
+def retry_failed_dates(dead_letter_filepath, output_filepath, ncaab=False, show=False, sink=None):
+    fetcher.configure(dead_letter_path=dead_letter_filepath)
+    for url, date in fetcher.pop_dead_letters(dead_letter_filepath):
+        if date is not None:
+            get_date_lines(date.day, date.month, date.year, output_filepath, set(), ncaab, show=show, sink=sink)
+
+
 if __name__ == "__main__":
     ncaab = True
     start_year = 2011
-    leap_year = 1  # Set this to 1 if start_year+1 is a leap year
+    cache_dir = None  # Set to a directory to keep every downloaded page, reruns then skip the network
+    replay = False  # With a cache_dir, only read from the cache and never touch the network
+    parquet_root = None  # Set to a directory to write typed Parquet partitions instead of the csv
+    archive_dir = None  # Set to a directory to keep every raw page for offline re-extraction (raw_archive.py)
+    prometheus_path = None  # Set to a .prom path for node_exporter's textfile collector
     output_filepath = "C:/Users/robsc/Documents/Data and Stats/ScrapedData/NCAABB/SBRLines/GameSpreads%s%s.csv" % (str(start_year)[-2:], str(start_year+1)[-2:])
-
-    # If the data file is not detected, write a header for a new file
-    if not pathlib.Path(output_filepath).is_file():
-        with open(output_filepath, 'w') as ofile:
-            if not ncaab:
-                ofile.write("Date,Away-Name,Away-FinalScore,Away-1stQuarter,Away-2ndQuarter,Away-3rdQuarter,Away-4thQuarter,"
-                            "Home-Name,Home-FinalScore,Home-1stQuarter,Home-2ndQuarter,Home-3rdQuarter,Home4thQuarter,"
-                            "OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout,Away-B2B-Indicator\n")
-            else:
-                ofile.write(
-                    "Date,Away-Name,Away-APRank,Away-FinalScore,Away-1stHalf,Away-2ndHalf,"
-                    "Home-Name,Home-APRank,Home-FinalScore,Home-1stHalf,Home-2ndHalf,"
-                    "OptLine,OptPayout,BovLine,BovPayout,PesLine,PesPayout,Away-B2B-Indicator\n")
+    dead_letter_filepath = output_filepath.replace(".csv", "_failed.tsv")
+
+    parser = argparse.ArgumentParser(description="Scrape SBR game lines for a season")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only re-scrape the dates recorded in the dead-letter file of a previous run")
+    args = parser.parse_args()
+
+    if cache_dir is not None:
+        response_cache.configure(cache_dir, replay=replay)
+    if archive_dir is not None:
+        raw_archive.configure(archive_dir)
+    fetcher.configure(dead_letter_path=dead_letter_filepath)
+
+    # Parquet needs the header every run, the csv only when the data file is not detected
+    header = NCAAB_HEADER if ncaab else NBA_HEADER
+    if parquet_root is not None:
+        sink = ParquetSink(parquet_root, "sbr", "NCAAB" if ncaab else "NBA", header=header)
+    else:
+        sink = CsvSink(output_filepath)
+        if not pathlib.Path(output_filepath).is_file():
+            sink.write_header(header)
 
     # Dates to loop through for the nba, each tuple is a month of the NBA season
     # nba_date_tuples = [(start_year, 10, 30, 31),  # Typically NBA Only, set start_day to after preseason ends
     #                (start_year, 11, 1, 30),
     #                (start_year, 12, 1, 31),
     #                (start_year+1, 1, 1, 31),
-    #                (start_year+1, 2, 1, 28 + leap_year),
+    #                (start_year+1, 2, 1, calendar.monthrange(start_year+1, 2)[1]),
     #                (start_year+1, 3, 1, 31),
     #                (start_year+1, 4, 1, 30),
     #                (start_year+1, 5, 1, 31),  # NBA Only
@@ -204,18 +502,28 @@ if __name__ == "__main__":
     ncaab_date_tuples = [(start_year, 11, 1, 30),
                     (start_year, 12, 1, 31),
                     (start_year+1, 1, 1, 31),
-                    (start_year+1, 2, 1, 28 + leap_year),
+                    (start_year+1, 2, 1, calendar.monthrange(start_year+1, 2)[1]),
                     (start_year+1, 3, 1, 31),
                     (start_year+1, 4, 1, 10)]
 
-    days_teams = []
+    days_teams = set()
     date_tuples = ncaab_date_tuples if ncaab else nba_date_tuples
 
-    for date_tuple in date_tuples:
-        year = date_tuple[0]
-        month = date_tuple[1]
-        start_day = date_tuple[2]
-        end_day = date_tuple[3]
-        for day in range(start_day, end_day+1):
-            days_teams = get_date_lines(day, month, year, output_filepath, days_teams, ncaab, show=True)
-
+    try:
+        if args.retry_failed:
+            retry_failed_dates(dead_letter_filepath, output_filepath, ncaab, show=True, sink=sink)
+        else:
+            for date_tuple in date_tuples:
+                year = date_tuple[0]
+                month = date_tuple[1]
+                start_day = date_tuple[2]
+                end_day = date_tuple[3]
+                days_teams = write_lines_for_date_range(start_day, end_day, month, year, output_filepath, days_teams,
+                                                        ncaab, show=True, sink=sink)
+    finally:  # On Ctrl-C the rows already handed to the sink are still written out
+        sink.close()
+
+    run_info = {"league": "NCAAB" if ncaab else "NBA", "source": "SBR", "season": "%s%s" % (str(start_year)[-2:], str(start_year+1)[-2:])}
+    metrics.write_report(output_filepath.replace(".csv", "_report.json"), extra=run_info)
+    if prometheus_path is not None:
+        metrics.write_prometheus(prometheus_path, labels={"league": run_info["league"], "source": "SBR"})
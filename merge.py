@@ -0,0 +1,273 @@
+import argparse
+import glob
+import os
+from collections import namedtuple
+
+import metrics
+from backfill import parse_season_range, season_output_path
+from sinks import CsvSink, ParquetSink, parse_row_date, row_columns
+
+# The columns of one game the join needs from either source, scores as ints or None when unknown
+JoinGame = namedtuple("JoinGame", ["home_name", "home_id", "home_score", "away_name", "away_id", "away_score"])
+
+JOIN_COLUMNS = ("Date", "Home-Name", "Home-id", "Home-FinalScore", "Away-Name", "Away-id", "Away-FinalScore")
+NO_LINES = "NaN"
+
+
+def _score(value):
+    try:
+        score = int(value)
+    except ValueError:
+        return None
+    return score if score >= 0 else None  # -1 is the scrapers' "could not parse"
+
+
+class TeamAliasIndex(object):
+    """SBR team name -> ESPN team id, learned from games both sources report with the same final score
+
+    Every match is a vote, so an alias picked up in one season is reused by the next and a one-off bad match is
+    outvoted. Stored as a "sbr_name espn_id votes espn_name" tsv, one index per league since ESPN reuses team ids
+    between the NBA and college.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.votes = dict()  # sbr_name -> {espn_id: votes}
+        self.espn_names = dict()  # espn_id -> shortDisplayName, only kept to make the file readable
+        if path is not None and os.path.isfile(path):
+            with open(path) as ifile:
+                for line in ifile:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) == 4:
+                        self.votes.setdefault(fields[0], dict())[fields[1]] = int(fields[2])
+                        self.espn_names[fields[1]] = fields[3]
+
+    def __len__(self):
+        return len(self.votes)
+
+    def vote(self, sbr_name, espn_id, espn_name):
+        candidates = self.votes.setdefault(sbr_name, dict())
+        candidates[espn_id] = candidates.get(espn_id, 0) + 1
+        self.espn_names[espn_id] = espn_name
+
+    # ESPN id with the most votes for an SBR name, None when unknown or tied
+    def resolve(self, sbr_name):
+        candidates = self.votes.get(sbr_name)
+        if not candidates:
+            return None
+        ranked = sorted(candidates.items(), key=lambda item: -item[1])
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return ranked[0][0]
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path + ".tmp", 'w') as ofile:
+            for sbr_name in sorted(self.votes):
+                for espn_id, votes in sorted(self.votes[sbr_name].items()):
+                    ofile.write("%s\t%s\t%d\t%s\n" % (sbr_name, espn_id, votes, self.espn_names.get(espn_id, "")))
+        os.replace(self.path + ".tmp", self.path)
+
+
+def _espn_game(fields, positions):
+    return JoinGame(fields[positions["Home-Name"]], fields[positions["Home-id"]],
+                    _score(fields[positions["Home-FinalScore"]]), fields[positions["Away-Name"]],
+                    fields[positions["Away-id"]], _score(fields[positions["Away-FinalScore"]]))
+
+
+# Column names of an ESPN file's rows, which for an NBA file written under the old header are fewer than it names
+def _espn_columns(espn_path):
+    with open(espn_path) as ifile:
+        columns = ifile.readline().strip().split(",")
+        first_row = ifile.readline()
+    return row_columns(columns, len(first_row.rstrip("\n").split(","))) if first_row else columns
+
+
+# Stream (date, [(row, JoinGame)]) for each run of consecutive rows sharing a date, the ESPN file is read once
+#  Rows that do not have one value per column are counted and skipped, a joined row has to line up with the header
+def _espn_date_groups(espn_path, columns):
+    positions = dict((c, columns.index(c)) for c in JOIN_COLUMNS)
+    with open(espn_path) as ifile:
+        ifile.readline()
+        date, group = None, []
+        for row in ifile:
+            fields = row.rstrip("\n").split(",")
+            if len(fields) != len(columns):
+                metrics.count("join_malformed_espn_rows")
+                continue
+            row_date = parse_row_date(fields[positions["Date"]])
+            if row_date != date and group:
+                yield date, group
+                group = []
+            date = row_date
+            group.append((row.rstrip("\n"), _espn_game(fields, positions)))
+        if group:
+            yield date, group
+
+
+# SBR rows of a season hashed by date as [(fields without the date, JoinGame)], a season is a few thousand
+#  short rows so this stays small while the wide ESPN file is streamed
+def _sbr_by_date(sbr_path):
+    by_date = dict()
+    with open(sbr_path) as ifile:
+        columns = ifile.readline().strip().split(",")
+        home, away = columns.index("Home-Name"), columns.index("Away-Name")
+        home_score, away_score = columns.index("Home-FinalScore"), columns.index("Away-FinalScore")
+        for row in ifile:
+            fields = row.rstrip("\n").split(",")
+            if len(fields) != len(columns):
+                metrics.count("join_malformed_sbr_rows")
+                continue
+            game = JoinGame(fields[home], None, _score(fields[home_score]), fields[away], None,
+                            _score(fields[away_score]))
+            by_date.setdefault(parse_row_date(fields[0]), []).append((fields[1:], game))
+    return columns[1:], by_date
+
+
+# Vote an alias for both teams of every ESPN game that exactly one SBR game of the date shares its final score
+#  with, in either orientation since neutral-site games can list the teams the other way round
+def learn_aliases(index, espn_games, sbr_games):
+    by_score = dict()
+    for game in sbr_games:
+        if game.home_score is not None and game.away_score is not None:
+            by_score.setdefault((game.home_score, game.away_score), []).append(game)
+    for game in espn_games:
+        if game.home_score is None or game.away_score is None or game.home_score == game.away_score:
+            continue
+        same = by_score.get((game.home_score, game.away_score), [])
+        swapped = by_score.get((game.away_score, game.home_score), [])
+        if len(same) + len(swapped) != 1:
+            continue
+        if same:
+            index.vote(same[0].home_name, game.home_id, game.home_name)
+            index.vote(same[0].away_name, game.away_id, game.away_name)
+        else:
+            index.vote(swapped[0].home_name, game.away_id, game.away_name)
+            index.vote(swapped[0].away_name, game.home_id, game.home_name)
+
+
+# (sbr fields, swapped) for each ESPN game of one date, None where SBR has no line for it
+#  SBR names go through the alias index, then an exact ESPN name on the same date, and games are found by a hash
+#  lookup on (home id, away id), or (away id, home id) for neutral-site games SBR lists the other way round
+def join_date(index, espn_games, sbr_rows):
+    by_ids = dict(((game.home_id, game.away_id), i) for i, game in enumerate(espn_games))
+    ids_by_name = dict()
+    for game in espn_games:
+        ids_by_name[game.home_name] = game.home_id
+        ids_by_name[game.away_name] = game.away_id
+    matches = [None] * len(espn_games)
+    for fields, game in sbr_rows:
+        home_id = index.resolve(game.home_name) or ids_by_name.get(game.home_name)
+        away_id = index.resolve(game.away_name) or ids_by_name.get(game.away_name)
+        position, swapped = by_ids.get((home_id, away_id)), False
+        if position is None:
+            position, swapped = by_ids.get((away_id, home_id)), True
+        if position is None or matches[position] is not None:
+            metrics.count("join_unmatched_sbr_games")
+            continue
+        matches[position] = (fields, swapped)
+    return matches
+
+
+# Write one combined table, every ESPN row followed by its game's SBR columns (prefixed "SBR-") and SBR-Swapped,
+#  NaN when SBR has no line for the game. The ESPN half of the header is the rows' own columns, see _espn_columns.
+#  Aliases learned along the way are added to index
+def merge_season(espn_path, sbr_path, sink, index):
+    sbr_columns, sbr_by_date = _sbr_by_date(sbr_path)
+    espn_columns = _espn_columns(espn_path)
+    sink.write_header("%s,%s,SBR-Swapped\n" % (",".join(espn_columns), ",".join("SBR-" + c for c in sbr_columns)))
+    no_lines = ",".join([NO_LINES] * (len(sbr_columns) + 1))
+    joined, total = 0, 0
+    for date, group in _espn_date_groups(espn_path, espn_columns):
+        espn_games = [game for _, game in group]
+        sbr_rows = sbr_by_date.get(date, [])
+        learn_aliases(index, espn_games, [game for _, game in sbr_rows])
+        rows = []
+        for (row, _), match in zip(group, join_date(index, espn_games, sbr_rows)):
+            if match is None:
+                rows.append("%s,%s\n" % (row, no_lines))
+            else:
+                rows.append("%s,%s,%d\n" % (row, ",".join(match[0]), int(match[1])))
+                joined += 1
+        sink.write_rows(rows)
+        total += len(rows)
+    metrics.count("join_matched_games", joined)
+    metrics.count("join_unmatched_espn_games", total - joined)
+    return joined
+
+
+# {schema id: path} of the versioned files stat_plans.SchemaRouter wrote next to an ESPN season file, the games
+#  whose stat list did not match the season's header
+def versioned_espn_paths(espn_path):
+    root, extension = os.path.splitext(espn_path)
+    paths = dict()
+    for path in sorted(glob.glob("%s_schema*%s" % (glob.escape(root), extension))):
+        paths[path[len(root) + len("_schema"):len(path) - len(extension)]] = path
+    return paths
+
+
+def joined_output_path(output_dir, league, start_year):
+    season = "%s%s" % (str(start_year)[-2:], str(start_year + 1)[-2:])
+    directory = os.path.join(output_dir, league, "JOINED", "season=%s" % season)
+    return os.path.join(directory, "%s%s_joined.csv" % ("NBA" if league == "NBA" else "NCAABB", season))
+
+
+# Join every season backfill.py wrote under output_dir, one season at a time so the run scales linearly
+#  The alias index lives in output_dir/<league>_team_aliases.tsv and is saved after each season. Each versioned
+#  ESPN file is joined into the matching versioned output, e.g. NCAABB1718_joined_schema1a2b3c4d.csv
+def merge_seasons(league, start_years, output_dir, parquet=False, show=False):
+    index = TeamAliasIndex(os.path.join(output_dir, "%s_team_aliases.tsv" % league))
+    parquet_sink = ParquetSink(os.path.join(output_dir, "parquet"), "joined", league) if parquet else None
+    try:
+        for start_year in start_years:
+            espn_path = season_output_path(output_dir, league, "ESPN", start_year)
+            sbr_path = season_output_path(output_dir, league, "SBR", start_year)
+            if not (os.path.isfile(espn_path) and os.path.isfile(sbr_path)):
+                if show:
+                    print("Skipping %d, both ESPN and SBR output are needed" % start_year)
+                continue
+            output_path = joined_output_path(output_dir, league, start_year)
+            if parquet_sink is None:
+                if os.path.isfile(output_path):
+                    os.remove(output_path)  # The join is rebuilt from scratch each run
+                elif not os.path.isdir(os.path.dirname(output_path)):
+                    os.makedirs(os.path.dirname(output_path))
+            sink = parquet_sink if parquet_sink is not None else CsvSink(output_path)
+            versioned_paths = versioned_espn_paths(espn_path)
+            try:
+                joined = merge_season(espn_path, sbr_path, sink, index)
+                for version, versioned_path in versioned_paths.items():
+                    versioned_sink = sink.versioned(version)
+                    if parquet_sink is None and os.path.isfile(versioned_sink.path):
+                        os.remove(versioned_sink.path)
+                    try:
+                        joined += merge_season(versioned_path, sbr_path, versioned_sink, index)
+                    finally:
+                        versioned_sink.close()
+                    metrics.count("join_versioned_files")
+            finally:
+                if sink is not parquet_sink:
+                    sink.close()
+            index.save()
+            if show:
+                print("%s %d: %d games joined from %d file(s), %d team aliases" % (league, start_year, joined,
+                                                                                  1 + len(versioned_paths),
+                                                                                  len(index)))
+    finally:
+        if parquet_sink is not None:
+            parquet_sink.close()
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join backfilled ESPN box scores with SBR lines into one table "
+                                                 "per season")
+    parser.add_argument("league", choices=["NBA", "NCAAB"])
+    parser.add_argument("seasons", help="Start year or range of start years, e.g. 2011-2017")
+    parser.add_argument("--output-dir", default="ScrapedData", help="backfill.py's output directory")
+    parser.add_argument("--parquet", action="store_true", help="Write typed Parquet partitions instead of csv")
+    args = parser.parse_args()
+
+    merge_seasons(args.league, parse_season_range(args.seasons), args.output_dir, parquet=args.parquet, show=True)
+    print(dict((k, v) for k, v in metrics.snapshot()["counters"].items() if k.startswith("join_")))
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket is everything slower
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_PREFIX = "scraper"
+
+_lock = threading.Lock()
+_counters = dict()  # name -> number
+_histograms = dict()  # stage -> {"count", "sum", "max", "buckets"}
+_started = {"at": time.time()}
+
+
+def _empty_histogram():
+    return {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+# Add n to a counter, e.g. count("cache_hits") or count("bytes_downloaded", len(content))
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(stage, seconds):
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = i
+            break
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = _empty_histogram()
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["max"] = max(histogram["max"], seconds)
+        histogram["buckets"][bucket] += 1
+
+
+# with metrics.timer("decode"): ... records the block's wall time, also when it raises
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def snapshot():
+    with _lock:
+        return {"counters": dict(_counters),
+                "stages": dict((stage, dict(h, buckets=list(h["buckets"]))) for stage, h in _histograms.items())}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+    _started["at"] = time.time()
+
+
+# Snapshot and reset, used by worker processes to hand their numbers to the parent after each unit of work
+def drain():
+    with _lock:
+        taken = {"counters": dict(_counters), "stages": dict(_histograms)}
+        _counters.clear()
+        _histograms.clear()
+    return taken
+
+
+# Fold a snapshot from another process into this one
+def merge(other):
+    with _lock:
+        for name, value in other["counters"].items():
+            _counters[name] = _counters.get(name, 0) + value
+        for stage, theirs in other["stages"].items():
+            ours = _histograms.get(stage)
+            if ours is None:
+                ours = _histograms[stage] = _empty_histogram()
+            ours["count"] += theirs["count"]
+            ours["sum"] += theirs["sum"]
+            ours["max"] = max(ours["max"], theirs["max"])
+            ours["buckets"] = [a + b for a, b in zip(ours["buckets"], theirs["buckets"])]
+
+
+# Approximate quantile from the histogram buckets, reported as the upper bound of the bucket it falls in
+def _quantile(histogram, q):
+    target = q * histogram["count"]
+    seen = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS + (histogram["max"],), histogram["buckets"]):
+        seen += bucket_count
+        if seen >= target and bucket_count:
+            return min(bound, histogram["max"])
+    return histogram["max"]
+
+
+def report(extra=None):
+    data = snapshot()
+    stages = dict()
+    for stage, histogram in sorted(data["stages"].items()):
+        stages[stage] = {"count": histogram["count"],
+                         "total_seconds": round(histogram["sum"], 6),
+                         "mean_ms": round(1000.0 * histogram["sum"] / histogram["count"], 3) if histogram["count"] else 0,
+                         "p50_ms": round(1000.0 * _quantile(histogram, 0.5), 3),
+                         "p95_ms": round(1000.0 * _quantile(histogram, 0.95), 3),
+                         "max_ms": round(1000.0 * histogram["max"], 3),
+                         "buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], histogram["buckets"]))}
+    result = {"started_at": _started["at"], "finished_at": time.time(),
+              "wall_seconds": round(time.time() - _started["at"], 3),
+              "counters": dict(sorted(data["counters"].items())), "stages": stages}
+    if extra:
+        result.update(extra)
+    return result
+
+
+def _write_atomic(path, text):
+    with open(path + ".tmp", 'w') as ofile:
+        ofile.write(text)
+    os.replace(path + ".tmp", path)
+
+
+# Machine readable run report, extra (e.g. {"league": "NBA"}) is merged in at the top level
+def write_report(path, extra=None):
+    _write_atomic(path, json.dumps(report(extra), indent=2, sort_keys=True) + "\n")
+
+
+# Prometheus text exposition format, for node_exporter's textfile collector
+def write_prometheus(path, labels=None):
+    data = snapshot()
+    label_text = ",".join('%s="%s"' % (k, v) for k, v in sorted((labels or {}).items()))
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = "%s_%s_total" % (PROMETHEUS_PREFIX, name)
+        lines += ["# TYPE %s counter" % metric, "%s{%s} %s" % (metric, label_text, value)]
+    metric = "%s_stage_seconds" % PROMETHEUS_PREFIX
+    if data["stages"]:
+        lines.append("# TYPE %s histogram" % metric)
+    for stage, histogram in sorted(data["stages"].items()):
+        stage_labels = ",".join(filter(None, [label_text, 'stage="%s"' % stage]))
+        cumulative = 0
+        for bound, bucket_count in zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], histogram["buckets"]):
+            cumulative += bucket_count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (metric, stage_labels, bound, cumulative))
+        lines.append("%s_sum{%s} %f" % (metric, stage_labels, histogram["sum"]))
+        lines.append("%s_count{%s} %d" % (metric, stage_labels, histogram["count"]))
+    _write_atomic(path, "\n".join(lines) + "\n")
@@ -0,0 +1,195 @@
+import argparse
+import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import json_backend
+import raw_archive
+from sinks import CsvSink, ParquetSink
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+REGULATION_PERIODS = {True: 4, False: 2}  # nba -> quarters, ncaab -> halves
+PERIOD_SECONDS = {True: 12 * 60, False: 20 * 60}
+OVERTIME_SECONDS = 5 * 60
+CLUTCH_SECONDS = 5 * 60  # Final five minutes of regulation and all of overtime
+CLUTCH_MARGIN = 5
+CHUNK_SIZE = 200  # Archived games handed to a worker process at a time
+
+_PERIOD_COLUMNS = {True: ["1stQ", "2ndQ", "3rdQ", "4thQ", "OT", "1stHalf", "2ndHalf"],
+                   False: ["1stHalf", "2ndHalf", "OT"]}
+_TEAM_COLUMNS = ["LargestLead", "LongestRun", "ClutchPoints"]
+_GAME_COLUMNS = ["LeadChanges", "TimesTied", "TiedSeconds", "TiedPct", "ClutchSeconds", "Plays"]
+
+# Every play of a game as parallel arrays, in the order ESPN lists them
+PlayArrays = namedtuple("PlayArrays", ["period", "clock", "away_score", "home_score"])
+
+
+def feature_header(nba=False):
+    team_columns = _PERIOD_COLUMNS[nba] + _TEAM_COLUMNS
+    return "GameID,Date," + ",".join(["Home-%s" % c for c in team_columns] + ["Away-%s" % c for c in team_columns] +
+                                     _GAME_COLUMNS) + "\n"
+
+
+# Seconds left in the period from a play clock, "11:45" or "45.2" in the last minute
+def clock_seconds(clock):
+    if 'value' in clock:
+        return float(clock['value'])
+    minutes, _, seconds = clock.get('displayValue', "0").rpartition(":")
+    return float(minutes or 0) * 60 + float(seconds)
+
+
+def play_arrays(plays):
+    period, clock, away_score, home_score = [], [], [], []
+    for p in plays:
+        period.append(p['period']['number'])
+        clock.append(clock_seconds(p.get('clock', {})))
+        away_score.append(p['awayScore'])
+        home_score.append(p['homeScore'])
+    return PlayArrays(np.array(period, dtype=np.int16), np.array(clock, dtype=np.float32),
+                      np.array(away_score, dtype=np.int32), np.array(home_score, dtype=np.int32))
+
+
+# Plays of a raw summary payload, streamed one play at a time with ijson when streaming is asked for so the
+#  play list never exists as dicts, decoded whole otherwise (faster with orjson)
+def play_arrays_from_content(content, streaming=False):
+    if streaming and ijson is not None:
+        return play_arrays(ijson.items(content, "plays.item", use_float=True))
+    return play_arrays(json_backend.loads(content).get('plays', []))
+
+
+# Scores at the end of each regulation period and at the final play (cumulative)
+def _period_end_scores(plays, regulation):
+    ends = np.searchsorted(plays.period, np.arange(1, regulation + 1), side="right") - 1
+    home = np.where(ends >= 0, plays.home_score[ends], 0)
+    away = np.where(ends >= 0, plays.away_score[ends], 0)
+    return np.append(home, plays.home_score[-1]), np.append(away, plays.away_score[-1])
+
+
+def _longest_runs(home_points, away_points):
+    scoring = np.flatnonzero((home_points > 0) | (away_points > 0))
+    if len(scoring) == 0:
+        return 0, 0
+    team = np.where(home_points[scoring] > 0, 1, -1)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(team)) + 1))
+    run_points = np.add.reduceat(home_points[scoring] + away_points[scoring], starts)
+    run_team = team[starts]
+    return int(run_points[run_team == 1].max(initial=0)), int(run_points[run_team == -1].max(initial=0))
+
+
+# Every feature of one game in a handful of array operations, None for games without plays
+def game_features(plays, nba=False):
+    if len(plays.period) == 0:
+        return None
+    regulation = REGULATION_PERIODS[nba]
+    period_length = PERIOD_SECONDS[nba]
+    period = plays.period.astype(np.int32)
+    margin = plays.home_score - plays.away_score
+    home_points = np.diff(plays.home_score, prepend=0)
+    away_points = np.diff(plays.away_score, prepend=0)
+
+    # Game clock as seconds elapsed since tip-off, overtime periods are shorter
+    length = np.where(period <= regulation, period_length, OVERTIME_SECONDS)
+    period_start = np.minimum(period - 1, regulation) * period_length + \
+        np.maximum(period - 1 - regulation, 0) * OVERTIME_SECONDS
+    elapsed = np.maximum.accumulate(period_start + length - plays.clock)
+    duration = np.diff(elapsed, append=elapsed[-1])  # Time each score state lasted until the next play
+
+    home_ends, away_ends = _period_end_scores(plays, regulation)
+    home_periods = np.diff(home_ends, prepend=0)
+    away_periods = np.diff(away_ends, prepend=0)
+    if nba:
+        home_periods = np.append(home_periods, [home_periods[:2].sum(), home_periods[2:4].sum()])
+        away_periods = np.append(away_periods, [away_periods[:2].sum(), away_periods[2:4].sum()])
+
+    sign = np.sign(margin)
+    leads = sign[sign != 0]
+    tied = margin == 0
+    clutch_window = (period >= regulation) & (plays.clock <= CLUTCH_SECONDS)
+    margin_before = np.concatenate(([0], margin[:-1]))
+    clutch_plays = clutch_window & (np.abs(margin_before) <= CLUTCH_MARGIN)
+    clutch_states = clutch_window & (np.abs(margin) <= CLUTCH_MARGIN)
+    tied_seconds = float(elapsed[0] + duration[tied].sum())  # 0-0 until the first play
+    home_run, away_run = _longest_runs(home_points, away_points)
+
+    return {"home_periods": home_periods.tolist(), "away_periods": away_periods.tolist(),
+            "home_largest_lead": int(max(margin.max(), 0)), "away_largest_lead": int(max(-margin.min(), 0)),
+            "home_longest_run": home_run, "away_longest_run": away_run,
+            "home_clutch_points": int(home_points[clutch_plays].sum()),
+            "away_clutch_points": int(away_points[clutch_plays].sum()),
+            "lead_changes": int(np.count_nonzero(leads[1:] != leads[:-1])),
+            "times_tied": int(np.count_nonzero(tied[1:] & ~tied[:-1])),
+            "tied_seconds": tied_seconds,
+            "tied_pct": tied_seconds / float(elapsed[-1]) if elapsed[-1] > 0 else 0.0,
+            "clutch_seconds": float(duration[clutch_states].sum()),
+            "plays": len(period)}
+
+
+def features_row(game_id, date, features):
+    values = [game_id, "%d-%d-%d" % (date.month, date.day, date.year)]  # Same date format as the ESPN rows
+    values += [str(v) for v in features["home_periods"]]
+    values += [str(features["home_largest_lead"]), str(features["home_longest_run"]),
+               str(features["home_clutch_points"])]
+    values += [str(v) for v in features["away_periods"]]
+    values += [str(features["away_largest_lead"]), str(features["away_longest_run"]),
+               str(features["away_clutch_points"])]
+    values += [str(features["lead_changes"]), str(features["times_tied"]), "%.1f" % features["tied_seconds"],
+               "%.4f" % features["tied_pct"], "%.1f" % features["clutch_seconds"], str(features["plays"])]
+    return ",".join(values) + "\n"
+
+
+# Feature rows for a chunk of archived summaries, run in a worker process
+def features_for_records(unit):
+    nba, streaming, records = unit
+    rows = []
+    for game_id, date, data_path, offset, length in records:
+        _, content = raw_archive.read_record(data_path, offset, length)
+        try:
+            features = game_features(play_arrays_from_content(content, streaming), nba=nba)
+        except (KeyError, TypeError, ValueError, json_backend.DecodeError):
+            continue  # Same as the scraper, unusable summaries are skipped rather than written half empty
+        if features is not None:
+            rows.append(features_row(game_id, datetime.date(*map(int, date.split("-"))), features))
+    return rows
+
+
+# Feature table for one archived ESPN season, keyed by GameID in date order
+def season_features(archive_root, league, season, sink, processes=None, streaming=False):
+    nba = league == "NBA"
+    entries = raw_archive.RawArchive(archive_root).entries("ESPN", league, season)
+    records = [(game_id, date, data_path, offset, length) for game_id, (data_path, date, offset, length) in entries]
+    units = [(nba, streaming, records[i:i + CHUNK_SIZE]) for i in range(0, len(records), CHUNK_SIZE)]
+    if sink.existing_header() is None:
+        sink.write_header(feature_header(nba))
+    row_count = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for rows in executor.map(features_for_records, units):
+            for row in rows:
+                sink.write_row(row)
+            row_count += len(rows)
+    sink.close()
+    return row_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play-by-play features for an archived ESPN season")
+    parser.add_argument("archive_root", help="Root passed to raw_archive.configure() while scraping")
+    parser.add_argument("league", choices=raw_archive.LEAGUES)
+    parser.add_argument("season", help="Season label, e.g. 1718")
+    parser.add_argument("output", help="csv file, or a Parquet root with --parquet")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, defaults to every core")
+    parser.add_argument("--parquet", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="Stream plays with ijson instead of decoding whole")
+    args = parser.parse_args()
+
+    if args.parquet:
+        output_sink = ParquetSink(args.output, "pbp", args.league)
+    else:
+        output_sink = CsvSink(args.output)
+    print("%d games" % season_features(args.archive_root, args.league, args.season, output_sink,
+                                       processes=args.processes, streaming=args.stream))
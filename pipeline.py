@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fetcher
+import metrics
+
+DEFAULT_WINDOW = 256  # Jobs between being fetched and being written at any one time
+
+
+class _Failure(object):
+    """An exception raised by fetch or parse, carried down the queues and re-raised by the writer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+# Runs inside a worker process, the worker's metrics ride back with every result
+def _parse_in_worker(parse, item, payload):
+    return parse(item, payload), metrics.drain()
+
+
+# Fetch, parse and write stages joined by bounded queues, so a slow parse no longer stalls the network and a slow
+#  response no longer stalls parsing. groups is [(key, [item, ...])] in output order
+#  - fetch(item) runs on fetch_workers threads and returns the payload, or None when there is nothing to parse
+#  - parse(item, payload) runs on a pool of processes (inline when processes is 0) and must be a module-level
+#    function so it can be pickled
+#  - write_group(key, results, complete) runs on this thread with a group's results in item order once every
+#    one of them is parsed, None for items whose fetch gave nothing
+#  At most window jobs are in flight: a fetch thread needs a slot to start a job and the slot is only given back
+#  once the writer has consumed it, which is the backpressure and bounds memory. On Ctrl-C (or any error) every
+#  result already parsed is still passed to write_group with complete=False before the exception propagates, in
+#  item order with None for the items that were not parsed
+def run_pipeline(groups, fetch, parse, write_group, fetch_workers=fetcher.DEFAULT_MAX_WORKERS, processes=None,
+                 window=DEFAULT_WINDOW):
+    jobs = [(index, item) for index, (_, items) in enumerate(groups) for item in items]
+    group_results = [[] for _ in groups]
+    stop = threading.Event()
+    slots = threading.Semaphore(window)
+    job_iter = iter(enumerate(jobs))
+    job_lock = threading.Lock()
+    fetched = queue.Queue(maxsize=window)  # Neither queue can fill up, the slots run out first
+    parsed = queue.Queue(maxsize=window)
+    # A forked worker starts with a copy of this process's counters, reset so only its own work is merged back
+    pool = ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                               initializer=metrics.reset) if processes != 0 and jobs else None
+
+    def _fetch_loop():
+        while not stop.is_set():
+            if not slots.acquire(timeout=0.1):
+                metrics.count("pipeline_fetch_stalls")  # Tenths of a second a fetch thread waited on parse or write
+                continue
+            with job_lock:  # Slot first, then the next job, so the oldest unwritten job always holds a slot
+                seq, job = next(job_iter, (None, None))
+            if seq is None:
+                slots.release()
+                return
+            try:
+                payload = fetch(job[1])
+            except Exception as e:
+                payload = _Failure(e)
+            fetched.put((seq, job[1], payload))
+
+    def _parse_loop():
+        while not stop.is_set():
+            try:
+                seq, item, payload = fetched.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if payload is None or isinstance(payload, _Failure):
+                parsed.put((seq, payload))
+            elif pool is None:
+                try:
+                    parsed.put((seq, (parse(item, payload), None)))
+                except Exception as e:
+                    parsed.put((seq, _Failure(e)))
+            else:
+                try:
+                    future = pool.submit(_parse_in_worker, parse, item, payload)
+                except Exception as e:  # Pool already broken, e.g. its workers caught the Ctrl-C
+                    parsed.put((seq, _Failure(e)))
+                    continue
+                future.add_done_callback(lambda f, seq=seq: parsed.put((seq, f)))
+
+    def _unwrap(value):
+        if value is None:
+            return None
+        if isinstance(value, _Failure):
+            raise value.error
+        if not isinstance(value, tuple):  # A finished future from the process pool
+            value = value.result()
+        result, worker_metrics = value
+        if worker_metrics is not None:
+            metrics.merge(worker_metrics)
+        return result
+
+    threads = [threading.Thread(target=_fetch_loop) for _ in range(max(1, fetch_workers))]
+    threads.append(threading.Thread(target=_parse_loop))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    sizes = [len(items) for _, items in groups]
+    buffered = dict()  # seq -> result parsed ahead of an earlier job
+    state = {"next_seq": 0, "next_group": 0}
+
+    def _write_ready():
+        while state["next_group"] < len(groups) and len(group_results[state["next_group"]]) == sizes[state["next_group"]]:
+            index = state["next_group"]
+            state["next_group"] += 1  # Advanced first so a failing write is never repeated by the flush below
+            write_group(groups[index][0], group_results[index], True)
+
+    try:
+        _write_ready()
+        while state["next_seq"] < len(jobs):
+            try:
+                seq, value = parsed.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            buffered[seq] = _unwrap(value)
+            while state["next_seq"] in buffered:
+                group_results[jobs[state["next_seq"]][0]].append(buffered.pop(state["next_seq"]))
+                state["next_seq"] += 1
+                slots.release()
+            _write_ready()
+    except BaseException:
+        stop.set()
+        while True:  # Results that were parsed but not yet picked up
+            try:
+                seq, value = parsed.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                buffered[seq] = _unwrap(value)
+            except BaseException:
+                pass
+        starts = [0]  # seq of each group's first job
+        for size in sizes:
+            starts.append(starts[-1] + size)
+        for index in range(state["next_group"], len(groups)):
+            results = group_results[index] + [None] * (sizes[index] - len(group_results[index]))
+            for seq in range(starts[index] + len(group_results[index]), starts[index + 1]):
+                results[seq - starts[index]] = buffered.get(seq)
+            if any(result is not None for result in results):
+                write_group(groups[index][0], results, False)
+        raise
+    finally:
+        stop.set()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
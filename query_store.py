@@ -0,0 +1,333 @@
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import sys
+
+import metrics
+from merge import TeamAliasIndex
+from sinks import LINE_SENTINELS, NULL_STRINGS, column_positions, parse_row_date, row_columns, season_for_date
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schemas (schema_id INTEGER PRIMARY KEY, header TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, inode INTEGER, header TEXT, offset INTEGER);
+CREATE TABLE IF NOT EXISTS games (
+    league TEXT, game_id TEXT, date TEXT, season TEXT,
+    home_id TEXT, home_name TEXT, home_rank INTEGER, home_score INTEGER,
+    away_id TEXT, away_name TEXT, away_rank INTEGER, away_score INTEGER,
+    spread REAL, over_under REAL, neutral INTEGER, venue TEXT, schema_id INTEGER, data TEXT, source TEXT,
+    PRIMARY KEY (league, game_id));
+CREATE INDEX IF NOT EXISTS games_source ON games (source);
+CREATE INDEX IF NOT EXISTS games_date ON games (date);
+CREATE INDEX IF NOT EXISTS games_home_id ON games (home_id, date);
+CREATE INDEX IF NOT EXISTS games_away_id ON games (away_id, date);
+CREATE INDEX IF NOT EXISTS games_home_rank ON games (home_rank);
+CREATE INDEX IF NOT EXISTS games_away_rank ON games (away_rank);
+CREATE TABLE IF NOT EXISTS lines (
+    league TEXT, date TEXT, season TEXT,
+    away_name TEXT, away_id TEXT, away_rank INTEGER, away_score INTEGER,
+    home_name TEXT, home_id TEXT, home_rank INTEGER, home_score INTEGER,
+    opt_line REAL, opt_payout REAL, bov_line REAL, bov_payout REAL, pes_line REAL, pes_payout REAL,
+    away_b2b INTEGER, schema_id INTEGER, data TEXT, source TEXT,
+    PRIMARY KEY (league, date, away_name, home_name));
+CREATE INDEX IF NOT EXISTS lines_source ON lines (source);
+CREATE INDEX IF NOT EXISTS lines_date ON lines (date);
+CREATE INDEX IF NOT EXISTS lines_home_name ON lines (home_name, date);
+CREATE INDEX IF NOT EXISTS lines_away_name ON lines (away_name, date);
+CREATE INDEX IF NOT EXISTS lines_home_id ON lines (home_id, date);
+CREATE INDEX IF NOT EXISTS lines_away_id ON lines (away_id, date);
+CREATE INDEX IF NOT EXISTS lines_home_rank ON lines (home_rank);
+CREATE INDEX IF NOT EXISTS lines_away_rank ON lines (away_rank);
+"""
+
+BATCH_SIZE = 5000  # Rows per executemany call while ingesting
+
+GAME_COLUMNS = ("GameID", "Date", "Spread", "OverUnder", "Home-id", "Home-Name", "Home-Rank", "Home-FinalScore",
+                "Away-id", "Away-Name", "Away-Rank", "Away-FinalScore", "Neutral", "Venue")
+LINE_COLUMNS = ("Date", "Away-Name", "Away-APRank", "Away-FinalScore", "Home-Name", "Home-APRank", "Home-FinalScore",
+                "OptLine", "OptPayout", "BovLine", "BovPayout", "PesLine", "PesPayout", "Away-B2B-Indicator")
+
+_GAME_FIELDS = "league, game_id, date, season, home_id, home_name, home_rank, home_score, away_id, away_name, " \
+               "away_rank, away_score, spread, over_under, neutral, venue"
+_LINE_FIELDS = "league, date, season, away_name, away_id, away_rank, away_score, home_name, home_id, home_rank, " \
+               "home_score, opt_line, opt_payout, bov_line, bov_payout, pes_line, pes_payout, away_b2b"
+_FILTERS = "(:league IS NULL OR league = :league) AND (:season IS NULL OR season = :season)"
+
+# Prepared queries by name, every one takes :league and :season (None for all) besides its own parameters
+QUERIES = {
+    "team": "SELECT %s FROM games WHERE (home_id = :team OR away_id = :team) AND %s ORDER BY date, game_id"
+            % (_GAME_FIELDS, _FILTERS),
+    "team-lines": "SELECT %s FROM lines WHERE (home_name = :team OR away_name = :team OR home_id = :team "
+                  "OR away_id = :team) AND %s ORDER BY date" % (_LINE_FIELDS, _FILTERS),
+    "date": "SELECT %s FROM games WHERE date = :date AND %s ORDER BY league, game_id" % (_GAME_FIELDS, _FILTERS),
+    "date-lines": "SELECT %s FROM lines WHERE date = :date AND %s ORDER BY league, home_name"
+                  % (_LINE_FIELDS, _FILTERS),
+    # Home margin against the Bovada line (a home spread), home_ats_margin > 0 is a home cover
+    "ranked-lines": "SELECT league, date, away_name, away_rank, home_name, home_rank, away_score, home_score, "
+                    "bov_line, home_score - away_score AS home_margin, "
+                    "home_score - away_score + bov_line AS home_ats_margin "
+                    "FROM lines WHERE (home_rank > 0 OR away_rank > 0) AND %s ORDER BY date" % _FILTERS,
+    "ranked-games": "SELECT league, game_id, date, away_name, away_rank, home_name, home_rank, away_score, "
+                    "home_score, spread, home_score - away_score AS home_margin, "
+                    "home_score - away_score + spread AS home_ats_margin "
+                    "FROM games WHERE (home_rank > 0 OR away_rank > 0) AND %s ORDER BY date" % _FILTERS,
+}
+
+
+# A csv value as a number, None for the scrapers' missing-value strings and for any of sentinels
+def _number(value, cast=float, sentinels=()):
+    if value in NULL_STRINGS:
+        return None
+    try:
+        number = cast(float(value)) if cast is int else cast(value)
+    except ValueError:
+        return None
+    return None if number in sentinels else number
+
+
+def _flag(value):
+    return {"True": 1, "False": 0}.get(value)
+
+
+# ("games" or "lines", league) of a scraped csv from its header, (None, None) for anything else (joined tables,
+#  schedule features, consensus lines)
+def detect_file(header):
+    columns = header.strip().split(",")
+    if any(c.startswith("SBR-") for c in columns):
+        return None, None
+    if columns[:3] == ["GameID", "Date", "Spread"]:
+        return "games", "NBA" if "Home-1stQ" in columns else "NCAAB"
+    if columns[:2] == ["Date", "Away-Name"] and "OptLine" in columns:
+        return "lines", "NCAAB" if "Away-APRank" in columns else "NBA"
+    return None, None
+
+
+class QueryStore(object):
+    """Scraped ESPN games and SBR lines in one indexed SQLite file
+
+    The key columns of every row are typed and indexed (GameID, date, team id and name, rank) and the full csv
+    row is kept next to them with its header in the schemas table, so model feature pulls can still get every
+    column. Ingest is incremental: each file's byte offset is remembered and only rows appended since the last
+    run are read, a file that was rewritten (e.g. schedule_index.py --fix-b2b) is read again in full and replaces
+    every row it was the source of, so rows dropped from the file (e.g. by gameid_index.py compact) are dropped too.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._schema_ids = dict()  # header -> schema_id
+
+    def _schema_id(self, header):
+        schema_id = self._schema_ids.get(header)
+        if schema_id is None:
+            self._db.execute("INSERT OR IGNORE INTO schemas (header) VALUES (?)", (header,))
+            schema_id = self._db.execute("SELECT schema_id FROM schemas WHERE header = ?", (header,)).fetchone()[0]
+            self._schema_ids[header] = schema_id
+        return schema_id
+
+    # layouts caches (positions, schema_id, column count) by row length, NBA rows under the old header are shorter
+    def _game_record(self, league, columns, fields, layouts):
+        layout = layouts.get(len(fields))
+        if layout is None:
+            row_header = ",".join(row_columns(columns, len(fields)))
+            layout = layouts[len(fields)] = (column_positions(columns, len(fields), GAME_COLUMNS),
+                                             self._schema_id(row_header), len(row_header.split(",")))
+        positions, schema_id, length = layout
+        if length != len(fields):  # e.g. a comma inside a venue name
+            return None
+        value = dict((c, fields[i]) for c, i in positions.items())
+        date = parse_row_date(value["Date"])
+        return (league, value["GameID"], date.isoformat(), season_for_date(date),
+                value.get("Home-id"), value.get("Home-Name"), _number(value.get("Home-Rank", ""), int, (-1,)),
+                _number(value.get("Home-FinalScore", ""), int, (-1,)),
+                value.get("Away-id"), value.get("Away-Name"), _number(value.get("Away-Rank", ""), int, (-1,)),
+                _number(value.get("Away-FinalScore", ""), int, (-1,)),
+                _number(value.get("Spread", "")), _number(value.get("OverUnder", "")),
+                _flag(value.get("Neutral")), value.get("Venue"), schema_id, ",".join(fields))
+
+    def _line_record(self, league, columns, fields, positions, schema_id, aliases):
+        if len(fields) != len(columns):
+            return None
+        value = dict((c, fields[i]) for c, i in positions.items())
+        date = parse_row_date(value["Date"])
+        away, home = value["Away-Name"], value["Home-Name"]
+        return (league, date.isoformat(), season_for_date(date),
+                away, aliases.resolve(away) if aliases is not None else None,
+                _number(value.get("Away-APRank", ""), int, (-1,)), _number(value["Away-FinalScore"], int, (-1,)),
+                home, aliases.resolve(home) if aliases is not None else None,
+                _number(value.get("Home-APRank", ""), int, (-1,)), _number(value["Home-FinalScore"], int, (-1,)),
+                _number(value["OptLine"], float, LINE_SENTINELS), _number(value["OptPayout"], float, LINE_SENTINELS),
+                _number(value["BovLine"], float, LINE_SENTINELS), _number(value["BovPayout"], float, LINE_SENTINELS),
+                _number(value["PesLine"], float, LINE_SENTINELS), _number(value["PesPayout"], float, LINE_SENTINELS),
+                _number(value["Away-B2B-Indicator"], int), schema_id, ",".join(fields))
+
+    # Load the rows of one scraped csv appended since it was last ingested, returns how many rows were added
+    #  aliases (a merge.TeamAliasIndex) fills in the ESPN team ids of SBR lines
+    def ingest(self, path, league=None, aliases=None):
+        path = os.path.abspath(path)
+        inode = os.stat(path).st_ino
+        known = self._db.execute("SELECT inode, header, offset FROM files WHERE path = ?", (path,)).fetchone()
+        with open(path, 'rb') as ifile:
+            header = ifile.readline().decode("utf-8")
+            table, file_league = detect_file(header)
+            if table is None:
+                metrics.count("store_skipped_files")
+                return 0
+            league = league or file_league
+            columns = header.strip().split(",")
+            resume = known is not None and known["inode"] == inode and known["header"] == header
+            if resume:
+                ifile.seek(0, os.SEEK_END)
+                resume = known["offset"] <= ifile.tell()  # A shorter file than last time was rewritten in place
+                ifile.seek(known["offset"] if resume else len(header.encode("utf-8")))
+            # A key already stored from another file keeps that file's row, so re-ingesting one file never takes
+            #  rows away from another, and the first copy of a key repeated inside a file wins
+            if table == "games":
+                sql = "INSERT OR IGNORE INTO games VALUES (%s)" % ",".join(["?"] * 19)
+                layouts = dict()
+                make_record = lambda fields: self._game_record(league, columns, fields, layouts)
+            else:
+                sql = "INSERT OR IGNORE INTO lines VALUES (%s)" % ",".join(["?"] * 21)
+                positions = column_positions(columns, len(columns), LINE_COLUMNS)
+                schema_id = self._schema_id(header.strip())
+                make_record = lambda fields: self._line_record(league, columns, fields, positions, schema_id, aliases)
+            offset, added, read = ifile.tell(), 0, 0
+            with self._db:  # Rows and the file's new offset commit together, an interrupted ingest re-reads them
+                if not resume:
+                    self._db.execute("DELETE FROM %s WHERE source = ?" % table, (path,))
+                batch = []
+                for line in ifile:
+                    if not line.endswith(b"\n"):  # A row still being written, picked up by the next ingest
+                        break
+                    offset += len(line)
+                    try:
+                        record = make_record(line.decode("utf-8").rstrip("\r\n").split(","))
+                    except (KeyError, ValueError):
+                        record = None
+                    if record is None:
+                        metrics.count("store_malformed_rows")
+                        continue
+                    batch.append(record + (path,))
+                    read += 1
+                    if len(batch) >= BATCH_SIZE:
+                        added += self._db.executemany(sql, batch).rowcount
+                        batch = []
+                if batch:
+                    added += self._db.executemany(sql, batch).rowcount
+                self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, inode, header, offset))
+        metrics.count("store_rows_ingested", added)
+        metrics.count("store_conflicting_rows", read - added)
+        return added
+
+    # Ingest every scraped csv under a directory (or a single file), returns rows added per file
+    def ingest_path(self, path, league=None, aliases=None):
+        if os.path.isfile(path):
+            return {path: self.ingest(path, league, aliases)}
+        added = dict()
+        for directory, _, filenames in sorted(os.walk(path)):
+            for filename in sorted(filenames):
+                if filename.endswith(".csv"):
+                    file_path = os.path.join(directory, filename)
+                    added[file_path] = self.ingest(file_path, league, aliases)
+        return added
+
+    # Rows of a prepared query as dicts
+    def query(self, name, league=None, season=None, **params):
+        params.update(league=league, season=season)
+        with metrics.timer("store_query"):
+            return [dict(row) for row in self._db.execute(QUERIES[name], params)]
+
+    def team_games(self, team_id, league=None, season=None):
+        return self.query("team", league, season, team=str(team_id))
+
+    # team is an SBR name, or an ESPN id when the lines were ingested with aliases
+    def team_lines(self, team, league=None, season=None):
+        return self.query("team-lines", league, season, team=str(team))
+
+    def games_on(self, date, league=None):
+        return self.query("date", league, date=date.isoformat())
+
+    def lines_on(self, date, league=None):
+        return self.query("date-lines", league, date=date.isoformat())
+
+    def ranked_lines(self, league=None, season=None):
+        return self.query("ranked-lines", league, season)
+
+    # Every column of one game's ESPN row by header name, None when the game is not stored
+    def game_row(self, game_id, league):
+        row = self._db.execute("SELECT header, data FROM games JOIN schemas USING (schema_id) "
+                               "WHERE league = ? AND game_id = ?", (league, str(game_id))).fetchone()
+        if row is None:
+            return None
+        return dict(zip(row["header"].split(","), row["data"].split(",")))
+
+    def close(self):
+        self._db.execute("PRAGMA optimize")  # Gathers the statistics the planner needs to pick the rank indexes
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _date_arg(text):
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+    except ValueError:
+        return parse_row_date(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexed SQLite store of scraped games and lines")
+    parser.add_argument("database", help="SQLite file, created when missing")
+    subparsers = parser.add_subparsers(dest="command")
+    ingest_parser = subparsers.add_parser("ingest", help="Load new rows of scraped csvs")
+    ingest_parser.add_argument("paths", nargs="+", help="Csv files or directories, e.g. backfill.py's output")
+    ingest_parser.add_argument("--league", choices=["NBA", "NCAAB"], default=None,
+                               help="Defaults to the league the header belongs to")
+    ingest_parser.add_argument("--aliases", default=None, help="merge.py team alias .tsv, gives SBR lines team ids")
+    for name, help_text in (("team", "Games of an ESPN team id"), ("team-lines", "Lines of an SBR team name"),
+                            ("date", "Games on a date"), ("date-lines", "Lines on a date"),
+                            ("ranked-lines", "SBR lines against results where a team was ranked"),
+                            ("ranked-games", "ESPN spreads against results where a team was ranked"),
+                            ("game", "Every column of one game")):
+        query_parser = subparsers.add_parser(name, help=help_text)
+        if name in ("team", "team-lines"):
+            query_parser.add_argument("team")
+        elif name in ("date", "date-lines"):
+            query_parser.add_argument("date", type=_date_arg, help="YYYY-MM-DD or MM-DD-YYYY")
+        elif name == "game":
+            query_parser.add_argument("game_id")
+        query_parser.add_argument("--league", choices=["NBA", "NCAAB"], default="NCAAB" if name == "game" else None)
+        query_parser.add_argument("--season", default=None, help="e.g. 1718")
+    args = parser.parse_args()
+
+    with QueryStore(args.database) as store:
+        if args.command == "ingest":
+            aliases = TeamAliasIndex(args.aliases) if args.aliases else None
+            for path in args.paths:
+                for file_path, added in store.ingest_path(path, args.league, aliases).items():
+                    print("%s: %d rows added" % (file_path, added))
+            print(dict((k, v) for k, v in metrics.snapshot()["counters"].items() if k.startswith("store_")))
+            rows = []
+        elif args.command == "game":
+            row = store.game_row(args.game_id, args.league)
+            rows = [row] if row is not None else []
+        else:
+            params = dict()
+            if args.command in ("team", "team-lines"):
+                params["team"] = args.team
+            elif args.command in ("date", "date-lines"):
+                params["date"] = args.date.isoformat()
+            rows = store.query(args.command, args.league, args.season, **params)
+    if rows:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,271 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import json_backend
+import stat_plans
+import summary_stream
+from sinks import CsvSink, ParquetSink, season_for_date
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LEAGUES = ("NBA", "NCAAB")
+
+
+def _compress(data):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(frame, path):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("%s is zstd compressed, install zstandard to read it" % path)
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+# Index entries of one part file, key -> (date, offset, length), a key archived twice keeps its latest copy
+def _read_index(index_path):
+    entries = dict()
+    with open(index_path) as ifile:
+        for line in ifile:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 4:  # A torn last line from a killed run is ignored
+                entries[fields[0]] = (fields[1], int(fields[2]), int(fields[3]))
+    return entries
+
+
+def _key_sort_key(key):
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+class RawArchive(object):
+    """Append-only archive of raw ESPN summaries and SBR pages, laid out as
+    root/<source>/<league>/season=<season>/part-<run>.warc.zst with a part-<run>.idx next to each part
+
+    Every record is its own compressed frame holding a json header line followed by the untouched response bytes,
+    so a record is read back with one seek. The .idx sidecar has a "key date offset length" line per frame, keyed
+    by GameID for ESPN and ISO date for SBR. Like ParquetSink, every process writes its own part files so backfill
+    workers never share a file handle, and gzip stands in for zstd when zstandard is not installed.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._run_id = "%d-%d" % (int(time.time() * 1000), os.getpid())
+        self._parts = dict()  # (source, league, season) -> (data file, index file)
+        self._keys = dict()  # (source, league, season) -> keys already in any part file
+
+    def season_dir(self, source, league, season):
+        return os.path.join(self.root, source, league, "season=%s" % season)
+
+    def _part(self, source, league, season):
+        if (source, league, season) not in self._parts:
+            directory = self.season_dir(source, league, season)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            extension = ".warc.zst" if zstandard is not None else ".warc.gz"
+            data_file = open(os.path.join(directory, "part-%s%s" % (self._run_id, extension)), 'ab')
+            index_file = open(os.path.join(directory, "part-%s.idx" % self._run_id), 'a', buffering=1)
+            self._parts[(source, league, season)] = (data_file, index_file)
+        return self._parts[(source, league, season)]
+
+    def _season_keys(self, source, league, season):
+        if (source, league, season) not in self._keys:
+            self._keys[(source, league, season)] = set(key for key, _ in self.entries(source, league, season))
+        return self._keys[(source, league, season)]
+
+    def has(self, source, league, key, date):
+        with self._lock:
+            return key in self._season_keys(source, league, season_for_date(date))
+
+    # Today's (and future) responses can still change, so they are archived again on every fetch
+    #  A past key already archived is skipped before its body is compressed
+    def add(self, source, league, key, date, url, content):
+        season = season_for_date(date)
+        if date < datetime.date.today() and self.has(source, league, key, date):
+            return False
+        header = json.dumps({"source": source, "league": league, "key": key, "date": date.isoformat(),
+                             "url": url, "fetched_at": time.time(), "length": len(content)})
+        frame = _compress(header.encode("utf-8") + b"\n" + content)
+        with self._lock:
+            keys = self._season_keys(source, league, season)
+            if key in keys and date < datetime.date.today():  # Another thread archived it meanwhile
+                return False
+            data_file, index_file = self._part(source, league, season)
+            offset = data_file.tell()
+            data_file.write(frame)
+            data_file.flush()  # The frame is on disk before the index points at it
+            index_file.write("%s\t%s\t%d\t%d\n" % (key, date.isoformat(), offset, len(frame)))
+            keys.add(key)
+        return True
+
+    def seasons(self, source, league):
+        directory = os.path.join(self.root, source, league)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name.split("=", 1)[1] for name in os.listdir(directory) if name.startswith("season="))
+
+    # Every (key, (data_path, date, offset, length)) of a season sorted by date then key, latest part file wins
+    def entries(self, source, league, season):
+        directory = self.season_dir(source, league, season)
+        if not os.path.isdir(directory):
+            return []
+        latest = dict()
+        for name in sorted(os.listdir(directory)):  # Part names start with a timestamp, so later runs overwrite
+            if not name.endswith(".idx"):
+                continue
+            stem = os.path.join(directory, name[:-len(".idx")])
+            data_path = stem + ".warc.zst" if os.path.isfile(stem + ".warc.zst") else stem + ".warc.gz"
+            for key, (date, offset, length) in _read_index(os.path.join(directory, name)).items():
+                latest[key] = (data_path, date, offset, length)
+        return sorted(latest.items(), key=lambda item: (item[1][1], _key_sort_key(item[0])))
+
+    def close(self):
+        with self._lock:
+            for data_file, index_file in self._parts.values():
+                data_file.close()
+                index_file.close()
+            self._parts = dict()
+
+
+# Header dict and raw content bytes of the record at offset in data_path
+def read_record(data_path, offset, length):
+    with open(data_path, 'rb') as ifile:
+        ifile.seek(offset)
+        frame = ifile.read(length)
+    header, content = _decompress(frame, data_path).split(b"\n", 1)
+    return json.loads(header.decode("utf-8")), content
+
+
+_active = {"archive": None}
+
+
+# Keep every raw response the scrapers decode, called from the scrapers' __main__ blocks and backfill workers
+def configure(root):
+    _active["archive"] = RawArchive(root)
+    return _active["archive"]
+
+
+def disable():
+    if _active["archive"] is not None:
+        _active["archive"].close()
+    _active["archive"] = None
+
+
+# No-op unless configure() was called
+def archive(source, league, key, date, url, content):
+    if _active["archive"] is not None:
+        _active["archive"].add(source, league, key, date, url, content)
+
+
+# Rows for one date's archived records, run in a worker process
+#  ESPN rows are sorted by GameID with the column header of the first valid game (rows of another layout are kept
+#  apart by the SchemaRouter in reextract), SBR rows have no B2B flag yet
+def extract_unit(unit):
+    import line_scraper
+    import scraper
+
+    source, league, date, records = unit
+    rows, header = [], None
+    for data_path, offset, length in records:
+        _, content = read_record(data_path, offset, length)
+        if source == "ESPN":
+            nba = league == "NBA"
+            try:
+                game_json = summary_stream.load_summary(content, plays=nba)
+                row = scraper.convert_game_json_to_string(game_json, "%d-%d-%d," % (date.month, date.day, date.year),
+                                                          nba=nba)
+            except (KeyError, json_backend.DecodeError):
+                continue
+            if row != "INVALID":
+                rows.append(row)
+                if header is None:
+                    header = stat_plans.schema_header(row.schema)
+        else:
+            ncaab = league == "NCAAB"
+            string_date = line_scraper.format_date(date.day, date.month, date.year, ncaab)[1]
+            for game_string, _, _ in line_scraper.parse_date_page(content, ncaab, batched=True) or []:
+                rows.append("%s,%s,0\n" % (string_date, game_string))
+    if source == "ESPN":
+        rows.sort(key=scraper._game_id_sort_key)
+    else:
+        header = line_scraper.NCAAB_HEADER if league == "NCAAB" else line_scraper.NBA_HEADER
+    return rows, header
+
+
+# Re-derive a season's dataset from the archive on a process pool, no network involved
+def reextract(root, source, league, season, sink, processes=None, show=False):
+    import backfill
+
+    entries = RawArchive(root).entries(source, league, season)
+    units, by_date = [], dict()
+    for _, (data_path, date, offset, length) in entries:
+        by_date.setdefault(date, []).append((data_path, offset, length))
+    for date in sorted(by_date):
+        units.append((source, league, datetime.date(*map(int, date.split("-"))), by_date[date]))
+
+    if source == "ESPN":
+        sink = stat_plans.SchemaRouter(sink)
+    prev_date, prev_teams, header_written, row_count = None, set(), sink.existing_header() is not None, 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for unit, (rows, header) in zip(units, executor.map(extract_unit, units)):
+            if not header_written and header is not None:
+                sink.write_header(header)
+                header_written = True
+            if source == "SBR":
+                date = unit[2]
+                if prev_date != date - datetime.timedelta(days=1):
+                    prev_teams = set()
+                rows, prev_teams = backfill._set_b2b(rows, header, prev_teams)
+                prev_date = date
+            for row in rows:
+                sink.write_row(row)
+            row_count += len(rows)
+            if show:
+                print("Extracted %s %s %s with %d rows" % (league, source, unit[2].isoformat(), len(rows)))
+    sink.close()
+    return row_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or re-extract the raw response archive")
+    subparsers = parser.add_subparsers(dest="command")
+    list_parser = subparsers.add_parser("list", help="Record counts per season")
+    list_parser.add_argument("root")
+    extract_parser = subparsers.add_parser("extract", help="Rebuild a season's rows from archived responses")
+    extract_parser.add_argument("root")
+    extract_parser.add_argument("source", choices=["ESPN", "SBR"])
+    extract_parser.add_argument("league", choices=LEAGUES)
+    extract_parser.add_argument("season", help="Season label, e.g. 1718")
+    extract_parser.add_argument("output", help="csv file, or a Parquet root with --parquet")
+    extract_parser.add_argument("--processes", type=int, default=None, help="Worker processes, defaults to every core")
+    extract_parser.add_argument("--parquet", action="store_true")
+    extract_parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        archive_root = RawArchive(args.root)
+        for source in ("ESPN", "SBR"):
+            for league in LEAGUES:
+                for season in archive_root.seasons(source, league):
+                    print("%s\t%s\t%s\t%d" % (source, league, season, len(archive_root.entries(source, league, season))))
+    elif args.command == "extract":
+        if args.parquet:
+            output_sink = ParquetSink(args.output, args.source.lower(), args.league)
+        else:
+            output_sink = CsvSink(args.output)
+        print("%d rows" % reextract(args.root, args.source, args.league, args.season, output_sink,
+                                    processes=args.processes, show=args.show))
+    else:
+        parser.print_help()
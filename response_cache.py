@@ -0,0 +1,153 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+import requests
+
+import fetcher
+import metrics
+
+TODAY_TTL = 15 * 60  # Seconds a response for today's (or a future) date stays fresh, scores and lines still move
+
+
+class ReplayMiss(requests.exceptions.ConnectionError):
+    """Raised in replay mode when a url has never been cached, handled like any other failed connection"""
+
+
+class ResponseCache(object):
+    """Content-addressed response store, zlib blobs on disk with a SQLite index keyed by url"""
+
+    def __init__(self, cache_dir, max_bytes=None, replay=False, today_ttl=TODAY_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.today_ttl = today_ttl
+        self._lock = threading.Lock()
+        if not os.path.isdir(os.path.join(cache_dir, "blobs")):
+            os.makedirs(os.path.join(cache_dir, "blobs"))
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, digest TEXT NOT NULL, "
+                         "size INTEGER NOT NULL, fetched_at REAL NOT NULL, expires_at REAL, last_access REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest + ".z")
+
+    # Completed past dates never expire, anything dated today or later is only fresh for today_ttl seconds
+    #  Responses without a date (e.g. a fixed historical game) are treated as permanent
+    def expiry_for(self, date, now):
+        if date is None or date < datetime.date.today():
+            return None
+        return now + self.today_ttl
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT digest, expires_at FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            digest, expires_at = row
+            if expires_at is not None and expires_at < time.time() and not self.replay:
+                return None
+            try:
+                with open(self._blob_path(digest), 'rb') as ifile:
+                    content = zlib.decompress(ifile.read())
+            except (IOError, OSError, zlib.error):  # Blob lost or damaged, fall back to a fresh download
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        return content
+
+    def store(self, url, content, date=None):
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        now = time.time()
+        with self._lock:
+            if not os.path.isfile(blob_path):  # Identical bodies from different urls share one blob
+                if not os.path.isdir(os.path.dirname(blob_path)):
+                    os.makedirs(os.path.dirname(blob_path))
+                with open(blob_path + ".tmp", 'wb') as ofile:
+                    ofile.write(zlib.compress(content))
+                os.replace(blob_path + ".tmp", blob_path)
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                             (url, digest, len(content), now, self.expiry_for(date, now), now))
+            self._db.commit()
+            if self.max_bytes is not None:
+                self._evict()
+
+    # Drop least recently used entries until the cached bodies fit in max_bytes
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, digest, size in self._db.execute("SELECT url, digest, size FROM responses "
+                                                  "ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            if self._db.execute("SELECT 1 FROM responses WHERE digest = ?", (digest,)).fetchone() is None:
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+            total -= size
+        self._db.commit()
+
+    def prune(self):
+        if self.max_bytes is not None:
+            with self._lock:
+                self._evict()
+
+    def get_content(self, url, date=None, dead_letter=True):
+        with metrics.timer("cache_lookup"):
+            content = self.lookup(url)
+        if content is not None:
+            metrics.count("cache_hits")
+            metrics.count("bytes_from_cache", len(content))
+            return content
+        metrics.count("cache_misses")
+        if self.replay:
+            metrics.count("replay_misses")
+            raise ReplayMiss("Replay mode and no cached response for %s" % url)
+        r = fetcher.get(url, date=date, dead_letter=dead_letter)
+        if r.status_code == 200:
+            self.store(url, r.content, date)
+        return r.content
+
+    def stats(self):
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"responses": count, "bytes": size}
+
+
+_active = {"cache": None}
+
+
+# Route get_content() through an on-disk cache, called from the scrapers' __main__ blocks
+def configure(cache_dir, max_bytes=None, replay=False, today_ttl=TODAY_TTL):
+    _active["cache"] = ResponseCache(cache_dir, max_bytes=max_bytes, replay=replay, today_ttl=today_ttl)
+    return _active["cache"]
+
+
+def disable():
+    _active["cache"] = None
+
+
+# Body of the response for url, from the cache when one is configured, date is the day the url describes
+def get_content(url, date=None, dead_letter=True):
+    cache = _active["cache"]
+    if cache is None:
+        return fetcher.get(url, date=date, dead_letter=dead_letter).content
+    return cache.get_content(url, date, dead_letter=dead_letter)
+
+
+if __name__ == "__main__":
+    # Usage: python response_cache.py <cache_dir> [max_bytes]  (prints stats, evicting down to max_bytes if given)
+    cache = ResponseCache(sys.argv[1], max_bytes=int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    cache.prune()
+    print(cache.stats())
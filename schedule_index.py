@@ -0,0 +1,227 @@
+import argparse
+import os
+
+import numpy as np
+
+import metrics
+from backfill import parse_season_range, season_output_path
+from sinks import CsvSink, column_positions, parse_row_date
+
+DEFAULT_WINDOW = 7  # Days looked back for Games-LastN
+NO_REST = -1  # Rest days of a team's first game of the season
+_DAY_STRIDE = 1 << 32  # team * stride + date ordinal sorts appearances by team, then date, in one int64 key
+ESPN_KEY_HEADER = "GameID,Date,Away-id,Home-id"
+SBR_KEY_HEADER = "Date,Away-Name,Home-Name"
+ESPN_COLUMNS = ("GameID", "Date", "Away-id", "Home-id", "Venue")
+
+
+def feature_header(key_header, window=DEFAULT_WINDOW):
+    features = ["%s-%s" % (side, name) for name in ("RestDays", "B2B", "GamesLast%d" % window, "Travel")
+                for side in ("Away", "Home")]
+    return "%s,%s\n" % (key_header, ",".join(features))
+
+
+class ScheduleIndex(object):
+    """Every game of one season's scraped output and, per team, the sorted array of dates it played on
+
+    Games are kept as parallel arrays (date ordinal, away code, home code, venue code) so rest days, back-to-back
+    flags, games in the last N days and travel from the previous venue come out of one sort and a few vectorized
+    passes over each team's appearances, whatever order the rows were scraped and written in. SBR pages carry no
+    venue, so an SBR game's venue is its home team.
+    """
+
+    def __init__(self, key_header, keys, dates, away_teams, home_teams, venues):
+        self.key_header = key_header
+        self.keys = []  # Row key strings, ESPN_KEY_HEADER or SBR_KEY_HEADER, in first-seen order
+        days, away, home, venue = [], [], [], []
+        team_codes, venue_codes, seen = dict(), dict(), set()
+        for key, date, away_team, home_team, venue_name in zip(keys, dates, away_teams, home_teams, venues):
+            game = (date, away_team, home_team)
+            if game in seen:  # A date written twice by a resumed or retried run
+                metrics.count("schedule_duplicate_games")
+                continue
+            seen.add(game)
+            self.keys.append(key)
+            days.append(date.toordinal())
+            away.append(team_codes.setdefault(away_team, len(team_codes)))
+            home.append(team_codes.setdefault(home_team, len(team_codes)))
+            venue.append(venue_codes.setdefault(venue_name, len(venue_codes)))
+        self.teams = sorted(team_codes, key=team_codes.get)  # code -> team
+        self.team_codes = team_codes
+        self.days = np.array(days, dtype=np.int64)
+        self.away = np.array(away, dtype=np.int64)
+        self.home = np.array(home, dtype=np.int64)
+        self.venues = np.array(venue, dtype=np.int64)
+        # Appearances are the away sides followed by the home sides, _order sorts them by (team, date)
+        team = np.concatenate([self.away, self.home])
+        self._order = np.argsort(team * _DAY_STRIDE + np.concatenate([self.days, self.days]), kind="stable")
+        self._team = team[self._order]
+        self._day = np.concatenate([self.days, self.days])[self._order]
+        self._venue = np.concatenate([self.venues, self.venues])[self._order]
+        self._bounds = np.searchsorted(self._team, np.arange(len(self.teams) + 1))  # team code -> appearance slice
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Sorted date ordinals of every game team played, empty for a team not in the index
+    def team_dates(self, team):
+        code = self.team_codes.get(team)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return self._day[self._bounds[code]:self._bounds[code + 1]]
+
+    def played_on(self, team, date):
+        dates = self.team_dates(team)
+        position = np.searchsorted(dates, date.toordinal())
+        return bool(position < len(dates) and dates[position] == date.toordinal())
+
+    # Teams with a game on date, the prev_teams of line_scraper for the day after
+    def teams_on(self, date):
+        on_date = self.days == date.toordinal()
+        return set(self.teams[code] for code in np.concatenate([self.away[on_date], self.home[on_date]]).tolist())
+
+    # {"Away-RestDays": array, "Home-RestDays": ..., ...} in game order, RestDays is NO_REST on a team's first game
+    #  and Travel is 1 when the team's previous game was at another venue
+    def features(self, window=DEFAULT_WINDOW):
+        count = len(self._team)
+        same_team = np.zeros(count, dtype=bool)
+        same_team[1:] = self._team[1:] == self._team[:-1]
+        previous_day = np.roll(self._day, 1)
+        rest = np.where(same_team, self._day - previous_day - 1, NO_REST)
+        # Appearances of the same team in [date - window, date), counted by position in the sorted keys
+        keys = self._team * _DAY_STRIDE + self._day
+        recent = np.arange(count) - np.searchsorted(keys, keys - window, side="left")
+        travel = same_team & (self._venue != np.roll(self._venue, 1))
+        values = dict()
+        for name, sorted_values in (("RestDays", rest), ("B2B", (rest == 0).astype(np.int64)),
+                                    ("GamesLast%d" % window, recent), ("Travel", travel.astype(np.int64))):
+            unsorted = np.empty(count, dtype=np.int64)
+            unsorted[self._order] = sorted_values
+            values["Away-%s" % name], values["Home-%s" % name] = unsorted[:len(self)], unsorted[len(self):]
+        return values
+
+    # Feature csv rows in date order, keyed by the index's key columns
+    def feature_rows(self, window=DEFAULT_WINDOW):
+        values = self.features(window)
+        columns = [values[name].tolist() for name in feature_header("", window).strip().split(",")[1:]]
+        rows = ["%s,%s\n" % (key, ",".join(str(v) for v in features)) for key, features in zip(self.keys, zip(*columns))]
+        order = np.argsort(self.days, kind="stable").tolist()
+        return [rows[i] for i in order]
+
+    @classmethod
+    def from_sbr_csv(cls, path):
+        keys, dates, away_teams, home_teams = [], [], [], []
+        with open(path) as ifile:
+            columns = ifile.readline().strip().split(",")
+            away, home = columns.index("Away-Name"), columns.index("Home-Name")
+            for row in ifile:
+                fields = row.rstrip("\n").split(",")
+                if len(fields) != len(columns):
+                    metrics.count("schedule_malformed_rows")
+                    continue
+                keys.append("%s,%s,%s" % (fields[0], fields[away], fields[home]))
+                dates.append(parse_row_date(fields[0]))
+                away_teams.append(fields[away])
+                home_teams.append(fields[home])
+        return cls(SBR_KEY_HEADER, keys, dates, away_teams, home_teams, home_teams)
+
+    # Teams are ESPN ids, a game's venue is its Venue column or the home team when ESPN gave none
+    @classmethod
+    def from_espn_csv(cls, path):
+        keys, dates, away_teams, home_teams, venues = [], [], [], [], []
+        with open(path) as ifile:
+            columns = ifile.readline().strip().split(",")
+            positions_by_length = dict()
+            for row in ifile:
+                fields = row.rstrip("\n").split(",")
+                positions = positions_by_length.get(len(fields))
+                if positions is None:
+                    positions = positions_by_length[len(fields)] = column_positions(columns, len(fields),
+                                                                                 ESPN_COLUMNS)
+                if len(positions) != len(ESPN_COLUMNS):
+                    metrics.count("schedule_malformed_rows")
+                    continue
+                game_id, date, away_id, home_id, venue = [fields[positions[c]] for c in ESPN_COLUMNS]
+                keys.append("%s,%s,%s,%s" % (game_id, date, away_id, home_id))
+                dates.append(parse_row_date(date))
+                away_teams.append(away_id)
+                home_teams.append(home_id)
+                venues.append(venue or "home:%s" % home_id)
+        return cls(ESPN_KEY_HEADER, keys, dates, away_teams, home_teams, venues)
+
+
+# Rewrite the Away-B2B-Indicator column of an SBR season file from its schedule, fixing the 0s left by dates that
+#  were scraped out of order, resumed or retried. Returns how many flags changed
+def fix_b2b_column(sbr_path):
+    index = ScheduleIndex.from_sbr_csv(sbr_path)
+    b2b = dict(zip(index.keys, index.features()["Away-B2B"].tolist()))
+    changed = 0
+    with open(sbr_path) as ifile, open(sbr_path + ".tmp", 'w') as ofile:
+        header = ifile.readline()
+        ofile.write(header)
+        columns = header.strip().split(",")
+        away, home, flag = columns.index("Away-Name"), columns.index("Home-Name"), columns.index("Away-B2B-Indicator")
+        for row in ifile:
+            fields = row.rstrip("\n").split(",")
+            if len(fields) == len(columns):
+                value = str(b2b["%s,%s,%s" % (fields[0], fields[away], fields[home])])
+                if fields[flag] != value:
+                    fields[flag] = value
+                    changed += 1
+                row = ",".join(fields) + "\n"
+            ofile.write(row)
+    os.replace(sbr_path + ".tmp", sbr_path)
+    metrics.count("schedule_b2b_fixed", changed)
+    return changed
+
+
+def schedule_output_path(output_dir, league, source, start_year):
+    season = "%s%s" % (str(start_year)[-2:], str(start_year + 1)[-2:])
+    directory = os.path.join(output_dir, league, "SCHEDULE", "season=%s" % season)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return os.path.join(directory, "%s%s_%s_schedule.csv" % ("NBA" if league == "NBA" else "NCAABB", season, source))
+
+
+# Write the schedule features of every season backfill.py wrote under output_dir, rebuilt from scratch each run
+def write_seasons(league, source, start_years, output_dir, window=DEFAULT_WINDOW, fix_b2b=False, show=False):
+    for start_year in start_years:
+        path = season_output_path(output_dir, league, source, start_year)
+        if not os.path.isfile(path):
+            if show:
+                print("Skipping %d, no %s output" % (start_year, source))
+            continue
+        if fix_b2b and source == "SBR":
+            changed = fix_b2b_column(path)
+            if show:
+                print("%s %d: %d back-to-back flags corrected" % (league, start_year, changed))
+        with metrics.timer("schedule_index"):
+            index = ScheduleIndex.from_sbr_csv(path) if source == "SBR" else ScheduleIndex.from_espn_csv(path)
+            rows = index.feature_rows(window)
+        output_path = schedule_output_path(output_dir, league, source, start_year)
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+        sink = CsvSink(output_path)
+        try:
+            sink.write_header(feature_header(index.key_header, window))
+            sink.write_rows(rows)
+        finally:
+            sink.close()
+        if show:
+            print("%s %d: %d games, %d teams" % (league, start_year, len(index), len(index.teams)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rest-day, back-to-back and travel features for backfilled seasons")
+    parser.add_argument("league", choices=["NBA", "NCAAB"])
+    parser.add_argument("source", choices=["ESPN", "SBR"])
+    parser.add_argument("seasons", help="Start year or range of start years, e.g. 2011-2017")
+    parser.add_argument("--output-dir", default="ScrapedData", help="backfill.py's output directory")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Days looked back for Games-LastN")
+    parser.add_argument("--fix-b2b", action="store_true",
+                        help="Also rewrite the SBR files' Away-B2B-Indicator column from the schedule")
+    args = parser.parse_args()
+
+    write_seasons(args.league, args.source, parse_season_range(args.seasons), args.output_dir, window=args.window,
+                  fix_b2b=args.fix_b2b, show=True)
+    print(dict((k, v) for k, v in metrics.snapshot()["counters"].items() if k.startswith("schedule_")))
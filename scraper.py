@@ -1,8 +1,21 @@
+import argparse
+import calendar
 import csv
-import json
+import datetime
 import requests
+from collections import namedtuple
+from contextlib import contextmanager
 from os.path import isfile
-import pandas as pd
+from checkpoint import Checkpoint, event_id_from_url
+import fetcher
+import json_backend
+import metrics
+import pipeline
+import raw_archive
+import response_cache
+import stat_plans
+import summary_stream
+from sinks import CsvSink, ParquetSink
 
 #url = "http://site.api.espn.com/apis/site/v2/sports/basketball/mens-college-basketball/summary?event=400947324"
 TEST_GAME_URL = "http://site.api.espn.com/apis/site/v2/sports/basketball/mens-college-basketball/summary?event=400986636"
@@ -16,6 +29,13 @@ TEST_NBA_GAME_URL = 'http://site.api.espn.com/apis/site/v2/sports/basketball/nba
 NBA_GAME_URL_TEMPLATE = 'http://site.api.espn.com/apis/site/v2/sports/basketball/nba/summary?event=%s'
 NBA_DATE_URL_TEMPLATE = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard?dates=%s%s%s&limit=30"
 
+# Scoreboards for a span of days, dates=YYYYMMDD-YYYYMMDD, used by discovery.py to resolve a whole range at once
+RANGE_DATE_URL_TEMPLATE = "http://site.api.espn.com/apis/site/v2/sports/basketball/mens-college-basketball/scoreboard?groups=50&dates=%s-%s&limit=%d"
+TOURNEY_RANGE_DATE_URL_TEMPLATE = "http://site.api.espn.com/apis/site/v2/sports/basketball/mens-college-basketball/scoreboard?groups=100&dates=%s-%s&limit=%d"
+NBA_RANGE_DATE_URL_TEMPLATE = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard?dates=%s-%s&limit=%d"
+# (month, day) span of the NCAA tournament, First Four through the final, the only dates with groups=100 games
+TOURNAMENT_WINDOW = ((3, 12), (4, 10))
+
 
 # Function for getting home and away scores by quarter
 def get_quarter_scores(play_list):
@@ -47,22 +67,50 @@ def format_date(day, month, year, tournament=False, nba=False):
     return date_url
 
 
+def in_tournament_window(date):
+    return TOURNAMENT_WINDOW[0] <= (date.month, date.day) <= TOURNAMENT_WINDOW[1]
+
+
+# Scoreboard url for every day from start_date to end_date (inclusive) in one request
+def format_date_range(start_date, end_date, limit, tournament=False, nba=False):
+    if nba:
+        template = NBA_RANGE_DATE_URL_TEMPLATE
+    elif not tournament:
+        template = RANGE_DATE_URL_TEMPLATE
+    else:
+        template = TOURNEY_RANGE_DATE_URL_TEMPLATE
+    return template % (start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d"), limit)
+
+
+# Event dicts listed on one scoreboard url, None when the scoreboard can't be fetched or decoded
+def get_scoreboard_events(date_url, game_date):
+    try:
+        content = response_cache.get_content(date_url, date=game_date)
+        with metrics.timer("decode"):
+            return json_backend.loads(content)['events']
+    except json_backend.DecodeError:
+        metrics.count("scoreboard_decode_errors")
+        print("JSONDecodeError for %s-%s-%s" % (game_date.month, game_date.day, game_date.year))
+    except requests.exceptions.ConnectionError:  # Already recorded in the dead-letter file when one is configured
+        metrics.count("scoreboard_connection_errors")
+        print("ConnectionError for %s-%s-%s" % (game_date.month, game_date.day, game_date.year))
+    return None
+
+
+def game_url_for_event(event_id, nba=False):
+    return (NBA_GAME_URL_TEMPLATE if nba else GAME_URL_TEMPLATE) % event_id
+
+
 # Get a list of game summary urls to pass to individual game scraper from a date
+#  Tournament games are only looked up inside TOURNAMENT_WINDOW, March Madness Final Four can spill into April
 def get_urls_from_date(day, month, year, show=False, nba=False):
-    date_url = format_date(day, month, year, tournament=False, nba=nba)
-    r = requests.get(date_url)
-    try:
-        game_url_template = NBA_GAME_URL_TEMPLATE if nba else GAME_URL_TEMPLATE
-        game_urls = [game_url_template % e['id'] for e in r.json()['events']]
-        if month == 3 or month == 4:  # March Madness Final Four can spill into April
-            t_date_url = format_date(day, month, year, tournament=True, nba=nba)
-            r = requests.get(t_date_url)
-            game_urls += [game_url_template % e['id'] for e in r.json()['events']]
-        if show:
-            "%d games found for %s-%s-%s" % (len(game_urls), month, day, year)
-    except json.decoder.JSONDecodeError:
-        print("JSONDecodeError for %s-%s-%s" % (month, day, year))
-        game_urls = []
+    game_date = datetime.date(year, month, day)
+    events = get_scoreboard_events(format_date(day, month, year, tournament=False, nba=nba), game_date) or []
+    if not nba and in_tournament_window(game_date):
+        events += get_scoreboard_events(format_date(day, month, year, tournament=True), game_date) or []
+    game_urls = [game_url_for_event(e['id'], nba=nba) for e in events]
+    if show:
+        print("%d games found for %s-%s-%s" % (len(game_urls), month, day, year))
     return game_urls
 
 
@@ -72,85 +120,50 @@ def get_team_info(team):
     return return_string
 
 
-# Getting values of stat categories and returning as dictionary and list
+# Getting values of stat categories and returning as dictionary and list, the column layout comes from the
+#  stat list's compiled plan (stat_plans.py) instead of being re-derived from the labels every time
 def get_team_statistics(stat_list, show=False):
-    return_dict = dict()
-    return_string = ""
-    for s in stat_list:
-        if "Made-Attempted" not in s['label']:  # Label is the official public ESPN category name for statistic
-            return_dict[s['label']] = s['displayValue']  # displayValue is the value for the category shown in espn tables
-            return_string += "%s," % s['displayValue']
-        else:  # Made-Attempted recorded as an x-y pair, want these in separate columns
-            prefix = s['label'].split(' ')[0]   # Formatted where type of Make-Attempt is given in characters before space
-            made, attempted = s['displayValue'].split("-")
-            return_dict["%s-Made" % prefix] = made
-            return_dict["%s-Attempted" % prefix] = attempted
-            return_string += "%s,%s," % (made, attempted)
-    return return_dict, return_string
-
-
-# Generating header from the stat list labels using splits on made-attempted
+    plan = stat_plans.plan_for(stat_list)
+    values = plan.values(stat_list)
+    return dict(zip(plan.columns, values)), "".join("%s," % v for v in values)
+
+
+# Generating header from the stat list labels using splits on made-attempted, for a game whose teams both list
+#  these labels
 def generate_header(stat_list, nba=False):
-    header_string = "Name,id,Rank,FinalScore,"  # List of columns gathered for home and away teams
-    if nba:
-        spread = "Spread,"
-        header_string += "1stQ,2ndQ,3rdQ,"
-    else:
-        spread = "Spread,OverUnder,"
-    for s in stat_list:  # Automatically determine what column names are from a statistics list
-        if "Made-Attempted" not in s['label']:
-            header_string += "%s," % s['label']
-        else:
-            prefix = s['label'].split(" ")[0]
-            header_string += "%s-Made,%s-Attempted," % (prefix, prefix)
-    return_string = ""  # Need statistics for both home and away teams
-    for loc in ["Home","Away"]:
-        for s in header_string[:-1].split(","):
-            return_string += "%s-%s," % (loc, s)
-    return_string += "Neutral,Conference,Venue,City,State,Zip,Capacity,Attendance,AttendanceRatio,Referees"  # Extra columns not specific to home or away team but specific to game
-    return "GameID,Date," + spread + return_string+"\n"
-
-
-# Function for getting additional game details from json
-def get_game_info_extras(data_dict, show=False):
+    labels = stat_plans.plan_for(stat_list).labels
+    return stat_plans.schema_header(stat_plans.RowSchema(labels, labels, nba))
+
+
+# Function for getting additional game details from the game record
+def get_game_info_extras(record, show=False):
     try:
-        venue = data_dict['gameInfo']['venue']['shortName']
-        city = data_dict['gameInfo']['venue']['address']['city']
-        state = data_dict['gameInfo']['venue']['address']['state']
+        game_info = record.game_info
+        venue = game_info['venue']['shortName']
+        city = game_info['venue']['address']['city']
+        state = game_info['venue']['address']['state']
         try:
-            zip_code = str(data_dict['gameInfo']['venue']['address']['zipCode'])
+            zip_code = str(game_info['venue']['address']['zipCode'])
         except KeyError:
             zip_code = "NaN"
-        capacity = data_dict['gameInfo']['venue']['capacity']
-        attendance = data_dict['gameInfo']['attendance']
+        capacity = game_info['venue']['capacity']
+        attendance = game_info['attendance']
         try:
             attendance_ratio = "%.4f" % (attendance / float(capacity))
         except ZeroDivisionError:
             attendance_ratio = "0.0"
         ref_string = ""
-        for o in data_dict['gameInfo']['officials']:  # Not sure if this is variable length, so treating all refs as one hyphenated entry
+        for o in game_info['officials']:  # Not sure if this is variable length, so treating all refs as one hyphenated entry
             ref_string += "%s-" % (o['displayName'].replace(",", ""))
         extra_string = "%s,%s,%s,%s,%s,%s,%s,%s" % (venue, city, state, zip_code, str(capacity), str(attendance), attendance_ratio, ref_string)
     except KeyError:
+        metrics.count("missing_game_info")
         extra_string = "NaN,NaN,NaN,NaN,NaN,NaN,NaN,NaNx"
         if show:
             print("Error retrieving gameInfo for game")
     return extra_string[:-1]
 
 
-# Function to calculate team score from box score data (if no play-by-play data this is necessary,
-# cannot find final score in the json()
-def calculate_score_from_dict(data_dict):
-    try:
-        threes = int(data_dict["3PT-Made"])
-        twos = int(data_dict["FG-Made"]) - threes
-        ones = int(data_dict["FT-Made"])
-        score = threes * 3 + twos * 2 + ones * 1
-    except KeyError:
-        score = 0
-    return str(score)
-
-
 def _get_rank(team):
     try:
         rank = team['rank']
@@ -159,106 +172,162 @@ def _get_rank(team):
     return str(rank)+","
 
 
-def _get_team_ranks(game_json):
+def _get_team_ranks(record):
     """Return the away and home rankings of the competing teams"""
     try:
-        home = game_json['header']['competitions'][0]['competitors'][0]
-        away = game_json['header']['competitions'][0]['competitors'][1]
+        home = record.header['competitions'][0]['competitors'][0]
+        away = record.header['competitions'][0]['competitors'][1]
         home_rank = _get_rank(home)
         away_rank = _get_rank(away)
         return home_rank, away_rank
-    except KeyError:
-        return '-1', '-1'
-    except IndexError:
+    except (KeyError, IndexError):
+        metrics.count("missing_ranks")
         return '-1', '-1'
 
 
-def _get_neutral(game_json):
+def _get_neutral(record):
     try:
-        neutral = game_json['header']['competitions'][0]['neutralSite']
+        neutral = record.header['competitions'][0]['neutralSite']
         return str(neutral) + ","
-    except KeyError:
-        return "NaN,"
-    except IndexError:
+    except (KeyError, IndexError):
+        metrics.count("missing_neutral")
         return "NaN,"
 
 
-def _get_conf_game(game_json):
+def _get_conf_game(record):
     try:
-        conf = game_json['header']['competitions'][0]['conferenceCompetition']
+        conf = record.header['competitions'][0]['conferenceCompetition']
         return str(conf) +","
-    except KeyError:
-        return "NaN,"
-    except IndexError:
+    except (KeyError, IndexError):
+        metrics.count("missing_conference")
         return "NaN,"
 
 
-def _get_betting_info(game_json):
+def _get_betting_info(record):
     try:
-        spread = game_json['pickcenter'][0]['spread']
-        over_under = game_json['pickcenter'][0]['overUnder']
+        spread = record.pickcenter[0]['spread']
+        over_under = record.pickcenter[0]['overUnder']
         return str(spread)+",", str(over_under)+","
-    except KeyError:
-        return "NaN,", "NaN,"
-    except IndexError:
+    except (KeyError, IndexError):
+        metrics.count("missing_betting_info")
         return "NaN,", "NaN,"
 
 
-# Wrapper which takes game event url from espn api and returns output string
-def convert_game_to_string(url, date_string, show=False, nba=False):
+# Decode-once view of a game summary holding just the sections the extractors read
+GameRecord = namedtuple("GameRecord", ["game_id", "header", "home_team", "away_team", "pickcenter", "game_info", "plays"])
+
+
+def build_game_record(game_json):
+    boxscore_teams = game_json['boxscore']['teams']
+    return GameRecord(game_id=game_json['header']['id'],
+                      header=game_json['header'],
+                      home_team=boxscore_teams[1],
+                      away_team=boxscore_teams[0],
+                      pickcenter=game_json.get('pickcenter', []),
+                      game_info=game_json.get('gameInfo', {}),
+                      plays=game_json.get('plays'))
+
+
+# Converts an already decoded game summary into the output string, raises KeyError for unusable summaries
+#  The string is a stat_plans.GameRow carrying its column layout, so writers can keep other layouts apart
+def convert_game_json_to_string(game_json, date_string, show=False, nba=False):
+    record = build_game_record(game_json)
+    game_id = record.game_id + ","
+    home_info = get_team_info(record.home_team['team'])
+    away_info = get_team_info(record.away_team['team'])
+
+    home_plan = stat_plans.plan_for(record.home_team['statistics'])
+    away_plan = stat_plans.plan_for(record.away_team['statistics'])
+    home_values = home_plan.values(record.home_team['statistics'])
+    away_values = away_plan.values(record.away_team['statistics'])
+    home_stats_str = "".join("%s," % v for v in home_values)
+    away_stats_str = "".join("%s," % v for v in away_values)
+
+    home_score = home_plan.score(home_values) + ","
+    away_score = away_plan.score(away_values) + ","
+
+    if nba:
+        try:
+            spread = str(record.pickcenter[0]['spread']) + ","
+        except KeyError:
+            spread = "NaN,"
+        except IndexError:
+            spread = "NaN,"
+        if record.plays is None:
+            raise KeyError('plays')
+        home_cumulative_quarters, away_cumulative_quarters = get_quarter_scores(record.plays)
+        output_string = game_id + date_string + spread \
+                        + home_info + home_score + home_cumulative_quarters + home_stats_str \
+                        + away_info + away_score + away_cumulative_quarters + away_stats_str
+    else:
+        home_rank, away_rank = _get_team_ranks(record)
+        neutral_site = _get_neutral(record)
+        conference_game = _get_conf_game(record)
+        home_spread, over_under = _get_betting_info(record)
+        output_string = game_id + date_string + home_spread + over_under + home_info + home_rank + home_score + \
+                        home_stats_str + away_info + away_rank + away_score + away_stats_str + \
+                        neutral_site + conference_game
+    output_string += get_game_info_extras(record, show=show) + "\n"
+
+    if home_stats_str == "" or away_stats_str == "":
+        metrics.count("missing_team_statistics")
+        return "INVALID"
+    return stat_plans.GameRow(output_string, stat_plans.RowSchema(home_plan.labels, away_plan.labels, nba))
+
+
+# Download (and archive) one game summary, None when it could not be fetched
+def fetch_game_content(url, date_string, show=False, nba=False):
+    game_date = datetime.datetime.strptime(date_string.rstrip(","), "%m-%d-%Y").date()
     try:
-        r = requests.get(url)
-        game_id = r.json()['header']['id'] + ","
-        home_info = get_team_info(r.json()['boxscore']['teams'][1]['team'])
-        away_info = get_team_info(r.json()['boxscore']['teams'][0]['team'])
-
-        home_stats_dict, home_stats_str = get_team_statistics(r.json()['boxscore']['teams'][1]['statistics'], show=show)
-        away_stats_dict, away_stats_str = get_team_statistics(r.json()['boxscore']['teams'][0]['statistics'], show=show)
-
-        home_score = calculate_score_from_dict(home_stats_dict) + ","
-        away_score = calculate_score_from_dict(away_stats_dict) + ","
-
-        if nba:
-            try:
-                spread = str(r.json()['pickcenter'][0]['spread']) + ","
-            except KeyError:
-                spread = "NaN,"
-            except IndexError:
-                spread = "NaN,"
-            home_cumulative_quarters, away_cumulative_quarters = get_quarter_scores(r.json()['plays'])
-            output_string = game_id + date_string + spread \
-                            + home_info + home_score + home_cumulative_quarters + home_stats_str \
-                            + away_info + away_score + away_cumulative_quarters + away_stats_str
-        else:
-            home_rank, away_rank = _get_team_ranks(r.json())
-            neutral_site = _get_neutral(r.json())
-            conference_game = _get_conf_game(r.json())
-            home_spread, over_under = _get_betting_info(r.json())
-            output_string = game_id + date_string + home_spread + over_under + home_info + home_rank + home_score + \
-                            home_stats_str + away_info + away_rank + away_score + away_stats_str + \
-                            neutral_site + conference_game
-        output_string += get_game_info_extras(r.json(), show=show) + "\n"
-
-        if home_stats_str == "" or away_stats_str == "":
-            output_string = "INVALID"
+        content = response_cache.get_content(url, date=game_date)
+    except requests.exceptions.ConnectionError:
+        metrics.count("summary_connection_errors")
+        metrics.count("invalid_games")
+        if show:
+            print("ConnectionError experienced")
+        return None
+    raw_archive.archive("ESPN", "NBA" if nba else "NCAAB", event_id_from_url(url), game_date, url, content)
+    return content
+
+
+# Decode and extract a downloaded game summary into the output string, "INVALID" for unusable summaries
+def convert_game_content(content, date_string, show=False, nba=False):
+    try:
+        with metrics.timer("decode"):
+            game_json = summary_stream.load_summary(content, plays=nba)
+        with metrics.timer("extract"):
+            output_string = convert_game_json_to_string(game_json, date_string, show=show, nba=nba)
         if show:
             print(output_string)
 
     except KeyError:
+        metrics.count("summary_key_errors")
         if show:
             print("KeyError experienced")
         output_string = "INVALID"
-    except requests.exceptions.ConnectionError:
-        if show:
-            print("ConnectionError experienced")
-        output_string = "INVALID"
-    except json.decoder.JSONDecodeError:
+    except json_backend.DecodeError:
+        metrics.count("summary_decode_errors")
         if show:
             print("JSON Decode Error")
         output_string = "INVALID"
+    if output_string == "INVALID":
+        metrics.count("invalid_games")
     return output_string
 
 
+# Wrapper which takes game event url from espn api and returns output string
+def convert_game_to_string(url, date_string, show=False, nba=False):
+    content = fetch_game_content(url, date_string, show=show, nba=nba)
+    if content is None:
+        return "INVALID"
+    return convert_game_content(content, date_string, show=show, nba=nba)
+
+
+# Parse stage of the pipeline, job is (url, date_string, show, nba) and runs in a worker process
+def parse_game_job(job, content):
+    return convert_game_content(content, job[1], show=job[2], nba=job[3])
+
+
 # Function that determines if output file exists and first line matches proper header start
 def detect_header(output_filename):
     if not isfile(output_filename):
@@ -272,41 +341,275 @@ def detect_header(output_filename):
                 return False, None
 
 
-def write_game_data_for_date_range(start_day, end_day, month, year, output_filename, show=False, nba=False):
-    header_exists, header = detect_header(output_filename)
+# Drops urls of games the checkpoint has already written (and repeats within the list) before they are fetched
+def _unwritten_game_urls(game_urls, checkpoint):
+    if checkpoint is None:
+        return game_urls
+    seen = set()
+    new_urls = []
+    for game_url in game_urls:
+        event_id = event_id_from_url(game_url)
+        if not checkpoint.has_game(event_id) and event_id not in seen:
+            seen.add(event_id)
+            new_urls.append(game_url)
+    return new_urls
+
+
+# Write a row unless the checkpoint's GameID index already holds its game, returns True when written
+#  The GameID is only recorded once the sink has flushed the row, so a crash can never index a game it lost
+def _write_new_row(sink, output_string, checkpoint):
+    return _write_new_rows(sink, [output_string], checkpoint) == 1
+
+
+# Batched _write_new_row, returns how many of the rows were new
+def _write_new_rows(sink, output_strings, checkpoint):
+    if checkpoint is None:
+        sink.write_rows(output_strings)
+        return len(output_strings)
+    new_strings, game_ids = [], []
+    for output_string in output_strings:
+        game_id = output_string.split(",", 1)[0]
+        if not checkpoint.has_game(game_id) and game_id not in game_ids:
+            new_strings.append(output_string)
+            game_ids.append(game_id)
+    if new_strings:
+        sink.write_rows(new_strings)
+        sink.flush()
+        for game_id in game_ids:
+            checkpoint.add_game(game_id)
+    return len(new_strings)
+
+
+# Probe the test game for the column layout when the sink does not already start with a header
+def write_header_if_missing(sink, nba=False):
+    if sink.existing_header() is None:
+        test_game_url = TEST_NBA_GAME_URL if nba else TEST_GAME_URL
+        header = generate_header(json_backend.loads(response_cache.get_content(test_game_url))['boxscore']['teams'][1]['statistics'], nba=nba)
+        sink.write_header(header)
+
+
+# Dates from start_day to end_day of month/year the checkpoint has not completed
+def _pending_dates(start_day, end_day, month, year, checkpoint):
+    dates = [datetime.date(year, month, day) for day in range(start_day, end_day + 1)]
+    return [game_date for game_date in dates if checkpoint is None or not checkpoint.is_date_done(game_date)]
+
+
+# date -> [DiscoveredEvent] for the days of the range the checkpoint has not completed, resolved up front
+#  Days whose scoreboard could not be read go in failed_dates, they are not checkpointed so a rerun asks again
+def _discover_pending(start_day, end_day, month, year, nba, checkpoint, max_workers=fetcher.DEFAULT_MAX_WORKERS,
+                      rate_limiter=None, show=False, failed_dates=None):
+    import discovery
+
+    days = _pending_dates(start_day, end_day, month, year, checkpoint)
+    if not days:
+        return dict()
+    events = discovery.discover_events(days[0], days[-1], nba=nba, max_workers=max_workers,
+                                       rate_limiter=rate_limiter, show=show, failed_dates=failed_dates)
+    return discovery.events_by_date(events)
+
+
+# Summary urls of a date's games in a discovery manifest, less the games the checkpoint has written
+def _pending_game_urls(manifest, game_date, checkpoint):
+    return _unwritten_game_urls([e.url for e in manifest.get(game_date, [])], checkpoint)
+
+
+def _date_string(game_date):
+    return "%d-%d-%d" % (game_date.month, game_date.day, game_date.year)
+
+
+# SchemaRouter over sink, or over a csv on output_filename when no sink is given, with the header written
+#  The versioned outputs are closed on the way out, a sink that was passed in stays open for its owner
+@contextmanager
+def _range_output(output_filename, sink, nba):
+    own_sink = sink is None
+    if own_sink:
+        sink = CsvSink(output_filename)
+    router = stat_plans.SchemaRouter(sink)
+    try:
+        write_header_if_missing(router, nba=nba)
+        yield router
+    finally:
+        router.close_versions()
+        if own_sink:
+            sink.close()
+
+
+# Write a date's rows and checkpoint the date once it is complete, unless its scoreboard could not be read
+#  _write_new_rows has flushed the rows before the manifest claims them, returns how many rows were new
+def _write_date(router, game_date, output_strings, checkpoint, failed_dates, complete=True, show=False):
+    written = _write_new_rows(router, output_strings, checkpoint)
+    if checkpoint is not None and complete and game_date not in failed_dates:
+        checkpoint.mark_date_done(game_date)
+        checkpoint.save()
+    if show and complete:
+        print("Finished %s" % _date_string(game_date))
+    return written
+
+
+# With a checkpoint, completed dates are skipped before their scoreboard is requested and games already written
+#  are skipped before their summary is requested, the checkpoint is saved after every finished date
+#  Rows go to output_filename as csv unless another sink (e.g. sinks.ParquetSink) is given
+def write_game_data_for_date_range(start_day, end_day, month, year, output_filename, show=False, nba=False,
+                                   checkpoint=None, sink=None):
     last_date = "None"
-    with open(output_filename, 'a') as f:
-        if not header_exists:
-            test_game_url = TEST_NBA_GAME_URL if nba else TEST_GAME_URL
-            header = generate_header(requests.get(test_game_url).json()['boxscore']['teams'][1]['statistics'], nba=nba)
-            f.write(header)
+    failed_dates = set()
+    with _range_output(output_filename, sink, nba) as router:
+        manifest = _discover_pending(start_day, end_day, month, year, nba, checkpoint, show=show,
+                                     failed_dates=failed_dates)
         for day in range(start_day, end_day + 1):  # Looping through days in range for the month
-            date_game_urls = get_urls_from_date(day=day, month=month, year=year, show=show, nba=nba)  # Getting all game_urls for date
-            for game_url in date_game_urls:  # Looping through all extracted game_urls
+            game_date = datetime.date(year, month, day)
+            if checkpoint is not None and checkpoint.is_date_done(game_date):
+                if show:
+                    print("Skipping completed %s" % _date_string(game_date))
+                continue
+            output_strings = []
+            for game_url in _pending_game_urls(manifest, game_date, checkpoint):  # Looping through the date's games
                 output_string = convert_game_to_string(url=game_url,
-                                                       date_string="%d-%d-%d," % (month, day, year),
+                                                       date_string="%s," % _date_string(game_date),
                                                        show=show,
                                                        nba=nba)  # Getting data for each game_url
                 if output_string != "INVALID":
-                    f.write(output_string)  # Write the data from the game
-                    last_date = "%d-%d-%d" % (month, day, year)
-            if show:
-                print("Finished %d-%d-%d" % (month, day, year))
+                    output_strings.append(output_string)
+            if _write_date(router, game_date, output_strings, checkpoint, failed_dates, show=show):
+                last_date = _date_string(game_date)
     return last_date
 
+
+def _game_id_sort_key(output_string):
+    game_id = output_string.split(",")[0]
+    return (0, int(game_id), "") if game_id.isdigit() else (1, 0, game_id)
+
+
+# Every valid output row for one date sorted by GameID, the date's summaries are fetched on a small thread pool
+#  game_urls (e.g. from a discovery manifest, without the games already written) saves the scoreboard request
+def get_game_rows_for_date(day, month, year, show=False, nba=False, max_workers=4, game_urls=None):
+    if game_urls is None:
+        game_urls = get_urls_from_date(day=day, month=month, year=year, show=show, nba=nba)
+    output_strings = fetcher.fetch_concurrently(lambda game_url: convert_game_to_string(url=game_url,
+                                                                                         date_string="%d-%d-%d," % (month, day, year),
+                                                                                         show=show,
+                                                                                         nba=nba),
+                                                game_urls,
+                                                max_workers=max_workers)
+    return sorted([o for o in output_strings if o != "INVALID"], key=_game_id_sort_key)
+
+
+# Same output as write_game_data_for_date_range, but the range's games are discovered up front and every game
+#  summary is fetched on a bounded thread pool (optionally throttled per host), rows are written sorted by date
+#  then GameID
+def write_game_data_for_date_range_concurrent(start_day, end_day, month, year, output_filename, show=False, nba=False,
+                                              max_workers=fetcher.DEFAULT_MAX_WORKERS, requests_per_second=None,
+                                              checkpoint=None, sink=None):
+    rate_limiter = fetcher.HostRateLimiter(requests_per_second)
+    last_date = "None"
+    failed_dates = set()
+    with _range_output(output_filename, sink, nba) as router:
+        # Resolving every date's game urls first so all summaries can be fetched in one pool
+        manifest = _discover_pending(start_day, end_day, month, year, nba, checkpoint, max_workers=max_workers,
+                                     rate_limiter=rate_limiter, show=show, failed_dates=failed_dates)
+        dates = _pending_dates(start_day, end_day, month, year, checkpoint)
+        jobs = [(game_date, game_url) for game_date in dates
+                for game_url in _pending_game_urls(manifest, game_date, checkpoint)]
+        output_strings = fetcher.fetch_concurrently(lambda job: convert_game_to_string(url=job[1],
+                                                                                        date_string="%s," % _date_string(job[0]),
+                                                                                        show=show,
+                                                                                        nba=nba),
+                                                    jobs,
+                                                    max_workers=max_workers,
+                                                    rate_limiter=rate_limiter,
+                                                    rate_url=lambda job: job[1])
+
+        rows_by_date = dict((game_date, []) for game_date in dates)
+        for (game_date, _), output_string in zip(jobs, output_strings):
+            if output_string != "INVALID":
+                rows_by_date[game_date].append(output_string)
+        for game_date in dates:
+            if _write_date(router, game_date, sorted(rows_by_date[game_date], key=_game_id_sort_key), checkpoint,
+                           failed_dates, show=show):
+                last_date = _date_string(game_date)
+    return last_date
+
+
+# Same output as write_game_data_for_date_range_concurrent, but fetching, parsing and writing overlap: summaries
+#  download on fetch_workers threads while earlier ones are decoded on a pool of processes and finished dates are
+#  written in one batch each. Ctrl-C still writes every game parsed so far, only finished dates are checkpointed
+def write_game_data_for_date_range_pipelined(start_day, end_day, month, year, output_filename, show=False, nba=False,
+                                             fetch_workers=fetcher.DEFAULT_MAX_WORKERS, processes=None,
+                                             requests_per_second=None, checkpoint=None, sink=None):
+    rate_limiter = fetcher.HostRateLimiter(requests_per_second)
+    state = {"last_date": "None"}
+    failed_dates = set()
+
+    def fetch(job):
+        rate_limiter.wait(job[0])
+        return fetch_game_content(job[0], job[1], show=show, nba=nba)
+
+    with _range_output(output_filename, sink, nba) as router:
+        def write_group(game_date, output_strings, complete):
+            output_strings = sorted([o for o in output_strings if o is not None and o != "INVALID"],
+                                    key=_game_id_sort_key)
+            if _write_date(router, game_date, output_strings, checkpoint, failed_dates, complete=complete, show=show):
+                state["last_date"] = _date_string(game_date)
+
+        manifest = _discover_pending(start_day, end_day, month, year, nba, checkpoint, max_workers=fetch_workers,
+                                     rate_limiter=rate_limiter, show=show, failed_dates=failed_dates)
+        groups = [(game_date, [(game_url, "%s," % _date_string(game_date), show, nba)
+                               for game_url in _pending_game_urls(manifest, game_date, checkpoint)])
+                  for game_date in _pending_dates(start_day, end_day, month, year, checkpoint)]
+        pipeline.run_pipeline(groups, fetch, parse_game_job, write_group, fetch_workers=fetch_workers,
+                              processes=processes)
+    return state["last_date"]
+
+
+# Re-scrape only the urls recorded in a dead-letter file, summaries are re-fetched individually and failed
+#  scoreboards re-run their whole day. Urls that fail again are written back to the dead-letter file
+#  Rows go to output_filename as csv unless the run's own sink (e.g. sinks.ParquetSink) is given
+def retry_failed_urls(dead_letter_filename, output_filename, show=False, nba=False, checkpoint=None, sink=None):
+    fetcher.configure(dead_letter_path=dead_letter_filename)
+    with _range_output(output_filename, sink, nba) as router:
+        for url, date in fetcher.pop_dead_letters(dead_letter_filename):
+            if date is None:
+                if show:
+                    print("No date recorded for %s, skipping" % url)
+                continue
+            if "scoreboard" in url:
+                date_game_urls = get_urls_from_date(day=date.day, month=date.month, year=date.year, show=show, nba=nba)
+            else:
+                date_game_urls = [url]
+            for game_url in _unwritten_game_urls(date_game_urls, checkpoint):
+                output_string = convert_game_to_string(url=game_url,
+                                                       date_string="%s," % _date_string(date),
+                                                       show=show,
+                                                       nba=nba)
+                if output_string != "INVALID":
+                    _write_new_row(router, output_string, checkpoint)
+    if checkpoint is not None:
+        checkpoint.save()
+
+
 if __name__ == "__main__":
     # Arguments for looping through dates
     start_year = 2017
-    leap_year = 0  # set to 1 if (start_year + 1) is a leap year, 0 otherwise
     nba = False
     show = True
+    cache_dir = None  # Set to a directory to keep every downloaded response, reruns then skip the network
+    replay = False  # With a cache_dir, only read from the cache and never touch the network
+    parquet_root = None  # Set to a directory to write typed Parquet partitions instead of the csv
+    archive_dir = None  # Set to a directory to keep every raw response for offline re-extraction (raw_archive.py)
+    stream_summaries = False  # Set to True to stream summaries with ijson, lower peak memory but slower decoding
+    prometheus_path = None  # Set to a .prom path for node_exporter's textfile collector
+
+    parser = argparse.ArgumentParser(description="Scrape ESPN box scores for a season")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Only re-scrape the urls recorded in the dead-letter file of a previous run")
+    args = parser.parse_args()
 
     # Should not need to change anything below this comment
     nba_date_tuples = [(start_year, 10, 24, 31),  # Typically NBA Only, set start_day to after preseason ends
                    (start_year, 11, 1, 30),
                    (start_year, 12, 1, 31),
                    (start_year+1, 1, 1, 31),
-                   (start_year+1, 2, 1, 28 + leap_year),
+                   (start_year+1, 2, 1, calendar.monthrange(start_year+1, 2)[1]),
                    (start_year+1, 3, 1, 31),
                    (start_year+1, 4, 1, 30),
                    (start_year+1, 5, 1, 31),  # NBA Only
@@ -315,7 +618,7 @@ if __name__ == "__main__":
     # ncaa_date_tuples = [(start_year, 11, 1, 30),
     #                (start_year, 12, 1, 31),
     #                (start_year+1, 1, 1, 31),
-    #                (start_year+1, 2, 1, 28 + leap_year),
+    #                (start_year+1, 2, 1, calendar.monthrange(start_year+1, 2)[1]),
     #                (start_year+1, 3, 1, 31),
     #                (start_year+1, 4, 1, 10)]
 
@@ -325,23 +628,41 @@ if __name__ == "__main__":
     date_tuples = nba_date_tuples if nba else ncaa_date_tuples
     date_string = "%s%s" % (str(start_year)[-2:], str(start_year+1)[-2:])
     output_file = "C:/Users/robsc/Documents/Data and Stats/ScrapedData/%s/%s%s_ESPN.csv" % (league_string, league_string, date_string)
+    dead_letter_file = output_file.replace(".csv", "_failed.tsv")
+    checkpoint = Checkpoint.for_output(output_file.replace(".csv", "_manifest.json"), output_file)
+    if cache_dir is not None:
+        response_cache.configure(cache_dir, replay=replay)
+    if archive_dir is not None:
+        raw_archive.configure(archive_dir)
+    summary_stream.set_streaming(stream_summaries)
+    fetcher.configure(dead_letter_path=dead_letter_file)
+    sink = ParquetSink(parquet_root, "espn", "NBA" if nba else "NCAAB") if parquet_root is not None else None
 
-    for date_tuple in date_tuples:
-        year = date_tuple[0]
-        month = date_tuple[1]
-        start_day = date_tuple[2]
-        end_day = date_tuple[3]
-        last_date_scraped = write_game_data_for_date_range(start_day=start_day,
-                                                           end_day=end_day,
-                                                           month=month,
-                                                           year=year,
-                                                           output_filename=output_file,
-                                                           show=show,
-                                                           nba=nba)
-        if show:
-            print("Last date scraped %s" % last_date_scraped)
-
-    # Checking for and removing duplicates
-    data = pd.read_csv(output_file)
-    data = data.drop_duplicates(subset=['GameID'])
-    data.to_csv(output_file, index=False)
+    try:
+        if args.retry_failed:
+            retry_failed_urls(dead_letter_file, output_file, show=show, nba=nba, checkpoint=checkpoint, sink=sink)
+        else:
+            for date_tuple in date_tuples:
+                year = date_tuple[0]
+                month = date_tuple[1]
+                start_day = date_tuple[2]
+                end_day = date_tuple[3]
+                last_date_scraped = write_game_data_for_date_range_pipelined(start_day=start_day,
+                                                                             end_day=end_day,
+                                                                             month=month,
+                                                                             year=year,
+                                                                             output_filename=output_file,
+                                                                             show=show,
+                                                                             nba=nba,
+                                                                             checkpoint=checkpoint,
+                                                                             sink=sink)
+                if show:
+                    print("Last date scraped %s" % last_date_scraped)
+    finally:  # On Ctrl-C the rows already handed to the sink are still written out
+        if sink is not None:
+            sink.close()
+
+    run_info = {"league": "NBA" if nba else "NCAAB", "source": "ESPN", "season": date_string}
+    metrics.write_report(output_file.replace(".csv", "_report.json"), extra=run_info)
+    if prometheus_path is not None:
+        metrics.write_prometheus(prometheus_path, labels={"league": run_info["league"], "source": "ESPN"})
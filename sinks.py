@@ -0,0 +1,328 @@
+import datetime
+import os
+import re
+import time
+from os.path import isfile
+
+import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+NULL_STRINGS = ("", "NaN", "nan", "None", "INVALID")
+LINE_SENTINELS = (0.1, -999.0, 999.0)  # Error codes from line_scraper.convert_line/_best_line/_worst_line
+STRING_COLUMNS = ("Name", "Venue", "City", "State", "Zip", "Referees")
+BOOL_COLUMNS = ("Neutral", "Conference")
+FLOAT_COLUMNS = ("Spread", "OverUnder", "AttendanceRatio", "TiedSeconds", "ClutchSeconds")
+LINE_COLUMNS = ("OptLine", "OptPayout", "BovLine", "BovPayout", "PesLine", "PesPayout")
+MISSING_AS_NEGATIVE = ("Rank", "APRank", "FinalScore", "1stQ", "2ndQ", "3rdQ", "1stQuarter", "2ndQuarter",
+                       "3rdQuarter", "4thQuarter", "Home4thQuarter", "1stHalf", "2ndHalf")  # -1 is the scrapers' "could not parse"
+COMPACTED_PART = re.compile(r"^part-(\d+-\d+)-(\d+)to(\d+)\.parquet$")  # Run id, first and last part number
+
+
+# Season label a game date belongs to, e.g. 1-23-2018 -> "1718", seasons roll over in July
+def season_for_date(date):
+    start_year = date.year if date.month >= 7 else date.year - 1
+    return "%s%s" % (str(start_year)[-2:], str(start_year + 1)[-2:])
+
+
+def parse_row_date(value):
+    return datetime.datetime.strptime(value, "%m-%d-%Y").date()
+
+
+# Column names of a row of an ESPN file, NBA rows written under the old header carry no Rank, Neutral or
+#  Conference values although it names them, so their columns are the header without those
+def row_columns(columns, row_length):
+    if row_length != len(columns):
+        stripped = [c for c in columns if not c.endswith("-Rank") and c not in ("Neutral", "Conference")]
+        if row_length == len(stripped):
+            return stripped
+    return columns
+
+
+# Positions of the named columns in a row of an ESPN file, see row_columns
+def column_positions(columns, row_length, names):
+    columns = row_columns(columns, row_length)
+    return dict((c, columns.index(c)) for c in names if c in columns)
+
+
+class CsvSink(object):
+    """Appends the scrapers' csv lines to a single file, the original output format"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    # Header line already in the file, or None when the file is new or does not start with one
+    def existing_header(self):
+        if not isfile(self.path):
+            return None
+        with open(self.path, 'r') as ifile:
+            header = ifile.readline()
+        if len(header.split(",")) > 1 and header.split(",")[0] in ("GameID", "Date"):
+            return header
+        return None
+
+    def _handle(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def write_header(self, header):
+        self._handle().write(header)
+
+    def write_row(self, row):
+        with metrics.timer("write"):
+            self._handle().write(row)
+        metrics.count("rows_written")
+
+    # One write call for a batch of rows, e.g. a whole date
+    def write_rows(self, rows):
+        if not rows:
+            return
+        with metrics.timer("write"):
+            self._handle().write("".join(rows))
+        metrics.count("rows_written", len(rows))
+
+    # Sibling file for rows of another column layout, stat_plans.SchemaRouter names one per schema version
+    def versioned(self, version):
+        root, extension = os.path.splitext(self.path)
+        return CsvSink("%s_schema%s%s" % (root, version, extension or ".csv"))
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ListSink(object):
+    """Collects rows in memory, used to hand a unit of work's rows back to a parent process"""
+
+    def __init__(self):
+        self.header = None
+        self.rows = []
+        self.versions = dict()  # version -> ListSink
+
+    def existing_header(self):
+        return self.header
+
+    def write_header(self, header):
+        self.header = header
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+
+    def versioned(self, version):
+        return self.versions.setdefault(version, ListSink())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _base_column(name):
+    if name.startswith("SBR-"):  # SBR columns of a merge.py table
+        name = name[len("SBR-"):]
+    for prefix in ("Home-", "Away-"):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return name
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        return int(number) if number.is_integer() else None
+
+
+# Arrow type and string -> value converter for a scraped column, picked from the column name
+def column_converter(name):
+    base = _base_column(name)
+    if base == "Date":
+        return pa.date32(), parse_row_date
+    if base in STRING_COLUMNS:
+        return pa.string(), lambda value: value
+    if base in BOOL_COLUMNS:
+        return pa.bool_(), lambda value: value == "True"
+    if base in LINE_COLUMNS:
+        return pa.float64(), lambda value: None if float(value) in LINE_SENTINELS else float(value)
+    if base in FLOAT_COLUMNS or "%" in base or "Pct" in base:
+        return pa.float64(), float
+    if base in MISSING_AS_NEGATIVE:
+        return pa.int64(), lambda value: None if _to_int(value) in (None, -1) else _to_int(value)
+    return pa.int64(), _to_int
+
+
+class ParquetSink(object):
+    """Typed Parquet output partitioned as root/dataset=<dataset>/league=<league>/season=<season>/part-*.parquet
+
+    Rows are the same csv lines the scrapers build, parsed against the header into typed columns with nulls in
+    place of "NaN" strings and sentinel codes. Each partition keeps a writer open and emits a row group every
+    row_group_size rows. Parquet files cannot be appended to and a part file is only readable once its footer is
+    written, so flush() finishes every open part file and the next row starts a new one. close() then compacts the
+    small parts of each partition into one file of row_group_size row groups.
+    """
+
+    def __init__(self, root, dataset, league, header=None, row_group_size=5000):
+        if pa is None:
+            raise ImportError("ParquetSink requires pyarrow, install it or use CsvSink")
+        self.root = root
+        self.dataset = dataset
+        self.league = league
+        self.row_group_size = row_group_size
+        self._columns = None
+        self._buffers = dict()  # season -> list of parsed rows
+        self._writers = dict()
+        self._run_id = "%d-%d" % (int(time.time() * 1000), os.getpid())
+        self._part_number = 0  # Part files started by this sink, numbers the next one
+        self._parts = dict()  # season -> [(number, path)] of the part files written since the last compaction
+        if header is not None:
+            self.write_header(header)
+
+    # Parquet needs the header every run to type the rows, so callers always (re)send it
+    def existing_header(self):
+        return None
+
+    # Sending the same header again is a no-op, a new one first finishes the parts of the old one so no part file
+    #  or compacted file mixes schemas
+    def write_header(self, header):
+        names = header.strip().split(",")
+        if self._columns is not None:
+            if names == [name for name, _, _ in self._columns]:
+                return
+            self.compact()
+        self._columns = [(name,) + column_converter(name) for name in names]
+        self._schema = pa.schema([pa.field(name, arrow_type) for name, arrow_type, _ in self._columns])
+        self._date_index = names.index("Date")
+
+    # A row must have exactly the header's columns, padding or truncating it would put values in the wrong ones
+    def _parse(self, row):
+        values = row.rstrip("\n").split(",")
+        if len(values) != len(self._columns):
+            raise ValueError("Row has %d columns, the header has %d: %s" % (len(values), len(self._columns),
+                                                                            values[0]))
+        parsed = []
+        for (name, _, convert), value in zip(self._columns, values):
+            if value in NULL_STRINGS:
+                parsed.append(None)
+                continue
+            try:
+                parsed.append(convert(value))
+            except ValueError:
+                parsed.append(None)
+        return parsed
+
+    def write_row(self, row):
+        if self._columns is None:
+            raise ValueError("write_header must be called before write_row")
+        with metrics.timer("write"):
+            parsed = self._parse(row)
+        metrics.count("rows_written")
+        season = season_for_date(parsed[self._date_index])
+        buffer = self._buffers.setdefault(season, [])
+        buffer.append(parsed)
+        if len(buffer) >= self.row_group_size:
+            self._write_row_group(season)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def _write_row_group(self, season):
+        rows = self._buffers.get(season)
+        if not rows:
+            return
+        if season not in self._writers:
+            directory = os.path.join(self.root, "dataset=%s" % self.dataset, "league=%s" % self.league,
+                                     "season=%s" % season)
+            if season not in self._parts:
+                if os.path.isdir(directory):
+                    _drop_compacted_parts(directory)
+                else:
+                    os.makedirs(directory)
+                self._parts[season] = []
+            path = os.path.join(directory, "part-%s-%d.parquet" % (self._run_id, self._part_number))
+            self._parts[season].append((self._part_number, path))
+            self._part_number += 1
+            self._writers[season] = pq.ParquetWriter(path, self._schema)
+        with metrics.timer("write_row_group"):
+            arrays = [pa.array([row[i] for row in rows], type=self._columns[i][1]) for i in range(len(self._columns))]
+            self._writers[season].write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._buffers[season] = []
+
+    # Rows of another column layout go to their own dataset, e.g. dataset=espn_schema1a2b3c4d
+    def versioned(self, version):
+        return ParquetSink(self.root, "%s_schema%s" % (self.dataset, version), self.league,
+                           row_group_size=self.row_group_size)
+
+    # Callers checkpoint right after a flush, so the pending rows are written and their part files closed, a
+    #  flush with nothing pending leaves no empty part file behind
+    def flush(self):
+        for season in list(self._buffers):
+            self._write_row_group(season)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = dict()
+
+    # Rewrites each partition's part files written since the last compaction as one file of row_group_size row
+    #  groups. The small parts are removed once the compacted file is in place, a crash in between leaves both and
+    #  the next sink writing to the partition removes the small ones
+    def compact(self):
+        self.flush()
+        for season, parts in self._parts.items():
+            if len(parts) > 1:
+                directory = os.path.dirname(parts[0][1])
+                name = "part-%s-%dto%d.parquet" % (self._run_id, parts[0][0], parts[-1][0])
+                with metrics.timer("compact"):
+                    table = pa.concat_tables([pq.ParquetFile(path).read() for _, path in parts])
+                    # Readers skip files starting with "_", so the half-written file is never picked up
+                    temporary = os.path.join(directory, "_%s.tmp" % name)
+                    pq.write_table(table, temporary, row_group_size=self.row_group_size)
+                    os.replace(temporary, os.path.join(directory, name))
+                    for _, path in parts:
+                        os.remove(path)
+                metrics.count("parquet_parts_compacted", len(parts))
+            self._parts[season] = []
+
+    def close(self):
+        self.compact()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Removes part files whose rows a compacted file in the directory already holds, left by a crash during compact()
+def _drop_compacted_parts(directory):
+    for name in os.listdir(directory):
+        match = COMPACTED_PART.match(name)
+        if match is None:
+            continue
+        for number in range(int(match.group(2)), int(match.group(3)) + 1):
+            try:
+                os.remove(os.path.join(directory, "part-%s-%d.parquet" % (match.group(1), number)))
+            except FileNotFoundError:
+                pass
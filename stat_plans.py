@@ -0,0 +1,177 @@
+import hashlib
+from collections import namedtuple
+
+import metrics
+
+# Column layout of one ESPN row, the stat-label signatures of both teams and the league
+RowSchema = namedtuple("RowSchema", ["home_labels", "away_labels", "nba"])
+
+SCORE_COLUMNS = ("FG-Made", "3PT-Made", "FT-Made")
+
+_plans = dict()  # labels -> StatPlan, per process
+_headers = dict()  # (RowSchema, legacy) -> header
+
+
+class StatPlan(object):
+    """Column slots for one stat-label signature, compiled the first time a box score with those labels is seen
+
+    "Made-Attempted" labels are split into their -Made and -Attempted columns once here, so extracting a team's
+    statistics is a fixed walk over the stat list. A plan only ever sees stat lists whose labels are exactly its
+    own, a game listing other labels gets another plan and with it another header.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.columns = []
+        self._splits = []
+        for label in labels:  # Label is the official public ESPN category name for statistic
+            if "Made-Attempted" in label:  # Formatted where type of Make-Attempt is given in characters before space
+                prefix = label.split(" ")[0]
+                self.columns += ["%s-Made" % prefix, "%s-Attempted" % prefix]
+                self._splits.append(True)
+            else:
+                self.columns.append(label)
+                self._splits.append(False)
+        self._score_slots = [self.columns.index(c) if c in self.columns else None for c in SCORE_COLUMNS]
+
+    # displayValues of stat_list in column order, made-attempted pairs split in two
+    def values(self, stat_list):
+        values = []
+        for split, s in zip(self._splits, stat_list):
+            if split:
+                made, attempted = s['displayValue'].split("-")
+                values += [made, attempted]
+            else:
+                values.append(s['displayValue'])
+        return values
+
+    # Points from the box score, 0 when a made column is missing (no play-by-play to take the final score from)
+    def score(self, values):
+        field_goals, threes, free_throws = self._score_slots
+        if field_goals is None or threes is None or free_throws is None:
+            metrics.count("missing_box_score")
+            return "0"
+        threes_made = int(values[threes])
+        return str(threes_made * 3 + (int(values[field_goals]) - threes_made) * 2 + int(values[free_throws]))
+
+
+def plan_for_labels(labels):
+    plan = _plans.get(labels)
+    if plan is None:
+        plan = _plans[labels] = StatPlan(labels)
+        metrics.count("stat_plans_compiled")
+    return plan
+
+
+def plan_for(stat_list):
+    return plan_for_labels(tuple(s['label'] for s in stat_list))
+
+
+# Header of rows extracted with schema, NBA rows carry no Rank, Neutral or Conference values
+#  legacy=True gives the header written before that was fixed, which named those columns for the NBA as well
+def schema_header(schema, legacy=False):
+    header = _headers.get((schema, legacy))
+    if header is not None:
+        return header
+    extra_nba = schema.nba and not legacy
+    columns = ["GameID", "Date", "Spread"] + ([] if schema.nba else ["OverUnder"])
+    for loc, labels in (("Home", schema.home_labels), ("Away", schema.away_labels)):
+        team = ["Name", "id"] + ([] if extra_nba else ["Rank"]) + ["FinalScore"]
+        if schema.nba:
+            team += ["1stQ", "2ndQ", "3rdQ"]
+        columns += ["%s-%s" % (loc, c) for c in team + plan_for_labels(labels).columns]
+    if not extra_nba:
+        columns += ["Neutral", "Conference"]
+    columns += ["Venue", "City", "State", "Zip", "Capacity", "Attendance", "AttendanceRatio", "Referees"]
+    header = _headers[(schema, legacy)] = ",".join(columns) + "\n"
+    return header
+
+
+# Short, stable id of a header, names the versioned output a row with that layout is written to
+def schema_version(header):
+    return hashlib.sha1(header.encode("utf-8")).hexdigest()[:8]
+
+
+class GameRow(str):
+    """An output row that remembers the RowSchema it was extracted with, otherwise just the csv line"""
+
+    def __new__(cls, text, schema):
+        row = str.__new__(cls, text)
+        row.schema = schema
+        return row
+
+    def __reduce__(self):
+        return GameRow, (str(self), self.schema)
+
+
+class SchemaRouter(object):
+    """Sink wrapper sending every GameRow to an output whose header is that row's layout
+
+    Rows matching the header of the wrapped sink go to it, any other layout goes to sink.versioned(<id>) with its
+    own header, so a game whose stat list differs from the rest can never shift the columns of a file. Rows
+    without a schema (SBR lines, plain strings) always go to the wrapped sink.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.header = None
+        self._versions = dict()  # header -> versioned sink
+
+    def existing_header(self):
+        if self.header is None:
+            self.header = self.sink.existing_header()
+        return self.header
+
+    def write_header(self, header):
+        self.header = header
+        self.sink.write_header(header)
+
+    def _sink_for(self, row):
+        schema = getattr(row, "schema", None)
+        if schema is None or self.existing_header() is None:
+            return self.sink
+        header = schema_header(schema)
+        if header == self.header or schema_header(schema, legacy=True) == self.header:
+            return self.sink
+        versioned = self._versions.get(header)
+        if versioned is None:
+            versioned = self._versions[header] = self.sink.versioned(schema_version(header))
+            if versioned.existing_header() is None:
+                versioned.write_header(header)
+        metrics.count("schema_versioned_rows")
+        return versioned
+
+    def write_row(self, row):
+        self._sink_for(row).write_row(row)
+
+    # Rows keep their order within each output
+    def write_rows(self, rows):
+        batches = []
+        for row in rows:
+            sink = self._sink_for(row)
+            if not batches or batches[-1][0] is not sink:
+                batches.append((sink, []))
+            batches[-1][1].append(row)
+        for sink, batch in batches:
+            sink.write_rows(batch)
+
+    def flush(self):
+        self.sink.flush()
+        for versioned in self._versions.values():
+            versioned.flush()
+
+    # Closes the versioned outputs only, for callers that close the wrapped sink themselves
+    def close_versions(self):
+        for versioned in self._versions.values():
+            versioned.close()
+        self._versions = dict()
+
+    def close(self):
+        self.close_versions()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,119 @@
+import json_backend
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+SUMMARY_KEYS = ("header", "boxscore", "pickcenter", "gameInfo")  # Everything the extractors in scraper.py read
+STREAM_BUFFER_SIZE = 16 * 1024  # Parser events are batched per buffer, larger buffers raise peak memory not speed
+_CONTAINER_STARTS = ("start_map", "start_array")
+_CONTAINER_ENDS = ("end_map", "end_array")
+
+# Decoding a summary whole is several times faster, streaming only pays off when peak memory matters
+_active = {"streaming": False}
+
+
+# Stream summaries with ijson (never building the full play list) or decode them whole with json_backend
+def set_streaming(enabled):
+    if enabled and ijson is None:
+        raise ImportError("Streaming summaries requires ijson, install it or keep the json_backend decoder")
+    _active["streaming"] = enabled
+
+
+def is_streaming():
+    return _active["streaming"]
+
+
+def _play(period, away_score, home_score):
+    return {"period": {"number": period}, "awayScore": away_score, "homeScore": home_score}
+
+
+# (period, awayScore, homeScore) per play -> the first and last play of every run of one period
+#  scraper.get_quarter_scores only looks at the score before each period change, so it gives the same
+#  result on these few plays as on the full list
+def boundary_plays(score_tuples):
+    boundaries = []
+    previous = None
+    for score in score_tuples:
+        if previous is None or score[0] != previous[0]:
+            if previous is not None and (not boundaries or boundaries[-1] is not previous):
+                boundaries.append(previous)
+            boundaries.append(score)
+        previous = score
+    if previous is not None and boundaries[-1] is not previous:
+        boundaries.append(previous)
+    return [_play(*score) for score in boundaries]
+
+
+def _decoded_summary(content, plays):
+    game_json = json_backend.loads(content)
+    summary = dict((key, game_json[key]) for key in SUMMARY_KEYS if key in game_json)
+    if plays and 'plays' in game_json:
+        summary['plays'] = boundary_plays((p['period']['number'], p['awayScore'], p['homeScore'])
+                                          for p in game_json['plays'])
+    return summary
+
+
+# One pass over the parser events: the SUMMARY_KEYS subtrees are built, every other key (news, videos,
+#  standings, ...) is skipped, and each play is reduced to its period and scores as soon as it closes
+def _streamed_summary(content, plays):
+    summary = dict()
+    builder, key, depth = None, None, 0
+    score_tuples = []
+    period = away_score = home_score = None
+    for prefix, event, value in ijson.parse(content, buf_size=STREAM_BUFFER_SIZE, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in _CONTAINER_STARTS:
+                depth += 1
+            elif event in _CONTAINER_ENDS:
+                depth -= 1
+            if depth == 0:
+                summary[key] = builder.value
+                builder = None
+        elif prefix in SUMMARY_KEYS and event != "map_key":
+            builder, key, depth = ObjectBuilder(), prefix, 1 if event in _CONTAINER_STARTS else 0
+            builder.event(event, value)
+            if depth == 0:
+                summary[key] = builder.value
+                builder = None
+        elif not plays:
+            continue
+        elif prefix == "plays.item.period.number":
+            period = value
+        elif prefix == "plays.item.awayScore":
+            away_score = value
+        elif prefix == "plays.item.homeScore":
+            home_score = value
+        elif prefix == "plays.item" and event == "end_map":
+            if period is None or away_score is None or home_score is None:
+                raise KeyError('plays')  # The full-list path fails on the same play
+            score_tuples.append((period, away_score, home_score))
+            if len(score_tuples) > 2:  # Only the tail of the current period run is still needed
+                score_tuples[-3:] = _collapse(score_tuples[-3:])
+            period = away_score = home_score = None
+        elif prefix == "plays" and event == "start_array":
+            summary['plays'] = None
+    if 'plays' in summary:
+        summary['plays'] = boundary_plays(score_tuples)
+    return summary
+
+
+# Drops the middle of three plays when all share a period, it is neither the first nor the last of its run
+def _collapse(last_three):
+    if last_three[0][0] == last_three[1][0] == last_three[2][0]:
+        return [last_three[0], last_three[2]]
+    return last_three
+
+
+# A summary dict with only the keys scraper.build_game_record reads, 'plays' holding just the period boundary
+#  plays (and omitted unless plays=True). Raises json_backend.DecodeError for malformed payloads either way
+def load_summary(content, plays=True):
+    if not _active["streaming"]:
+        return _decoded_summary(content, plays)
+    try:
+        return _streamed_summary(content, plays)
+    except ijson.JSONError as error:
+        raise json_backend.DecodeError(str(error), "", 0)
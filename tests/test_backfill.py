@@ -0,0 +1,56 @@
+import datetime
+
+import backfill
+import line_scraper
+import metrics
+from checkpoint import Checkpoint
+
+
+def test_season_dates_cover_the_window_across_new_year():
+    dates = backfill.season_dates("NCAAB", 2017)
+    assert dates[0] == datetime.date(2017, 11, 1)
+    assert dates[-1] == datetime.date(2018, 4, 10)
+    assert len(dates) == len(set(dates)) == (dates[-1] - dates[0]).days + 1
+    assert datetime.date(2020, 2, 29) in backfill.season_dates("NBA", 2019)
+    assert backfill.season_dates("NBA", 2017, first=(1, 1), last=(1, 3)) == \
+        [datetime.date(2018, 1, 1), datetime.date(2018, 1, 2), datetime.date(2018, 1, 3)]
+
+
+def test_parse_season_range():
+    assert backfill.parse_season_range("2017") == [2017]
+    assert backfill.parse_season_range("2011-2013") == [2011, 2012, 2013]
+
+
+def test_a_unit_with_fetch_errors_is_not_complete():
+    assert backfill._unit_failed({"counters": {"summary_connection_errors": 1, "http_requests": 9}})
+    assert backfill._unit_failed({"counters": {"scoreboard_decode_errors": 1}})
+    assert not backfill._unit_failed({"counters": {"http_requests": 9, "summary_key_errors": 2}})
+
+
+def test_new_games_skips_indexed_and_repeated_games(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "out_manifest.json"))
+    checkpoint.add_game("1")
+    rows, game_ids = backfill._new_games(["1,a\n", "2,b\n", "2,c\n", "3,d\n"], checkpoint)
+    checkpoint.game_index.close()
+    assert rows == ["2,b\n", "3,d\n"]
+    assert game_ids == ["2", "3"]
+
+
+def test_away_back_to_back_comes_from_the_previous_day():
+    header = line_scraper.NCAAB_HEADER
+    columns = header.strip().split(",")
+    row = dict((name, "0") for name in columns)
+
+    def _row(away, home):
+        row.update({"Away-Name": away, "Home-Name": home})
+        return ",".join(row[name] for name in columns) + "\n"
+
+    rows, teams = backfill._set_b2b([_row("A", "B"), _row("C", "D")], header, prev_teams={"C", "B"})
+    assert [r.strip().split(",")[-1] for r in rows] == ["0", "1"]
+    assert teams == {"A", "B", "C", "D"}
+
+
+def test_workers_start_without_the_parents_counters():
+    metrics.count("http_requests", 5)
+    backfill._init_worker(None, None, False, None)
+    assert metrics.drain() == {"counters": {}, "stages": {}}
@@ -0,0 +1,32 @@
+import datetime
+
+from checkpoint import Checkpoint, event_id_from_url
+
+PAST = datetime.date(2018, 1, 2)
+
+
+def test_event_id_from_url():
+    assert event_id_from_url("http://x/summary?event=400947324") == "400947324"
+    assert event_id_from_url("http://x/summary") == ""
+
+
+def test_completed_dates_survive_a_restart(tmp_path):
+    manifest = str(tmp_path / "out_manifest.json")
+    checkpoint = Checkpoint(manifest)
+    checkpoint.mark_date_done(PAST)
+    checkpoint.mark_date_done(datetime.date.today())  # Today's slate can still change
+    checkpoint.save()
+
+    resumed = Checkpoint(manifest)
+    assert resumed.is_date_done(PAST)
+    assert not resumed.is_date_done(datetime.date.today())
+
+
+def test_game_ids_survive_a_restart(tmp_path):
+    manifest = str(tmp_path / "out_manifest.json")
+    checkpoint = Checkpoint(manifest)
+    assert checkpoint.add_game("1")
+    assert not checkpoint.add_game("1")
+    checkpoint.game_index.close()
+
+    assert Checkpoint(manifest).has_game("1")
@@ -0,0 +1,99 @@
+import datetime
+import json
+import re
+
+import pytest
+
+import discovery
+import fetcher
+import metrics
+from discovery import DiscoveredEvent
+
+JAN_1, JAN_2, JAN_3 = datetime.date(2018, 1, 1), datetime.date(2018, 1, 2), datetime.date(2018, 1, 3)
+
+
+class Response(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.headers = {}
+        self.elapsed = datetime.timedelta(seconds=0.01)
+
+
+class Scoreboards(object):
+    """Serves scoreboard urls from a dates -> events dict, dates missing from it answer 503"""
+
+    def __init__(self, boards):
+        self.boards = boards
+        self.requested = []
+
+    def get(self, url, timeout=None, headers=None):
+        dates = re.search(r"dates=([\d-]+)", url).group(1)
+        self.requested.append(dates)
+        if dates not in self.boards:
+            return Response(503)
+        return Response(200, {"events": [{"id": event_id, "date": date} for event_id, date in self.boards[dates]]})
+
+
+@pytest.fixture
+def serve(tmp_path, monkeypatch):
+    monkeypatch.setitem(fetcher._settings, "max_retries", 0)
+    monkeypatch.setitem(fetcher._settings, "dead_letter_path", str(tmp_path / "failed.tsv"))
+
+    def _serve(boards):
+        scoreboards = Scoreboards(boards)
+        monkeypatch.setattr(fetcher, "get_session", lambda: scoreboards)
+        return scoreboards
+    return _serve
+
+
+def test_eastern_date_follows_daylight_saving():
+    assert discovery.eastern_date("2018-01-24T02:00Z") == datetime.date(2018, 1, 23)  # 9pm EST
+    assert discovery.eastern_date("2018-01-24T05:00Z") == datetime.date(2018, 1, 24)  # Midnight EST
+    assert discovery.eastern_date("2018-03-11T04:30Z") == datetime.date(2018, 3, 10)  # Still EST, UTC-5
+    assert discovery.eastern_date("2018-03-12T03:30Z") == datetime.date(2018, 3, 11)  # EDT from 3-11, UTC-4
+    assert discovery.eastern_date("2018-03-12T04:30Z") == datetime.date(2018, 3, 12)
+    assert discovery.eastern_date("2018-11-05T04:30Z") == datetime.date(2018, 11, 4)  # EST again from 11-4
+    assert discovery.eastern_date("2006-04-03T03:30Z") == datetime.date(2006, 4, 2)  # Pre-2007 rules, EDT from 4-2
+
+
+def test_a_range_resolves_every_day_in_one_request(serve):
+    scoreboards = serve({"20180101-20180103": [("12", "2018-01-03T00:00Z"), ("11", "2018-01-02T02:00Z"),
+                                               ("13", "2018-01-03T23:00Z")]})
+    events = discovery.discover_events(JAN_1, JAN_3, nba=True)
+    assert scoreboards.requested == ["20180101-20180103"]
+    assert [(e.date, e.event_id) for e in events] == [(JAN_1, "11"), (JAN_2, "12"), (JAN_3, "13")]
+    assert events[0].url.endswith("nba/summary?event=11")
+
+
+def test_a_full_range_is_split(serve, monkeypatch):
+    monkeypatch.setattr(discovery, "RANGE_LIMIT", 2)
+    scoreboards = serve({"20180101-20180103": [("1", "2018-01-01T20:00Z"), ("2", "2018-01-02T20:00Z")],
+                         "20180101-20180102": [("1", "2018-01-01T20:00Z"), ("2", "2018-01-02T20:00Z")],
+                         "20180101": [("1", "2018-01-01T20:00Z")], "20180102": [("2", "2018-01-02T20:00Z")],
+                         "20180103": [("3", "2018-01-03T20:00Z")]})
+    events = discovery.discover_events(JAN_1, JAN_3, nba=True)
+    assert [e.event_id for e in events] == ["1", "2", "3"]
+    assert metrics.snapshot()["counters"]["range_scoreboard_splits"] == 2
+
+
+def test_a_failed_range_only_dead_letters_the_failed_days(serve, tmp_path):
+    serve({"20180101": [("1", "2018-01-01T20:00Z")], "20180103": [("3", "2018-01-03T20:00Z")]})
+    failed_dates = set()
+    events = discovery.discover_events(JAN_1, JAN_3, nba=True, max_workers=1, failed_dates=failed_dates)
+    assert [e.event_id for e in events] == ["1", "3"]
+    assert failed_dates == {JAN_2}
+    assert fetcher.pop_dead_letters(str(tmp_path / "failed.tsv")) == [(
+        "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard?dates=20180102&limit=30", JAN_2)]
+    assert metrics.snapshot()["counters"]["dead_letters"] == 1
+
+
+def test_manifest_round_trip_and_grouping(tmp_path):
+    events = [DiscoveredEvent(JAN_1, "1", "http://x/1"), DiscoveredEvent(JAN_1, "2", "http://x/2"),
+              DiscoveredEvent(JAN_3, "3", "http://x/3")]
+    path = str(tmp_path / "manifest.tsv")
+    discovery.write_manifest(path, events)
+    assert discovery.read_manifest(path) == events
+    grouped = discovery.events_by_date(events)
+    assert sorted(grouped) == [JAN_1, JAN_3]
+    assert [e.event_id for e in grouped[JAN_1]] == ["1", "2"]
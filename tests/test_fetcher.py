@@ -0,0 +1,112 @@
+import datetime
+
+import pytest
+import requests
+
+import fetcher
+import metrics
+
+JAN_2, JAN_3 = datetime.date(2018, 1, 2), datetime.date(2018, 1, 3)
+
+
+class Response(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b"{}"
+        self.elapsed = datetime.timedelta(seconds=0.01)
+
+
+class Session(object):
+    """Answers each get() with the next scripted status, or raises it when it is an exception"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def get(self, url, timeout=None, headers=None):
+        self.calls += 1
+        answer = self.script.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(fetcher.time, "sleep", slept.append)
+    return slept
+
+
+def _serve(monkeypatch, *script):
+    session = Session(script)
+    monkeypatch.setattr(fetcher, "get_session", lambda: session)
+    return session
+
+
+def test_retryable_statuses_are_retried_with_backoff(monkeypatch, sleeps):
+    monkeypatch.setitem(fetcher._settings, "backoff_base", 1.0)
+    session = _serve(monkeypatch, Response(503), requests.exceptions.Timeout(), Response(200))
+    assert fetcher.get("http://x/a").status_code == 200
+    assert session.calls == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0  # Full jitter under a doubling cap
+    counters = metrics.snapshot()["counters"]
+    assert counters["http_requests"] == 3
+    assert counters["http_retries"] == 2
+    assert counters["http_failures_http_503"] == 1
+    assert counters["http_failures_timeout"] == 1
+
+
+def test_other_statuses_are_returned_without_retrying(monkeypatch, sleeps):
+    session = _serve(monkeypatch, Response(404))
+    assert fetcher.get("http://x/a").status_code == 404
+    assert session.calls == 1
+    assert sleeps == []
+
+
+def test_retry_after_is_honoured_up_to_the_backoff_cap(monkeypatch, sleeps):
+    monkeypatch.setitem(fetcher._settings, "backoff_max", 10.0)
+    _serve(monkeypatch, Response(429, {"Retry-After": "3"}), Response(429, {"Retry-After": "60"}), Response(200))
+    fetcher.get("http://x/a")
+    assert sleeps == [3.0, 10.0]
+
+
+def test_exhausted_retries_are_dead_lettered(tmp_path, monkeypatch, sleeps):
+    path = str(tmp_path / "failed.tsv")
+    monkeypatch.setitem(fetcher._settings, "dead_letter_path", path)
+    monkeypatch.setitem(fetcher._settings, "max_retries", 2)
+    session = _serve(monkeypatch, Response(502), Response(502), Response(502))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetcher.get("http://x/a", date=JAN_2)
+    assert session.calls == 3
+    assert len(sleeps) == 2  # No sleep after the last attempt
+    assert metrics.snapshot()["counters"]["dead_letters"] == 1
+    with open(path) as ifile:
+        assert ifile.read() == "http://x/a\t2018-01-02\tHTTP 502\n"
+
+
+def _dead_letters(monkeypatch, path):
+    monkeypatch.setitem(fetcher._settings, "dead_letter_path", path)
+    fetcher.record_dead_letter("http://x/a", JAN_2, "HTTP 503")
+    fetcher.record_dead_letter("http://x/b", JAN_3, "Timeout")
+    fetcher.record_dead_letter("http://x/a", JAN_2, "HTTP 503")
+    fetcher.record_dead_letter("http://x/c", None, "ConnectionError")
+
+
+def test_pop_dead_letters_takes_unique_urls_and_clears_the_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "failed.tsv")
+    _dead_letters(monkeypatch, path)
+    assert fetcher.pop_dead_letters(path) == [("http://x/a", JAN_2), ("http://x/b", JAN_3), ("http://x/c", None)]
+    assert not (tmp_path / "failed.tsv").exists()
+    assert fetcher.pop_dead_letters(path) == []
+
+
+def test_pop_dead_letters_of_some_dates_keeps_the_rest(tmp_path, monkeypatch):
+    path = str(tmp_path / "failed.tsv")
+    _dead_letters(monkeypatch, path)
+    assert fetcher.pop_dead_letters(path, dates={JAN_3}) == [("http://x/b", JAN_3)]
+    with open(path) as ifile:
+        assert [line.split("\t")[0] for line in ifile] == ["http://x/a", "http://x/a", "http://x/c"]
+
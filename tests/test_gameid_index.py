@@ -0,0 +1,103 @@
+import datetime
+import json
+
+import pytest
+
+import scraper
+from checkpoint import Checkpoint
+from gameid_index import GameIdIndex, compact_output
+from sinks import CsvSink, ListSink
+
+PAST = datetime.date(2018, 1, 2)
+
+
+class FailingFlushSink(ListSink):
+    """ListSink whose flush fails, as a full disk would"""
+
+    def flush(self):
+        raise IOError("disk full")
+
+
+def _write(path, text):
+    with open(path, 'w') as ofile:
+        ofile.write(text)
+
+
+def test_legacy_manifest_game_ids_are_moved_to_the_index(tmp_path):
+    manifest = str(tmp_path / "out_manifest.json")
+    _write(manifest, json.dumps({"completed_dates": [PAST.isoformat()], "game_ids": ["7", "8"]}))
+    checkpoint = Checkpoint(manifest)
+    checkpoint.save()
+    checkpoint.game_index.close()
+
+    with open(manifest) as ifile:
+        assert "game_ids" not in json.load(ifile)
+    resumed = Checkpoint(manifest)
+    assert resumed.has_game("7") and resumed.has_game("8")
+
+
+def test_index_is_rebuilt_from_the_output_file(tmp_path):
+    output = str(tmp_path / "out.csv")
+    _write(output, "GameID,Date\n11,1-2-2018\n12,1-2-2018\n")
+    checkpoint = Checkpoint.for_output(str(tmp_path / "out_manifest.json"), output)
+    checkpoint.game_index.close()
+
+    assert checkpoint.has_game("11") and checkpoint.has_game("12")
+    assert not checkpoint.has_game("GameID")
+    with open(str(tmp_path / "out.gameids")) as ifile:
+        assert ifile.read().split() == ["11", "12"]
+
+
+def test_existing_sidecar_is_trusted_over_the_output(tmp_path):
+    output = str(tmp_path / "out.csv")
+    _write(output, "GameID,Date\n11,1-2-2018\n")
+    _write(str(tmp_path / "out.gameids"), "99\n")
+    index = GameIdIndex.for_output(str(tmp_path / "out.gameids"), output)
+    assert "99" in index
+    assert "11" not in index
+
+
+def test_write_new_rows_skips_written_and_repeated_games(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "out_manifest.json"))
+    checkpoint.add_game("1")
+    sink = ListSink()
+
+    written = scraper._write_new_rows(sink, ["1,a\n", "2,b\n", "2,c\n", "3,d\n"], checkpoint)
+
+    assert written == 2
+    assert sink.rows == ["2,b\n", "3,d\n"]
+    assert checkpoint.has_game("2") and checkpoint.has_game("3")
+
+
+def test_game_ids_are_only_recorded_after_the_sink_flushed(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "out_manifest.json"))
+    with pytest.raises(IOError):
+        scraper._write_new_rows(FailingFlushSink(), ["5,a\n"], checkpoint)
+    assert not checkpoint.has_game("5")
+    assert scraper._write_new_row(ListSink(), "5,a\n", checkpoint)  # The retry writes the game again
+    assert checkpoint.has_game("5")
+
+
+def test_flushed_rows_are_on_disk_when_their_ids_are(tmp_path):
+    output = str(tmp_path / "out.csv")
+    checkpoint = Checkpoint.for_output(str(tmp_path / "out_manifest.json"), output)
+    sink = CsvSink(output)
+    sink.write_header("GameID,Date\n")
+    scraper._write_new_rows(sink, ["21,1-2-2018\n", "22,1-2-2018\n"], checkpoint)
+
+    with open(str(tmp_path / "out.gameids")) as ifile:  # Read before the sink is closed
+        indexed = ifile.read().split()
+    with open(output) as ifile:
+        written = [line.split(",")[0] for line in ifile.readlines()[1:]]
+    sink.close()
+    checkpoint.game_index.close()
+    assert indexed == written == ["21", "22"]
+
+
+def test_compact_output_keeps_the_first_row_of_each_game(tmp_path):
+    source = str(tmp_path / "in.csv")
+    _write(source, "GameID,Date\n1,a\n2,b\n1,c\n")
+    kept, dropped = compact_output(source, str(tmp_path / "out.csv"))
+    assert (kept, dropped) == (2, 1)
+    with open(str(tmp_path / "out.csv")) as ifile:
+        assert ifile.read() == "GameID,Date\n1,a\n2,b\n"
@@ -0,0 +1,58 @@
+import glob
+import gzip
+import os
+import random
+
+import pytest
+
+import line_features
+import line_scraper
+from conftest import FIXTURE_DIR
+from line_scraper import GameLines
+
+PAGES = sorted(glob.glob(os.path.join(FIXTURE_DIR, "sbr_*", "*.html.gz")))
+
+
+def _random_book_lines(rng):
+    books = []
+    for _ in range(rng.randint(5, 10)):
+        if rng.random() < 0.2:
+            books.append([0.1, 0.1])  # Book off the board
+        else:
+            books.append([rng.choice([-3.5, -3.0, -2.5, 1.0]), rng.choice([-115.0, -110.0, -105.0, 100.0])])
+    return books
+
+
+def test_line_strings_match_the_per_game_summary():
+    rng = random.Random(7)
+    games = [_random_book_lines(rng) for _ in range(200)]
+    games.append([[0.1, 0.1]] * 6)  # No readable book at all
+    assert line_features.line_strings(games) == [line_scraper._summarize_lines(lines) for lines in games]
+    assert line_features.line_strings([]) == []
+
+
+def test_summary_skips_unreadable_and_missing_books():
+    lines, payouts = line_features.book_arrays([[[-3.0, -110.0], [0.1, 0.1], [-4.0, -105.0]], []])
+    summary = line_features.summarize(lines, payouts)
+    assert lines.shape == (2, line_features.MIN_BOOKS)
+    assert summary["BookCount"].tolist() == [2, 0]
+    assert summary["MedianLine"][0] == -3.5
+    assert summary["MeanPayout"][0] == -107.5
+    assert summary["MeanLine"].mask.tolist() == [False, True]
+
+
+def test_consensus_rows_write_nan_for_games_without_lines():
+    games = [GameLines("A", "0", "", "B", "0", "", [[-3.0, -110.0]] * 5),
+             GameLines("C", "0", "", "D", "0", "", None)]
+    rows = line_features.consensus_rows("01-02-2018", games)
+    assert rows[0].startswith("01-02-2018,A,B,-3.0,-110.0,-3.0,-110.0,-3.0,-110.0,-3.0,-3.0,0.0,-110.0,5")
+    assert rows[1] == "01-02-2018,C,D,%s\n" % ",".join(["NaN"] * 10 + ["0"])
+    assert len(rows[0].split(",")) == len(line_features.CONSENSUS_HEADER.split(","))
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_batched_page_parse_matches_game_by_game(path):
+    with gzip.open(path, 'rb') as ifile:
+        content = ifile.read()
+    ncaab = "sbr_ncaab" in path
+    assert line_scraper.parse_date_page(content, ncaab, batched=True) == line_scraper.parse_date_page(content, ncaab)
@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+import requests
+
+import fetcher
+import line_poller
+import metrics
+from line_poller import LinePoller
+
+JAN_2 = datetime.date(2018, 1, 2)
+
+
+class Response(object):
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def _page(*games):
+    rows = []
+    for away, home, books in games:
+        cells = "".join('<div class="el-div eventLine-book"><div>%s</div><div>%s</div></div>' % (book, book)
+                        for book in books)
+        rows.append('<div class="event-holder holder-live"><div class="el-div eventLine-team">'
+                    '<div class="eventLine-value">%s</div><div class="eventLine-value">%s</div></div>%s</div>'
+                    % (away, home, cells))
+    return ('<html><body><div class="eventLines">%s</div></body></html>' % "".join(rows)).encode("utf-8")
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    sent_headers = []
+
+    def _serve(*responses):
+        responses = list(responses)
+
+        def get(url, date=None, headers=None, dead_letter=True):
+            sent_headers.append(dict(headers or {}))
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        monkeypatch.setattr(fetcher, "get", get)
+        return sent_headers
+    return _serve
+
+
+def _log(path):
+    with open(path) as ifile:
+        return [line.strip().split(",")[1:] for line in ifile.readlines()[1:]]
+
+
+def test_only_moved_lines_are_logged(tmp_path, serve):
+    path = str(tmp_path / "moves.csv")
+    first = _page(("A", "B", ["-3 -110", "-3 -110"]), ("C", "D", ["2 -105", "bad"]))
+    moved = _page(("A", "B", ["-3 -110", "-3.5 -110"]), ("C", "D", ["2 -105", "1.5 -110"]))
+    sent = serve(Response(200, first, {"ETag": '"v1"'}), Response(304), Response(200, first, {"ETag": '"v2"'}),
+                 Response(200, moved, {"ETag": '"v3"'}), requests.exceptions.ConnectionError())
+    poller = LinePoller(JAN_2, path)
+
+    assert len(poller.poll()) == 3  # The unreadable book of C at D is left out
+    assert poller.poll() == []
+    assert poller.poll() == []  # Same body under a new ETag is not parsed again
+    assert poller.poll() == [("A", "B", 1, -3.5, -110.0), ("C", "D", 1, 1.5, -110.0)]
+    assert poller.poll() == []
+    assert sent[0] == {} and sent[1] == {"If-None-Match": '"v1"'} and sent[3] == {"If-None-Match": '"v2"'}
+    counters = metrics.snapshot()["counters"]
+    assert (counters["poll_not_modified"], counters["poll_unchanged_content"]) == (1, 1)
+    assert counters["poll_connection_errors"] == 1
+    assert _log(path) == [["2018-01-02", "A", "B", "0", "-3.0", "-110.0"],
+                          ["2018-01-02", "A", "B", "1", "-3.0", "-110.0"],
+                          ["2018-01-02", "C", "D", "0", "2.0", "-105.0"],
+                          ["2018-01-02", "A", "B", "1", "-3.5", "-110.0"],
+                          ["2018-01-02", "C", "D", "1", "1.5", "-110.0"]]
+
+
+def test_a_restarted_poller_picks_up_from_the_log(tmp_path, serve):
+    path = str(tmp_path / "moves.csv")
+    page = _page(("A", "B", ["-3 -110", "-4 -110"]))
+    serve(Response(200, page), Response(200, _page(("A", "B", ["-3 -110", "-4.5 -110"]))))
+    LinePoller(JAN_2, path).poll()
+    assert LinePoller(JAN_2, path).poll() == [("A", "B", 1, -4.5, -110.0)]
+    assert line_poller.read_latest(path, datetime.date(2018, 1, 3)) == {}
+
+
+def test_poll_lines_stops_after_max_polls(tmp_path, serve, monkeypatch):
+    monkeypatch.setattr(line_poller.time, "sleep", lambda seconds: None)
+    serve(Response(200, _page(("A", "B", ["-3 -110"]))), Response(304), Response(304))
+    assert line_poller.poll_lines(JAN_2, str(tmp_path / "moves.csv"), interval=0, max_polls=3) == 1
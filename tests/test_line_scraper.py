@@ -0,0 +1,39 @@
+import glob
+import gzip
+import os
+
+import pytest
+
+import line_scraper
+from conftest import FIXTURE_DIR
+
+PAGES = sorted(glob.glob(os.path.join(FIXTURE_DIR, "sbr_*", "*.html.gz")))
+
+
+def _content(path):
+    with gzip.open(path, 'rb') as ifile:
+        return ifile.read()
+
+
+@pytest.fixture(params=["lxml", "soup"])
+def parser(request, monkeypatch):
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    else:
+        monkeypatch.setattr(line_scraper, "etree", None)
+    return request.param
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_targeted_parse_matches_the_full_tree_parse(parser, path):
+    content = _content(path)
+    ncaab = "sbr_ncaab" in path
+    games = line_scraper.parse_date_page(content, ncaab)
+    assert games
+    assert games == line_scraper.parse_date_page_soup(content, ncaab)
+
+
+@pytest.mark.parametrize("content", [b"", b"   ", b"<!-- nothing -->", b"<html><body></body></html>"])
+def test_pages_without_a_lines_table_parse_to_none(parser, content):
+    assert line_scraper.parse_date_page(content) is None
+    assert line_scraper.parse_date_page_book_lines(content) is None
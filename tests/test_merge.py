@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import line_scraper
+import merge
+from merge import TeamAliasIndex
+from sinks import ListSink, ParquetSink
+
+# Written before NBA rows stopped naming Rank, Neutral and Conference, the rows never carried those values
+LEGACY_NBA_HEADER = "GameID,Date,Spread,Home-Name,Home-id,Home-Rank,Home-FinalScore,Away-Name,Away-id,Away-Rank," \
+                    "Away-FinalScore,Neutral,Conference,Venue\n"
+ESPN_ROWS = ["1,1-2-2018,-3.5,Lakers,13,110,Celtics,2,100,Staples Center\n",
+             "2,1-2-2018,2.0,Knicks,18,95,Nets,17,99,Madison Square Garden\n",
+             "3,1-2-2018,-6.0,Heat,14,101,Magic,19,90,AmericanAirlines Arena\n"]
+
+
+def _sbr_row(away, away_score, home, home_score):
+    return "01-02-2018,%s,%d,25,25,25,25,%s,%d,25,25,25,25,-3.5,-110,-3.5,-110,-3.5,-110,0\n" % (
+        away, away_score, home, home_score)
+
+
+SBR_ROWS = [_sbr_row("Boston", 100, "L.A. Lakers", 110),
+            _sbr_row("New York", 95, "Brooklyn", 99)]  # Listed the other way round
+
+
+def _write(path, header, rows):
+    with open(path, 'w') as ofile:
+        ofile.write(header)
+        ofile.writelines(rows)
+    return path
+
+
+@pytest.fixture
+def season(tmp_path):
+    return (_write(str(tmp_path / "espn.csv"), LEGACY_NBA_HEADER, ESPN_ROWS),
+            _write(str(tmp_path / "sbr.csv"), line_scraper.NBA_HEADER, SBR_ROWS))
+
+
+def test_games_are_joined_through_learned_aliases(season):
+    index = TeamAliasIndex()
+    sink = ListSink()
+    assert merge.merge_season(season[0], season[1], sink, index) == 2
+    assert index.resolve("L.A. Lakers") == "13" and index.resolve("Brooklyn") == "17"
+    assert [row.rstrip("\n").split(",")[-1] for row in sink.rows] == ["0", "1", "NaN"]
+    assert sink.rows[0].startswith(ESPN_ROWS[0].rstrip("\n") + ",Boston,100,")
+
+
+def test_joined_header_lines_up_with_legacy_nba_rows(season):
+    sink = ListSink()
+    merge.merge_season(season[0], season[1], sink, TeamAliasIndex())
+    columns = sink.header.strip().split(",")
+    assert "Home-Rank" not in columns and "Neutral" not in columns
+    for row in sink.rows:
+        values = dict(zip(columns, row.rstrip("\n").split(",")))
+        assert len(values) == len(columns) == len(row.split(","))
+        assert values["Venue"] in row and values["Away-FinalScore"] in ("100", "99", "90")
+
+
+def test_legacy_nba_rows_join_into_parquet(season, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    with ParquetSink(str(tmp_path / "parquet"), "joined", "NBA") as sink:
+        merge.merge_season(season[0], season[1], sink, TeamAliasIndex())
+    table = pq.ParquetDataset(str(tmp_path / "parquet" / "dataset=joined")).read().to_pydict()
+    assert table["Away-FinalScore"] == [100, 99, 90]
+    assert table["SBR-Swapped"] == [0, 1, None]
+
+
+def test_aliases_are_saved_and_outvote_a_bad_match(tmp_path):
+    path = str(tmp_path / "aliases.tsv")
+    index = TeamAliasIndex(path)
+    index.vote("Boston", "2", "Celtics")
+    index.vote("Boston", "2", "Celtics")
+    index.vote("Boston", "9", "Pacers")
+    index.vote("Tied", "1", "A")
+    index.vote("Tied", "3", "B")
+    index.save()
+    reloaded = TeamAliasIndex(path)
+    assert reloaded.resolve("Boston") == "2"
+    assert reloaded.resolve("Tied") is None
+    assert reloaded.resolve("Unknown") is None
+
+
+
+def test_merge_seasons_creates_nothing_for_missing_seasons(tmp_path):
+    merge.merge_seasons("NBA", [2016, 2017], str(tmp_path))
+    assert os.listdir(str(tmp_path)) == []
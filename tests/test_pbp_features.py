@@ -0,0 +1,65 @@
+import datetime
+import json
+
+import pytest
+
+import pbp_features
+from raw_archive import RawArchive
+from sinks import ListSink
+
+
+def _play(period, clock, home, away):
+    return {"period": {"number": period}, "clock": {"displayValue": clock}, "homeScore": home, "awayScore": away}
+
+
+# An NCAAB game: home leads, away goes on a 6-0 run, then home wins a close finish
+PLAYS = [_play(1, "19:00", 2, 0), _play(1, "18:00", 4, 0), _play(1, "17:00", 4, 3), _play(1, "10:00", 4, 6),
+         _play(1, "0:00", 4, 6), _play(2, "19:00", 6, 6), _play(2, "4:00", 9, 6), _play(2, "0:00", 9, 8)]
+CONTENT = json.dumps({"header": {"id": "401"}, "plays": PLAYS}).encode("utf-8")
+
+
+def test_clock_seconds():
+    assert pbp_features.clock_seconds({"displayValue": "11:45"}) == 705
+    assert pbp_features.clock_seconds({"displayValue": "45.2"}) == pytest.approx(45.2)
+    assert pbp_features.clock_seconds({"value": 30.0, "displayValue": "0:30"}) == 30
+    assert pbp_features.clock_seconds({}) == 0
+
+
+def test_game_features():
+    features = pbp_features.game_features(pbp_features.play_arrays(PLAYS), nba=False)
+    assert features["home_periods"] == [4, 5, 0]
+    assert features["away_periods"] == [6, 2, 0]
+    assert (features["home_largest_lead"], features["away_largest_lead"]) == (4, 2)
+    assert (features["home_longest_run"], features["away_longest_run"]) == (5, 6)
+    assert (features["home_clutch_points"], features["away_clutch_points"]) == (3, 2)
+    assert (features["lead_changes"], features["times_tied"]) == (2, 1)
+    assert features["tied_seconds"] == 960  # 0-0 for the first minute, 6-6 from 19:00 to 4:00 of the 2nd half
+    assert features["tied_pct"] == pytest.approx(0.4)
+    assert features["clutch_seconds"] == 240
+    assert features["plays"] == 8
+
+
+def test_a_game_without_plays_has_no_features():
+    assert pbp_features.game_features(pbp_features.play_arrays([]), nba=False) is None
+
+
+def test_streamed_plays_match_the_full_decode():
+    pytest.importorskip("ijson")
+    streamed = pbp_features.play_arrays_from_content(CONTENT, streaming=True)
+    decoded = pbp_features.play_arrays_from_content(CONTENT)
+    for name in pbp_features.PlayArrays._fields:
+        assert getattr(streamed, name).tolist() == getattr(decoded, name).tolist()
+
+
+def test_season_features_from_the_archive(tmp_path):
+    archive = RawArchive(str(tmp_path))
+    archive.add("ESPN", "NCAAB", "401", datetime.date(2018, 1, 23), "http://x/401", CONTENT)
+    archive.add("ESPN", "NCAAB", "402", datetime.date(2018, 1, 23), "http://x/402", b'{"plays": []}')
+    archive.add("ESPN", "NCAAB", "403", datetime.date(2018, 1, 24), "http://x/403", b'{"plays": [{"period"')
+    archive.close()
+
+    sink = ListSink()
+    assert pbp_features.season_features(str(tmp_path), "NCAAB", "1718", sink, processes=1) == 1
+    assert sink.header == pbp_features.feature_header(nba=False)
+    assert len(sink.rows[0].split(",")) == len(sink.header.split(","))
+    assert sink.rows[0].startswith("401,1-23-2018,4,5,0,4,5,3,6,2,0,2,6,2,2,1,960.0,0.4000,240.0,8")
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import metrics
+import pipeline
+
+GROUPS = [("a", [("a", 0), ("a", 1)]),
+          ("b", [("b", 0), ("b", 1), ("b", 2), ("b", 3)]),
+          ("c", [("c", 0)])]
+
+
+def _parse(item, payload):
+    return "%s%d" % payload
+
+
+def _run(fetch, groups=GROUPS, **kwargs):
+    written = []
+    pipeline.run_pipeline(groups, fetch, _parse, lambda key, results, complete: written.append(
+        (key, list(results), complete)), fetch_workers=4, processes=0, **kwargs)
+    return written
+
+
+def test_groups_are_written_in_order_with_items_in_order():
+    def fetch(item):
+        time.sleep(0.02 * (3 - item[1]))  # Later items of a group finish first
+        return item if item != ("b", 1) else None
+
+    assert _run(fetch) == [("a", ["a0", "a1"], True),
+                           ("b", ["b0", None, "b2", "b3"], True),
+                           ("c", ["c0"], True)]
+
+
+def test_a_small_window_still_finishes():
+    assert [key for key, _, _ in _run(lambda item: item, window=1)] == ["a", "b", "c"]
+
+
+def test_results_keep_their_positions_when_the_run_fails():
+    def fetch(item):
+        if item == ("b", 2):
+            time.sleep(0.3)  # Every other item is parsed by the time this one fails
+            raise ValueError("fetch failed")
+        return item
+
+    written = []
+    with pytest.raises(ValueError):
+        pipeline.run_pipeline(GROUPS, fetch, _parse, lambda key, results, complete: written.append(
+            (key, list(results), complete)), fetch_workers=8, processes=0)
+    assert written == [("a", ["a0", "a1"], True),
+                       ("b", ["b0", "b1", None, "b3"], False),
+                       ("c", ["c0"], False)]
+
+
+def _count_parse(item, payload):
+    metrics.count("parsed")
+    return _parse(item, payload)
+
+
+def test_worker_processes_only_report_their_own_counters():
+    metrics.count("before_the_pool", 7)
+    written = []
+    pipeline.run_pipeline(GROUPS, lambda item: item, _count_parse, lambda key, results, complete: written.append(key),
+                          fetch_workers=2, processes=2)
+    assert written == ["a", "b", "c"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["before_the_pool"] == 7
+    assert counters["parsed"] == 7
@@ -0,0 +1,127 @@
+import datetime
+import os
+
+import pytest
+
+import line_scraper
+import metrics
+from query_store import QueryStore, detect_file
+
+GAME_HEADER = "GameID,Date,Spread,OverUnder,Home-Name,Home-id,Home-Rank,Home-FinalScore," \
+              "Away-Name,Away-id,Away-Rank,Away-FinalScore,Neutral,Conference,Venue\n"
+
+
+def _game(game_id, date, home_id="10", away_id="20", home_rank="-1"):
+    return "%s,%s,-3.5,140.5,Home%s,%s,%s,70,Away%s,%s,-1,65,False,True,Arena\n" % (
+        game_id, date, home_id, home_id, home_rank, away_id, away_id)
+
+
+def _line(date, away, home, b2b=0):
+    return "%s,%s,-1,60,30,30,%s,5,70,35,35,-3.5,-110,-4.0,-110,0.1,0.1,%d\n" % (date, away, home, b2b)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = QueryStore(str(tmp_path / "store.sqlite"))
+    yield store
+    store.close()
+
+
+def _write(path, lines, mode='w'):
+    with open(path, mode) as ofile:
+        ofile.writelines(lines)
+
+
+def _game_ids(store):
+    return [row["game_id"] for row in store.query("date", date="2018-01-02")]
+
+
+def test_detect_file():
+    assert detect_file(GAME_HEADER) == ("games", "NCAAB")
+    assert detect_file(line_scraper.NCAAB_HEADER) == ("lines", "NCAAB")
+    assert detect_file(line_scraper.NBA_HEADER) == ("lines", "NBA")
+    assert detect_file("GameID,Date,Spread,SBR-Date\n") == (None, None)
+
+
+def test_only_appended_rows_are_read_again(tmp_path, store):
+    path = str(tmp_path / "games.csv")
+    _write(path, [GAME_HEADER, _game(1, "1-2-2018"), _game(2, "1-2-2018")])
+    assert store.ingest(path) == 2
+    assert store.ingest(path) == 0
+
+    _write(path, [_game(3, "1-2-2018")], mode='a')
+    assert store.ingest(path) == 1
+    assert _game_ids(store) == ["1", "2", "3"]
+
+
+def test_a_partial_last_row_waits_for_the_next_ingest(tmp_path, store):
+    path = str(tmp_path / "games.csv")
+    row = _game(2, "1-2-2018")
+    _write(path, [GAME_HEADER, _game(1, "1-2-2018"), row[:10]])
+    assert store.ingest(path) == 1
+
+    _write(path, [row[10:]], mode='a')
+    assert store.ingest(path) == 1
+    assert _game_ids(store) == ["1", "2"]
+
+
+def test_rewritten_file_replaces_its_rows(tmp_path, store):
+    path = str(tmp_path / "games.csv")
+    _write(path, [GAME_HEADER, _game(1, "1-2-2018"), _game(2, "1-2-2018"), _game(3, "1-2-2018")])
+    other = str(tmp_path / "other.csv")
+    _write(other, [GAME_HEADER, _game(9, "1-2-2018")])
+    store.ingest(path)
+    store.ingest(other)
+
+    _write(path + ".tmp", [GAME_HEADER, _game(1, "1-2-2018"), _game(3, "1-2-2018", home_rank="5")])
+    os.replace(path + ".tmp", path)  # A new inode, as compact or --fix-b2b leave it
+    assert store.ingest(path) == 2
+
+    assert _game_ids(store) == ["1", "3", "9"]
+    assert store.query("ranked-games")[0]["game_id"] == "3"
+
+
+def test_a_game_in_two_files_keeps_the_first_files_row(tmp_path, store):
+    first, second = str(tmp_path / "first.csv"), str(tmp_path / "second.csv")
+    _write(first, [GAME_HEADER, _game(1, "1-2-2018"), _game(2, "1-2-2018")])
+    _write(second, [GAME_HEADER, _game(2, "1-2-2018", home_rank="5")])
+    store.ingest(first)
+    assert store.ingest(second) == 0
+    assert metrics.snapshot()["counters"]["store_conflicting_rows"] == 1
+
+    _write(second + ".tmp", [GAME_HEADER, _game(2, "1-2-2018", home_rank="5"), _game(3, "1-2-2018")])
+    os.replace(second + ".tmp", second)
+    assert store.ingest(second) == 1  # Rewriting the second file does not take game 2 from the first
+    _write(first, [_game(4, "1-2-2018")], mode='a')
+    store.ingest(first)
+    assert _game_ids(store) == ["1", "2", "3", "4"]
+    assert store.query("ranked-games") == []
+
+
+def test_lines_and_queries(tmp_path, store):
+    path = str(tmp_path / "lines.csv")
+    _write(path, [line_scraper.NCAAB_HEADER, _line("1-2-2018", "Duke", "UNC"), _line("1-3-2018", "UNC", "Duke", 1)])
+    assert store.ingest(path) == 2
+
+    lines = store.team_lines("Duke", league="NCAAB", season="1718")
+    assert [(row["date"], row["away_b2b"]) for row in lines] == [("2018-01-02", 0), ("2018-01-03", 1)]
+    assert lines[0]["bov_line"] == -4.0
+    assert lines[0]["pes_line"] is None  # 0.1 is the scrapers' missing line
+    assert store.lines_on(datetime.date(2018, 1, 3))[0]["away_name"] == "UNC"
+    assert store.team_lines("Duke", season="1617") == []
+
+
+def test_game_row_keeps_every_column(tmp_path, store):
+    path = str(tmp_path / "games.csv")
+    _write(path, [GAME_HEADER, _game(1, "1-2-2018")])
+    store.ingest(path)
+    row = store.game_row(1, "NCAAB")
+    assert row["Venue"] == "Arena"
+    assert row["Home-FinalScore"] == "70"
+    assert store.game_row(2, "NCAAB") is None
+
+
+def test_other_files_are_skipped(tmp_path, store):
+    path = str(tmp_path / "schedule.csv")
+    _write(path, ["GameID,Date,Away-id,Home-id\n", "1,1-2-2018,1,2\n"])
+    assert store.ingest(path) == 0
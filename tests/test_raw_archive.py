@@ -0,0 +1,90 @@
+import datetime
+import glob
+import gzip
+import os
+
+import line_scraper
+import raw_archive
+import scraper
+from conftest import FIXTURE_DIR
+from raw_archive import RawArchive, read_record
+from sinks import ListSink
+
+JAN_23, JAN_24 = datetime.date(2018, 1, 23), datetime.date(2018, 1, 24)
+
+
+def _content(path):
+    with gzip.open(path, 'rb') as ifile:
+        return ifile.read()
+
+
+def test_records_read_back_in_date_then_key_order(tmp_path):
+    archive = RawArchive(str(tmp_path))
+    archive.add("ESPN", "NCAAB", "12", JAN_24, "http://x/12", b"twelve")
+    archive.add("ESPN", "NCAAB", "9", JAN_24, "http://x/9", b"nine")
+    archive.add("ESPN", "NCAAB", "30", JAN_23, "http://x/30", b"thirty")
+    archive.close()
+
+    entries = RawArchive(str(tmp_path)).entries("ESPN", "NCAAB", "1718")
+    assert [key for key, _ in entries] == ["30", "9", "12"]
+    header, content = read_record(*[entries[2][1][i] for i in (0, 2, 3)])
+    assert content == b"twelve"
+    assert (header["key"], header["date"], header["url"]) == ("12", "2018-01-24", "http://x/12")
+
+
+def test_past_records_are_archived_once_without_recompressing(tmp_path, monkeypatch):
+    compressed = []
+    compress = raw_archive._compress
+    monkeypatch.setattr(raw_archive, "_compress", lambda data: compressed.append(data) or compress(data))
+    archive = RawArchive(str(tmp_path))
+    assert archive.add("SBR", "NBA", "2018-01-23", JAN_23, "http://x", b"page")
+    assert not archive.add("SBR", "NBA", "2018-01-23", JAN_23, "http://x", b"page again")
+    assert len(compressed) == 1
+    archive.close()
+    assert not RawArchive(str(tmp_path)).add("SBR", "NBA", "2018-01-23", JAN_23, "http://x", b"page")  # After a restart
+
+    today = datetime.date.today()
+    archive = RawArchive(str(tmp_path))
+    assert archive.add("SBR", "NBA", today.isoformat(), today, "http://x", b"early")
+    assert archive.add("SBR", "NBA", today.isoformat(), today, "http://x", b"final")  # Today's slate can still change
+    archive.close()
+    entries = dict(RawArchive(str(tmp_path)).entries("SBR", "NBA", raw_archive.season_for_date(today)))
+    data_path, _, offset, length = entries[today.isoformat()]
+    assert read_record(data_path, offset, length)[1] == b"final"
+
+
+def test_espn_reextract_matches_the_scraper(tmp_path):
+    archive = RawArchive(str(tmp_path))
+    expected = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "espn_ncaab", "summary_*.json.gz"))):
+        game_id = os.path.basename(path).split("_")[1].split(".")[0]
+        archive.add("ESPN", "NCAAB", game_id, JAN_23, "http://x/%s" % game_id, _content(path))
+        expected.append(scraper.convert_game_content(_content(path), "1-23-2018,"))
+    archive.close()
+
+    sink = ListSink()
+    assert raw_archive.reextract(str(tmp_path), "ESPN", "NCAAB", "1718", sink, processes=1) == len(expected)
+    assert sorted(sink.rows) == sorted(row for row in expected if row != "INVALID")
+    assert sink.header.startswith("GameID,")
+
+
+def test_sbr_reextract_fills_in_back_to_back_flags(tmp_path):
+    archive = RawArchive(str(tmp_path))
+    for date in (JAN_23, JAN_24):
+        name = "ncaa-basketball_%s.html.gz" % date.strftime("%Y%m%d")
+        content = _content(os.path.join(FIXTURE_DIR, "sbr_ncaab", name))
+        archive.add("SBR", "NCAAB", date.isoformat(), date, "http://x", content)
+    archive.close()
+
+    sink = ListSink()
+    count = raw_archive.reextract(str(tmp_path), "SBR", "NCAAB", "1718", sink, processes=1)
+    assert count == len(sink.rows) > 0
+    assert sink.header == line_scraper.NCAAB_HEADER
+    first_day = [row for row in sink.rows if row.startswith("01-23-2018")]
+    assert first_day and all(row.strip().endswith(",0") for row in first_day)
+    columns = line_scraper.NCAAB_HEADER.strip().split(",")
+    teams = set(row.split(",")[columns.index("Away-Name")] for row in first_day) | \
+        set(row.split(",")[columns.index("Home-Name")] for row in first_day)
+    for row in sink.rows[len(first_day):]:
+        fields = row.strip().split(",")
+        assert fields[-1] == str(int(fields[columns.index("Away-Name")] in teams))
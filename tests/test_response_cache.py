@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+
+import fetcher
+import response_cache
+from response_cache import ReplayMiss, ResponseCache
+
+PAST = datetime.date(2018, 1, 2)
+
+
+class Clock(object):
+    """Stands in for the time module, every call is one second later"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+class Response(object):
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    requested = []
+
+    def get(url, date=None, headers=None, dead_letter=True):
+        requested.append(url)
+        return Response(b"body of " + url.encode("utf-8"), 404 if "missing" in url else 200)
+    monkeypatch.setattr(fetcher, "get", get)
+    return requested
+
+
+def test_past_dates_are_served_from_the_cache(tmp_path, downloads):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get_content("http://x/a", PAST) == b"body of http://x/a"
+    assert cache.get_content("http://x/a", PAST) == b"body of http://x/a"
+    assert downloads == ["http://x/a"]
+    assert ResponseCache(str(tmp_path)).lookup("http://x/a") == b"body of http://x/a"  # Survives a restart
+
+
+def test_todays_responses_expire(tmp_path, clock, downloads):
+    cache = ResponseCache(str(tmp_path), today_ttl=10)
+    cache.get_content("http://x/today", datetime.date.today())
+    assert cache.lookup("http://x/today") is not None
+    clock.now += 60
+    assert cache.lookup("http://x/today") is None
+    cache.get_content("http://x/today", datetime.date.today())
+    assert downloads == ["http://x/today", "http://x/today"]
+
+
+def test_only_successful_responses_are_stored(tmp_path, downloads):
+    cache = ResponseCache(str(tmp_path))
+    cache.get_content("http://x/missing", PAST)
+    assert cache.lookup("http://x/missing") is None
+
+
+def test_replay_serves_expired_responses_and_never_downloads(tmp_path, clock, downloads):
+    ResponseCache(str(tmp_path), today_ttl=10).store("http://x/today", b"old", datetime.date.today())
+    clock.now += 60
+    replay = ResponseCache(str(tmp_path), replay=True, today_ttl=10)
+    assert replay.get_content("http://x/today") == b"old"
+    with pytest.raises(ReplayMiss):
+        replay.get_content("http://x/never")
+    assert downloads == []
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    cache.store("http://x/a", b"aaaa", PAST)
+    cache.store("http://x/b", b"bbbb", PAST)
+    cache.lookup("http://x/a")  # b is now the least recently used
+    cache.store("http://x/c", b"cccc", PAST)
+    assert cache.lookup("http://x/b") is None
+    assert cache.lookup("http://x/a") == b"aaaa"
+    assert cache.stats() == {"responses": 2, "bytes": 8}
+
+
+def test_identical_bodies_share_a_blob(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=100)
+    cache.store("http://x/a", b"same", PAST)
+    cache.store("http://x/b", b"same", PAST)
+    assert len(list((tmp_path / "blobs").rglob("*.z"))) == 1
+    cache.max_bytes = 4
+    cache.prune()
+    assert cache.stats()["responses"] == 1
+    assert cache.lookup("http://x/b") == b"same"  # The blob stays while a url still points at it
@@ -0,0 +1,72 @@
+import datetime
+
+import line_scraper
+from schedule_index import NO_REST, ScheduleIndex, feature_header, fix_b2b_column
+
+
+def _line(date, away, home, b2b=0):
+    return "%s,%s,-1,60,30,30,%s,5,70,35,35,-3.5,-110,-4.0,-110,0.1,0.1,%d\n" % (date, away, home, b2b)
+
+
+def _write_sbr(path, rows):
+    with open(path, 'w') as ofile:
+        ofile.write(line_scraper.NCAAB_HEADER)
+        ofile.writelines(rows)
+
+
+# Written out of date order, as a resumed or retried scrape leaves it
+ROWS = [_line("1-3-2018", "A", "C"),
+        _line("1-1-2018", "A", "B"),
+        _line("1-2-2018", "C", "B"),
+        _line("1-6-2018", "B", "A"),
+        _line("1-1-2018", "A", "B")]  # The same game written twice
+
+
+def test_features_follow_each_team_in_date_order(tmp_path):
+    path = str(tmp_path / "sbr.csv")
+    _write_sbr(path, ROWS)
+    index = ScheduleIndex.from_sbr_csv(path)
+    assert len(index) == 4  # The duplicate 1-1 game is dropped
+
+    rows = dict((row.split(",")[0], row.strip().split(",")[3:]) for row in index.feature_rows(window=3))
+    columns = feature_header("", 3).strip().split(",")[1:]
+    features = dict((date, dict(zip(columns, map(int, values)))) for date, values in rows.items())
+    assert features["1-1-2018"]["Away-RestDays"] == NO_REST
+    assert features["1-3-2018"]["Away-RestDays"] == 1  # A played 1-1 and 1-3
+    assert features["1-3-2018"]["Home-B2B"] == 1  # C played 1-2 and 1-3
+    assert features["1-3-2018"]["Away-GamesLast3"] == 1
+    assert features["1-3-2018"]["Away-Travel"] == 1  # A's 1-1 game was at B
+    assert features["1-6-2018"]["Home-RestDays"] == 2
+    assert features["1-6-2018"]["Home-GamesLast3"] == 1  # Only the 1-3 game is inside 1-3..1-5
+
+
+def test_team_lookups(tmp_path):
+    path = str(tmp_path / "sbr.csv")
+    _write_sbr(path, ROWS)
+    index = ScheduleIndex.from_sbr_csv(path)
+    assert index.teams_on(datetime.date(2018, 1, 2)) == {"B", "C"}
+    assert index.played_on("A", datetime.date(2018, 1, 6))
+    assert not index.played_on("A", datetime.date(2018, 1, 2))
+    assert not index.played_on("Z", datetime.date(2018, 1, 2))
+    assert index.team_dates("Z").tolist() == []
+
+
+def test_fix_b2b_column_rewrites_only_wrong_flags(tmp_path):
+    path = str(tmp_path / "sbr.csv")
+    _write_sbr(path, [_line("1-2-2018", "A", "B"), _line("1-3-2018", "A", "C"), _line("1-5-2018", "C", "A", 1)])
+    assert fix_b2b_column(path) == 2
+    with open(path) as ifile:
+        flags = [row.strip().split(",")[-1] for row in ifile.readlines()[1:]]
+    assert flags == ["0", "1", "0"]
+    assert fix_b2b_column(path) == 0
+
+
+def test_espn_rows_use_their_venue(tmp_path):
+    path = str(tmp_path / "espn.csv")
+    with open(path, 'w') as ofile:
+        ofile.write("GameID,Date,Home-id,Away-id,Venue\n")
+        ofile.write("1,1-1-2018,10,20,Neutral Court\n")
+        ofile.write("2,1-2-2018,20,10,\n")
+    values = ScheduleIndex.from_espn_csv(path).features()
+    assert values["Away-Travel"].tolist() == [0, 1]  # Team 10 played at Neutral Court, then at team 20's home
+    assert values["Home-B2B"].tolist() == [0, 1]
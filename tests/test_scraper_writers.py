@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+import scraper
+from checkpoint import Checkpoint
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_concurrent_fetch import ESPN_ROOT
+from espn_fixtures import write_synthetic_fixtures
+from stub_server import start_stub_server
+
+WRITERS = [scraper.write_game_data_for_date_range,
+           scraper.write_game_data_for_date_range_concurrent,
+           scraper.write_game_data_for_date_range_pipelined]
+
+
+@pytest.fixture(scope="module")
+def stub_url(tmp_path_factory):
+    fixture_dir = str(tmp_path_factory.mktemp("espn"))
+    write_synthetic_fixtures(fixture_dir, ["201801%02d" % day for day in range(1, 4)], 4)
+    server, url = start_stub_server(fixture_dir)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def stub(stub_url, monkeypatch):
+    for name in dir(scraper):
+        if name.endswith("_URL") or name.endswith("_URL_TEMPLATE"):
+            monkeypatch.setattr(scraper, name, getattr(scraper, name).replace(ESPN_ROOT, stub_url))
+
+
+def _run(writer, output, **kwargs):
+    checkpoint = Checkpoint.for_output(output.replace(".csv", "_manifest.json"), output)
+    try:
+        return writer(1, 3, 1, 2018, output, checkpoint=checkpoint, **kwargs)
+    finally:
+        checkpoint.game_index.close()
+
+
+@pytest.mark.parametrize("writer", WRITERS, ids=lambda writer: writer.__name__)
+def test_writers_agree_and_a_rerun_writes_nothing(stub, tmp_path, writer):
+    kwargs = {"processes": 0} if writer is scraper.write_game_data_for_date_range_pipelined else {}
+    output = str(tmp_path / "out.csv")
+    assert _run(writer, output, **kwargs) == "1-3-2018"
+    assert _run(writer, output, **kwargs) == "None"
+    with open(output) as ifile:
+        lines = ifile.readlines()
+    assert lines[0].startswith("GameID,")
+    assert len(lines) == 13
+    assert len(set(line.split(",")[0] for line in lines[1:])) == 12
+
+    serial = str(tmp_path / "serial.csv")
+    _run(scraper.write_game_data_for_date_range, serial)
+    with open(serial) as ifile:
+        assert sorted(ifile.readlines()) == sorted(lines)
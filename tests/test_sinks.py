@@ -0,0 +1,133 @@
+import datetime
+import glob
+import os
+
+import pytest
+
+from sinks import CsvSink, ListSink, ParquetSink, column_positions, parse_row_date, row_columns, season_for_date
+
+NBA_HEADER_COLUMNS = ["GameID", "Date", "Home-Rank", "Home-FinalScore", "Neutral", "Conference", "Venue"]
+
+
+def test_season_for_date_splits_in_july():
+    assert season_for_date(datetime.date(2017, 11, 20)) == "1718"
+    assert season_for_date(datetime.date(2018, 3, 1)) == "1718"
+    assert season_for_date(parse_row_date("1-2-2018")) == "1718"
+
+
+def test_legacy_nba_rows_drop_the_columns_they_never_carried():
+    assert row_columns(NBA_HEADER_COLUMNS, 7) == NBA_HEADER_COLUMNS
+    assert row_columns(NBA_HEADER_COLUMNS, 4) == ["GameID", "Date", "Home-FinalScore", "Venue"]
+    assert column_positions(NBA_HEADER_COLUMNS, 4, ("Venue", "Neutral")) == {"Venue": 3}
+
+
+def test_csv_rows_are_on_disk_after_flush(tmp_path):
+    path = str(tmp_path / "out.csv")
+    sink = CsvSink(path)
+    assert sink.existing_header() is None
+    sink.write_header("GameID,Date\n")
+    sink.write_rows(["1,1-2-2018\n", "2,1-2-2018\n"])
+    sink.flush()
+    with open(path) as ifile:
+        assert ifile.read() == "GameID,Date\n1,1-2-2018\n2,1-2-2018\n"
+    sink.close()
+    assert CsvSink(path).existing_header() == "GameID,Date\n"
+
+
+def test_csv_versioned_output_is_a_sibling_file(tmp_path):
+    sink = CsvSink(str(tmp_path / "out.csv"))
+    assert sink.versioned("1a2b3c4d").path == str(tmp_path / "out_schema1a2b3c4d.csv")
+
+
+def test_list_sink_keeps_versions_apart():
+    sink = ListSink()
+    sink.write_row("a\n")
+    sink.versioned("v1").write_row("b\n")
+    assert sink.rows == ["a\n"]
+    assert sink.versioned("v1").rows == ["b\n"]
+
+
+class TestParquetSink(object):
+    header = "GameID,Date,Home-FinalScore,Spread\n"
+
+    @pytest.fixture(autouse=True)
+    def _pyarrow(self):
+        self.pq = pytest.importorskip("pyarrow.parquet")
+
+    def _parts(self, root):
+        return sorted(glob.glob(os.path.join(root, "**", "*.parquet"), recursive=True))
+
+    def test_flush_leaves_a_readable_part_file(self, tmp_path):
+        root = str(tmp_path)
+        sink = ParquetSink(root, "espn", "NCAAB", header=self.header)
+        sink.write_rows(["1,1-2-2018,70,-3.5\n", "2,1-3-2018,NaN,NaN\n"])
+        sink.flush()
+
+        parts = self._parts(root)  # Read while the sink is still open, as after a crash
+        assert len(parts) == 1
+        table = self.pq.read_table(parts[0]).to_pydict()
+        assert table["GameID"] == [1, 2]
+        assert table["Home-FinalScore"] == [70, None]
+        sink.close()
+
+    def test_close_compacts_the_flushed_parts(self, tmp_path):
+        root = str(tmp_path)
+        sink = ParquetSink(root, "espn", "NCAAB", header=self.header, row_group_size=2)
+        for game_id in range(1, 6):
+            sink.write_row("%d,1-%d-2018,70,-3.5\n" % (game_id, game_id))
+            sink.flush()
+            sink.flush()  # Nothing pending, no empty part file
+        assert len(self._parts(root)) == 5
+        sink.close()
+        sink.close()
+
+        parts = self._parts(root)
+        assert len(parts) == 1
+        assert self.pq.read_table(parts[0]).column("GameID").to_pylist() == [1, 2, 3, 4, 5]
+        assert self.pq.ParquetFile(parts[0]).num_row_groups == 3
+
+    def test_parts_left_by_an_interrupted_compaction_are_removed(self, tmp_path):
+        root = str(tmp_path)
+        sink = ParquetSink(root, "espn", "NCAAB", header=self.header)
+        for row in ("1,1-2-2018,70,-3.5\n", "2,1-3-2018,71,1.5\n"):
+            sink.write_row(row)
+            sink.flush()
+        small = self._parts(root)
+        saved = [open(path, 'rb').read() for path in small]
+        sink.close()
+        for path, content in zip(small, saved):  # As if the crash came before the small parts were removed
+            with open(path, 'wb') as ofile:
+                ofile.write(content)
+
+        with ParquetSink(root, "espn", "NCAAB", header=self.header) as sink:
+            sink.write_row("3,1-4-2018,72,2.5\n")
+        ids = sorted(sum((self.pq.read_table(p).column("GameID").to_pylist() for p in self._parts(root)), []))
+        assert ids == [1, 2, 3]
+
+    def test_a_new_header_finishes_the_parts_of_the_old_one(self, tmp_path):
+        root = str(tmp_path)
+        sink = ParquetSink(root, "espn", "NCAAB", header=self.header)
+        sink.write_row("1,1-2-2018,70,-3.5\n")
+        sink.write_header(self.header)  # The same header again changes nothing
+        sink.write_header("GameID,Date,Spread\n")
+        sink.write_row("2,1-3-2018,1.5\n")
+        sink.close()
+
+        tables = [self.pq.read_table(p) for p in self._parts(root)]
+        assert sorted(t.column_names for t in tables) == [["GameID", "Date", "Home-FinalScore", "Spread"],
+                                                          ["GameID", "Date", "Spread"]]
+
+    def test_rows_are_partitioned_by_season(self, tmp_path):
+        root = str(tmp_path)
+        with ParquetSink(root, "espn", "NCAAB", header=self.header) as sink:
+            sink.write_rows(["1,3-2-2017,70,1\n", "2,1-3-2018,71,1\n"])
+        seasons = [os.path.basename(os.path.dirname(p)) for p in self._parts(root)]
+        assert seasons == ["season=1617", "season=1718"]
+
+    @pytest.mark.parametrize("row", ["1,1-2-2018,70\n", "1,1-2-2018,70,-3.5,9\n"])
+    def test_rows_of_another_length_are_rejected(self, tmp_path, row):
+        sink = ParquetSink(str(tmp_path), "espn", "NCAAB", header=self.header)
+        with pytest.raises(ValueError):
+            sink.write_row(row)
+        sink.close()
+        assert self._parts(str(tmp_path)) == []
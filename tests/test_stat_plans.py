@@ -0,0 +1,79 @@
+import pickle
+
+import metrics
+from sinks import ListSink
+from stat_plans import GameRow, RowSchema, SchemaRouter, plan_for, schema_header, schema_version
+
+LABELS = ("FG Made-Attempted", "3PT Made-Attempted", "FT Made-Attempted", "Rebounds")
+OTHER_LABELS = LABELS + ("Steals",)
+
+
+def _stats(labels, values):
+    return [{"label": label, "displayValue": value} for label, value in zip(labels, values)]
+
+
+def test_plan_splits_made_attempted_columns():
+    plan = plan_for(_stats(LABELS, ["20-50", "5-15", "10-12", "30"]))
+    assert plan.columns == ["FG-Made", "FG-Attempted", "3PT-Made", "3PT-Attempted", "FT-Made", "FT-Attempted",
+                            "Rebounds"]
+    values = plan.values(_stats(LABELS, ["20-50", "5-15", "10-12", "30"]))
+    assert values == ["20", "50", "5", "15", "10", "12", "30"]
+    assert plan.score(values) == "55"  # 5 threes, 15 twos and 10 free throws
+
+
+def test_plans_are_compiled_once_per_signature():
+    assert plan_for(_stats(LABELS, ["1-1"] * 4)) is plan_for(_stats(LABELS, ["2-2"] * 4))
+    assert plan_for(_stats(OTHER_LABELS, ["1-1"] * 5)) is not plan_for(_stats(LABELS, ["1-1"] * 4))
+
+
+def test_score_is_zero_without_made_columns():
+    plan = plan_for(_stats(("Rebounds",), ["30"]))
+    assert plan.score(["30"]) == "0"
+
+
+def test_nba_header_has_no_rank_neutral_or_conference():
+    nba = schema_header(RowSchema(LABELS, LABELS, True)).strip().split(",")
+    legacy = schema_header(RowSchema(LABELS, LABELS, True), legacy=True).strip().split(",")
+    ncaab = schema_header(RowSchema(LABELS, LABELS, False)).strip().split(",")
+    assert "Home-Rank" not in nba and "Neutral" not in nba and "Home-1stQ" in nba
+    assert "Home-Rank" in legacy and "Neutral" in legacy
+    assert "Home-Rank" in ncaab and "OverUnder" in ncaab and "Home-1stQ" not in ncaab
+
+
+def test_schema_version_is_stable():
+    header = schema_header(RowSchema(LABELS, LABELS, False))
+    assert schema_version(header) == schema_version(str(header))
+    assert len(schema_version(header)) == 8
+    assert schema_version(header) != schema_version(schema_header(RowSchema(OTHER_LABELS, LABELS, False)))
+
+
+def test_game_row_pickles_with_its_schema():
+    row = GameRow("1,1-2-2018\n", RowSchema(LABELS, LABELS, False))
+    copy = pickle.loads(pickle.dumps(row))
+    assert copy == "1,1-2-2018\n"
+    assert copy.schema == row.schema
+
+
+def test_router_sends_other_layouts_to_a_versioned_output():
+    schema, other = RowSchema(LABELS, LABELS, False), RowSchema(OTHER_LABELS, LABELS, False)
+    sink = ListSink()
+    router = SchemaRouter(sink)
+    router.write_header(schema_header(schema))
+    router.write_rows([GameRow("1\n", schema), GameRow("2\n", other), GameRow("3\n", schema), "4\n"])
+    router.write_row(GameRow("5\n", other))
+
+    assert sink.rows == ["1\n", "3\n", "4\n"]
+    versioned = sink.versions[schema_version(schema_header(other))]
+    assert versioned.header == schema_header(other)
+    assert versioned.rows == ["2\n", "5\n"]
+
+
+def test_router_accepts_rows_under_the_legacy_nba_header():
+    schema = RowSchema(LABELS, LABELS, True)
+    sink = ListSink()
+    sink.write_header(schema_header(schema, legacy=True))
+    router = SchemaRouter(sink)
+    router.write_row(GameRow("1\n", schema))
+    assert sink.rows == ["1\n"]
+    assert sink.versions == {}
+    assert metrics.snapshot()["counters"].get("schema_versioned_rows") is None
@@ -0,0 +1,72 @@
+import glob
+import gzip
+import json
+import os
+
+import pytest
+
+import json_backend
+import scraper
+import summary_stream
+from conftest import FIXTURE_DIR
+
+SUMMARIES = sorted(glob.glob(os.path.join(FIXTURE_DIR, "espn_*", "summary_*.json.gz")))
+
+
+def _content(path):
+    with gzip.open(path, 'rb') as ifile:
+        return ifile.read()
+
+
+@pytest.fixture
+def streaming():
+    pytest.importorskip("ijson")
+    enabled = summary_stream.is_streaming()
+    summary_stream.set_streaming(True)
+    yield
+    summary_stream.set_streaming(enabled)
+
+
+def _decoded(content, plays):
+    enabled = summary_stream.is_streaming()
+    summary_stream.set_streaming(False)
+    try:
+        return summary_stream.load_summary(content, plays=plays)
+    finally:
+        summary_stream.set_streaming(enabled)
+
+
+def test_streaming_is_opt_in():
+    assert not summary_stream.is_streaming()
+
+
+def test_boundary_plays_keep_the_first_and_last_play_of_each_period():
+    scores = [(1, 0, 0), (1, 2, 0), (1, 2, 3), (2, 4, 3), (2, 6, 3), (3, 6, 5)]
+    plays = summary_stream.boundary_plays(scores)
+    assert [(p["period"]["number"], p["awayScore"], p["homeScore"]) for p in plays] == \
+        [(1, 0, 0), (1, 2, 3), (2, 4, 3), (2, 6, 3), (3, 6, 5)]
+
+
+@pytest.mark.parametrize("path", SUMMARIES, ids=os.path.basename)
+def test_streamed_summary_matches_the_full_decode(streaming, path):
+    content = _content(path)
+    streamed = summary_stream.load_summary(content, plays=True)
+    assert streamed == _decoded(content, plays=True)
+    full = json.loads(content)
+    for key in summary_stream.SUMMARY_KEYS:
+        assert streamed.get(key) == full.get(key)
+
+
+@pytest.mark.parametrize("path", SUMMARIES, ids=os.path.basename)
+def test_streamed_rows_match_the_full_decode(streaming, path):
+    content = _content(path)
+    nba = "espn_nba" in path
+    streamed = scraper.convert_game_content(content, "1-23-2018,", nba=nba)
+    assert streamed != "INVALID"
+    summary_stream.set_streaming(False)
+    assert streamed == scraper.convert_game_content(content, "1-23-2018,", nba=nba)
+
+
+def test_malformed_payload_raises_decode_error(streaming):
+    with pytest.raises(json_backend.DecodeError):
+        summary_stream.load_summary(b'{"header": {"id": ', plays=True)